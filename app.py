@@ -1,55 +1,126 @@
-from flask import Flask, request, jsonify, session, make_response, redirect, url_for
+from flask import Flask, Response, request, jsonify, session, make_response, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from datetime import datetime
 import os
+import json
+import time
+import queue
 import logging
 from dotenv import load_dotenv
 from collections import Counter
-import re
-from datetime import datetime, timedelta
-import numpy as np
-from google.auth.transport.requests import Request
+from functools import partial
+from datetime import datetime, timedelta, timezone
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+load_dotenv()
+
+# Set up logging; DEBUG is for development, it logs on every request
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# Local modules read their settings from the environment at import time
+from youtube_client import get_client, pool
+from comment_sync import comment_store, comment_sync, COMMENT_FIELDS, SEARCH_MAX_RESULTS, SearchError, parse_timestamp
+from comment_sync import COMMENTS_PAGE_SIZE, COMMENTS_MAX_RESULTS
+from video_catalog import video_store, video_catalog, VIDEO_FIELDS
+from cache_backend import create_cache
+from refresh import Revalidator
+from jobs import JobQueue
+from credential_manager import CredentialManager, credentials_info
+from channel_meta import ChannelMetadata, ChannelStore, uploads_playlist_id
+from quota import ledger, PRIORITY_LOW
+from live_stats import LiveStatsHub, live_stats_payload
+from hashtags import HashtagEngine
+from timeseries import StatsHistory, RESOLUTIONS, TIMESERIES_SAMPLE_SECONDS
+from pagination import PageBudget, iter_videos, iter_channel_comments, STREAM_MAX_PAGES
+from moderation import ModerationBatcher, MAX_ITEMS_PER_REQUEST
+from reply_queue import ReplyQueue
+from triage import TriageQueue, TRIAGE_FIELDS, TRIAGE_MAX_RESULTS
+from scoring import CommentScorer, SCORE_FIELDS, SPAM_MAX_RESULTS
+from metrics import metrics, start_request, end_request, current_timer, request_phase
+import serialization
+from serialization import Records, FieldError, parse_fields
+
+# Cache storage, shared by all workers when CACHE_BACKEND=sqlite
+cache = create_cache()
+# Job records, leases and shared credentials; kept apart so response traffic never evicts them
+state = create_cache(evict=False)
+jobs = JobQueue(state)
+credential_manager = CredentialManager(state)
+revalidator = Revalidator(jobs)
+channel_store = ChannelStore()
+channel_meta = ChannelMetadata(cache, channel_store)
+hashtag_engine = HashtagEngine(cache, ledger)
+stats_history = StatsHistory(channel_store, video_store)
+moderation = ModerationBatcher(state)
+reply_queue = ReplyQueue(ledger, credential_manager)
+triage = TriageQueue(comment_store, video_store)
+scorer = CommentScorer(comment_store)
+# Send replies left queued by a previous run
+reply_queue.start()
+# Keep every thread's reply state and priority current for /api/triage
+comment_store.add_listener(triage.update)
+# Score new and edited comments for spam and sentiment as they are synced
+comment_store.add_listener(scorer.update)
+reply_queue.add_listener(triage.on_reply_finished)
 
-# Cache storage
-cache = {
-    'videos': {},  # Store by user ID
-    'comments': {},  # Store by user ID
-    'last_fetch': {},  # Store by user ID
-}
+# Charge every upstream call to the daily quota ledger
+pool.add_listener(ledger.on_request)
+# Time every upstream call for /metrics and the Server-Timing header
+pool.add_listener(metrics.on_request)
+# Revalidate repeated list calls with If-None-Match instead of re-downloading them
+pool.use_etag_cache(cache)
+
+# Entries are served as-is while fresh, served and refreshed in the background
+# while stale, and only used as a quota-exhausted fallback until hard expiry
+CACHE_FRESH_SECONDS = int(os.getenv('CACHE_FRESH_SECONDS', 30 * 60))
+CACHE_STALE_SECONDS = int(os.getenv('CACHE_STALE_SECONDS', 6 * 60 * 60))
+CACHE_HARD_EXPIRY_SECONDS = int(os.getenv('CACHE_HARD_EXPIRY_SECONDS', 24 * 60 * 60))
+REVALIDATE_QUOTA_UNITS = 10  # Rough upper bound of one videos or comments refresh
+HASHTAGS_FRESH_SECONDS = int(os.getenv('HASHTAGS_FRESH_SECONDS', 60 * 60))
 
 def get_cache_key(session):
-    """Generate a unique cache key for the user."""
-    if 'credentials' not in session:
-        return None
-    try:
-        creds = session['credentials']
-        return f"{creds['client_id']}_{creds['token'][:10]}"
-    except:
-        return None
+    """Generate a cache key tied to the user's channel, not their access token."""
+    return session.get('channel_id')
 
-def get_cached_data(cache_type, session):
-    """Get cached data if it's still valid."""
+def get_cached_entry(cache_type, session):
+    """Return (data, age in seconds) for any entry within the hard expiry window."""
     cache_key = get_cache_key(session)
     if not cache_key:
-        return None
+        return None, None
+
+    with request_phase('cache'):
+        entry = cache.get(f'{cache_type}:{cache_key}')
+        if not entry:
+            # After a restart the cache is empty but the stores still know when they were synced
+            entry = get_stored_entry(cache_type, cache_key)
+            if not entry:
+                return None, None
+            cache.set(f'{cache_type}:{cache_key}', entry, ttl=CACHE_HARD_EXPIRY_SECONDS)
 
-    if cache_key not in cache[cache_type] or cache_key not in cache['last_fetch']:
+    return entry['data'], time.time() - entry['stored_at']
+
+def get_stored_entry(cache_type, channel_id):
+    """Rebuild a cache entry from the persistent store that backs cache_type, if any."""
+    stores = {'videos': video_store, 'comments': comment_store}
+    if cache_type not in stores:
+        return None
+    synced_at = stores[cache_type].synced_at(channel_id)
+    if not synced_at:
         return None
+    stored_at = datetime.fromisoformat(synced_at).replace(tzinfo=timezone.utc).timestamp()
+    if time.time() - stored_at > CACHE_HARD_EXPIRY_SECONDS:
+        return None
+    return {'data': {'channelId': channel_id}, 'stored_at': stored_at}
 
-    last_fetch = cache['last_fetch'][cache_key]
-    if datetime.now() - last_fetch > timedelta(minutes=30):  # Cache for 30 minutes
+def get_cached_data(cache_type, session):
+    """Get cached data if it's still fresh."""
+    data, age = get_cached_entry(cache_type, session)
+    if data is None or age > CACHE_FRESH_SECONDS:
         return None
 
-    return cache[cache_type][cache_key]
+    return data
 
 def set_cached_data(cache_type, data, session):
     """Store data in cache."""
@@ -57,8 +128,55 @@ def set_cached_data(cache_type, data, session):
     if not cache_key:
         return
 
-    cache[cache_type][cache_key] = data
-    cache['last_fetch'][cache_key] = datetime.now()
+    cache.set(f'{cache_type}:{cache_key}', {'data': data, 'stored_at': time.time()},
+              ttl=CACHE_HARD_EXPIRY_SECONDS)
+
+def cached_response(data, age, status):
+    """jsonify data with headers saying how old it is and where it came from."""
+    response = jsonify(data)
+    response.headers['Age'] = str(int(age))
+    response.headers['X-Cache'] = status  # fresh, stale, expired or miss
+    return response
+
+def make_refresh(cache_type, session, loader):
+    """Return a job that reloads cache_type with the current user's credentials.
+
+    Raises like session_credentials() if they cannot be loaded.
+    """
+    credentials = session_credentials()
+    owner = {'channel_id': session['channel_id']}
+
+    def refresh():
+        # Background refreshes are optional work; leave the reserve for moderation
+        if not ledger.can_spend(REVALIDATE_QUOTA_UNITS, PRIORITY_LOW):
+            logger.info(f'Skipping {cache_type} refresh, quota reserve reached')
+            return
+        data = loader(get_client(credentials, owner['channel_id']), owner['channel_id'])
+        if data is not None:
+            set_cached_data(cache_type, data, owner)
+
+    return refresh
+
+def revalidate(cache_type, session, loader):
+    """Refresh a stale entry in the background."""
+    key = f'{cache_type}:{session["channel_id"]}'
+    revalidator.refresh_in_background(key, make_refresh(cache_type, session, loader), session['channel_id'])
+
+def schedule_refresh(cache_type, session, loader):
+    """Keep an entry warm on the job queue while its channel is being viewed."""
+    refresh = make_refresh(cache_type, session, loader)
+    owner = {'channel_id': session['channel_id']}
+
+    def scheduled():
+        # Every worker schedules its own viewers; skip if another one just refreshed
+        _, age = get_cached_entry(cache_type, owner)
+        if age is not None and age < CACHE_FRESH_SECONDS / 2:
+            return
+        revalidator.refresh(f'{cache_type}:{owner["channel_id"]}', refresh)
+
+    # Refresh a little before entries turn stale, so requests rarely wait on YouTube
+    jobs.schedule(f'{cache_type}:{owner["channel_id"]}', scheduled, CACHE_FRESH_SECONDS * 0.8,
+                  owner['channel_id'])
 
 def get_demo_data():
     """Return demo data when API quota is exceeded."""
@@ -115,7 +233,19 @@ def get_demo_data():
         'is_demo': True
     }
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """Times response serialization as its own phase of the request.
+
+    Records (comment and video lists) are encoded column by column instead of
+    through a dict per item.
+    """
+
+    def dumps(self, obj, **kwargs):
+        with request_phase('serialize'):
+            return serialization.dumps(obj, partial(super().dumps, **kwargs), self.sort_keys)
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
 app.config['SESSION_COOKIE_SAMESITE'] = 'None'
 app.config['SESSION_COOKIE_SECURE'] = True
@@ -125,11 +255,29 @@ CORS(app, supports_credentials=True, resources={
     r"/*": {  # This will apply to all routes
         "origins": ["http://localhost:8000"],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
         "supports_credentials": True
     }
 })
 
+@app.before_request
+def start_request_timer():
+    start_request()
+
+# Registered first so it runs after the other after_request hooks and times them too
+@app.after_request
+def record_request_timing(response):
+    timer = current_timer()
+    if timer is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        total = metrics.observe_request(route, response.status_code, timer)
+        response.headers['Server-Timing'] = timer.server_timing(total)
+    return response
+
+@app.teardown_request
+def end_request_timer(error=None):
+    end_request()
+
 # Add CORS headers to all responses
 @app.after_request
 def after_request(response):
@@ -137,10 +285,44 @@ def after_request(response):
     if origin == "http://localhost:8000":
         response.headers.add('Access-Control-Allow-Origin', origin)
         response.headers.add('Access-Control-Allow-Credentials', 'true')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
         response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+        response.headers.add('Access-Control-Expose-Headers', 'Age,X-Cache,ETag')
+        response.headers.add('Timing-Allow-Origin', origin)
+    # Strong ETags let the polling frontend get a 304 instead of identical data
+    if request.method == 'GET' and request.path.startswith('/api/') and response.status_code == 200 \
+            and response.mimetype == 'application/json' and not response.is_streamed:
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.make_conditional(request)
+    if response.status_code == 200 and not response.is_streamed:
+        compress_response(response)
     return response
 
+def compress_response(response):
+    """Compress a large body for clients that accept it (brotli when installed, else gzip)."""
+    if 'Content-Encoding' in response.headers:
+        return
+    body = response.get_data()
+    if len(body) < serialization.COMPRESS_MIN_BYTES:
+        return
+    response.vary.add('Accept-Encoding')
+    encoding = serialization.negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return
+    with request_phase('compress'):
+        response.set_data(serialization.compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Same content, different bytes: still matches If-None-Match, but not byte-for-byte
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint: request, phase and upstream call histograms for all workers."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # OAuth 2.0 configuration
 CLIENT_SECRETS_FILE = "client_secrets.json"
 SCOPES = [
@@ -150,31 +332,33 @@ SCOPES = [
     'https://www.googleapis.com/auth/yt-analytics.readonly'
 ]
 
+def session_credentials():
+    """The session user's credentials, shared per user and refreshed ahead of expiry.
+
+    Invalid or revoked credentials are cleared from the session and raise,
+    for the route to answer 401.
+    """
+    try:
+        # Refreshed once across threads and workers
+        with request_phase('credentials'):
+            credentials = credential_manager.get(session['credentials'])
+        if credentials.token != session['credentials'].get('token'):
+            session['credentials'] = credentials_info(credentials)
+            session.modified = True
+        return credentials
+    except Exception as e:
+        logger.error(f'Error loading credentials: {str(e)}', exc_info=True)
+        session.pop('credentials', None)  # Clear invalid credentials
+        raise Exception(f'Authentication failed: {str(e)}')
+
 def get_youtube_client():
     if 'credentials' not in session:
         logger.error('No credentials found in session')
-        logger.debug(f'Session contents: {session.items()}')
         raise Exception('Not authenticated')
     
+    credentials = session_credentials()
     try:
-        logger.debug(f'Credentials from session: {session["credentials"]}')
-        credentials = Credentials(**session['credentials'])
-        if not credentials.valid:
-            logger.debug(f'Credentials invalid. Expired: {credentials.expired}, Has refresh token: {credentials.refresh_token is not None}')
-            if credentials.expired and credentials.refresh_token:
-                logger.debug('Attempting to refresh token')
-                credentials.refresh(Request())
-                session['credentials'] = {
-                    'token': credentials.token,
-                    'refresh_token': credentials.refresh_token,
-                    'token_uri': credentials.token_uri,
-                    'client_id': credentials.client_id,
-                    'client_secret': credentials.client_secret,
-                    'scopes': credentials.scopes
-                }
-                session.modified = True
-                logger.debug('Token refreshed successfully')
-        return build('youtube', 'v3', credentials=credentials)
+        return get_client(credentials, session.get('channel_id'))
     except Exception as e:
         logger.error(f'Error creating YouTube client: {str(e)}', exc_info=True)
         session.pop('credentials', None)  # Clear invalid credentials
@@ -188,7 +372,6 @@ def home():
 def auth_status():
     try:
         is_authenticated = 'credentials' in session
-        logger.debug(f'Auth status check - Session contents: {session.items()}')
         logger.debug(f'Auth status check - authenticated: {is_authenticated}')
         return jsonify({
             'authenticated': is_authenticated,
@@ -253,25 +436,23 @@ def oauth2callback():
             logger.error(f'Error fetching token: {str(e)}', exc_info=True)
             return redirect('http://localhost:8000?error=token_error')
             
-        credentials = flow.credentials
+        # Registered with its expiry so it is refreshed before it runs out
+        credentials = credential_manager.remember(flow.credentials)
         logger.debug(f'Got credentials. Has refresh token: {credentials.refresh_token is not None}')
         
-        session['credentials'] = {
-            'token': credentials.token,
-            'refresh_token': credentials.refresh_token,
-            'token_uri': credentials.token_uri,
-            'client_id': credentials.client_id,
-            'client_secret': credentials.client_secret,
-            'scopes': credentials.scopes
-        }
+        session['credentials'] = credentials_info(credentials)
         session.modified = True
         logger.debug('Credentials saved to session')
         
         # Test the credentials
         try:
-            youtube = build('youtube', 'v3', credentials=credentials)
-            test_response = youtube.channels().list(part='id', mine=True).execute()
-            logger.debug(f'Test API call successful: {test_response}')
+            youtube = get_client(credentials)
+            # Also warms the channel metadata cache for the dashboard's first load
+            channel = channel_meta.get(youtube)
+            logger.debug(f'Test API call successful: {channel is not None}')
+            # Cache entries are keyed by channel so token refreshes keep them warm
+            if channel:
+                session['channel_id'] = channel['id']
         except Exception as e:
             logger.error(f'Test API call failed: {str(e)}', exc_info=True)
             return redirect('http://localhost:8000?error=api_test_failed')
@@ -281,6 +462,31 @@ def oauth2callback():
         logger.error(f'Error in oauth2callback: {str(e)}', exc_info=True)
         return redirect('http://localhost:8000?error=auth_failed')
 
+def load_videos(youtube, channel_id=None):
+    """Sync the channel's video catalog; None if the user has no channel."""
+    # Channel lookup is memoized (costs 1 quota point only when it expires)
+    channel = channel_meta.get(youtube, channel_id)
+    if not channel:
+        return None
+        
+    channel_id = channel['id']
+    
+    # New uploads come from the uploads playlist (1 quota point per 50 videos, vs
+    # 100 for search().list) and statistics are refreshed 50 videos per call
+    video_catalog.sync(youtube, channel_id, uploads_playlist_id(channel))
+    
+    # The cache only remembers when the catalog was last synced
+    return {'channelId': channel_id}
+
+def videos_response(channel_id, limit=50, offset=0, fields=None):
+    """Build the /api/videos payload from the video catalog, with only `fields` per video."""
+    return {
+        'videos': Records(video_store.get_videos(channel_id, limit=limit, offset=offset),
+                          fields or list(VIDEO_FIELDS.items())),
+        'channelId': channel_id,
+        'total': video_store.count(channel_id)
+    }
+
 @app.route('/api/videos', methods=['GET'])
 def get_videos():
     try:
@@ -288,102 +494,60 @@ def get_videos():
             logger.error('No credentials in session')
             return jsonify({'error': 'Not authenticated'}), 401
 
-        # Check cache first
-        cached_data = get_cached_data('videos', session)
-        if cached_data:
-            logger.info('Returning cached video data')
-            return jsonify(cached_data)
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        offset = request.args.get('offset', 0, type=int)
+        try:
+            fields = parse_fields(request.args.get('fields'), VIDEO_FIELDS)
+        except FieldError as e:
+            return jsonify({'error': str(e)}), 400
 
-        credentials = Credentials(**session['credentials'])
+        # A fresh cache entry means the catalog was synced recently
+        cached_data, age = get_cached_entry('videos', session)
 
-        if not credentials.valid:
-            if credentials.expired and credentials.refresh_token:
-                try:
-                    credentials.refresh(Request())
-                    session['credentials'] = {
-                        'token': credentials.token,
-                        'refresh_token': credentials.refresh_token,
-                        'token_uri': credentials.token_uri,
-                        'client_id': credentials.client_id,
-                        'client_secret': credentials.client_secret,
-                        'scopes': credentials.scopes
-                    }
-                    session.modified = True
-                except Exception as e:
-                    logger.error(f'Error refreshing token: {str(e)}', exc_info=True)
-                    return jsonify({'error': 'Failed to refresh token'}), 401
-            else:
-                return jsonify({'error': 'Invalid credentials'}), 401
-
-        youtube = build('youtube', 'v3', credentials=credentials)
+        # Keep this channel's videos warm while someone is looking at them
+        if session.get('channel_id'):
+            try:
+                schedule_refresh('videos', session, load_videos)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 401
+        if cached_data is not None and age <= CACHE_FRESH_SECONDS:
+            logger.info('Returning videos from catalog without syncing')
+            return cached_response(videos_response(cached_data['channelId'], limit, offset, fields), age, 'fresh')
+        if cached_data is not None and age <= CACHE_STALE_SECONDS:
+            logger.info('Returning catalog videos and syncing in the background')
+            revalidate('videos', session, load_videos)
+            return cached_response(videos_response(cached_data['channelId'], limit, offset, fields), age, 'stale')
+
+        try:
+            youtube = get_youtube_client()
+        except Exception as e:
+            return jsonify({'error': str(e)}), 401
         
         try:
-            # First get the channel ID (costs 1 quota point)
-            channels_response = youtube.channels().list(
-                part='id,contentDetails',  # Get both in one call to save quota
-                mine=True
-            ).execute()
-            
-            if not channels_response['items']:
+            # Concurrent misses for the same channel share one catalog sync
+            flight_key = f'videos:{session.get("channel_id") or youtube.credentials.refresh_token}'
+            synced = revalidator.refresh(flight_key, lambda: load_videos(youtube, session.get('channel_id')))
+            if synced is None:
                 return jsonify({'error': 'No YouTube channel found'}), 404
-                
-            channel_id = channels_response['items'][0]['id']
-            uploads_playlist_id = channels_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-            
-            # Get the most recent videos (costs 2 quota points)
-            videos_response = youtube.search().list(
-                part='snippet',
-                channelId=channel_id,
-                maxResults=10,  # Reduced from 50 to save quota
-                type='video',
-                order='date'
-            ).execute()
+            channel_id = synced['channelId']
+            session['channel_id'] = channel_id
             
-            videos = []
-            video_ids = []
-            for item in videos_response.get('items', []):
-                video_ids.append(item['id']['videoId'])
-                videos.append({
-                    'id': item['id']['videoId'],
-                    'title': item['snippet']['title'],
-                    'description': item['snippet']['description'],
-                    'thumbnail': item['snippet']['thumbnails']['high']['url'],
-                    'publishedAt': item['snippet']['publishedAt']
-                })
+            # Remember when the catalog was last synced
+            set_cached_data('videos', synced, session)
             
-            # Get statistics in bulk to save quota (costs 1 quota point)
-            if video_ids:
-                stats_response = youtube.videos().list(
-                    part='statistics',
-                    id=','.join(video_ids[:10])  # Process in smaller batches
-                ).execute()
-                
-                stats_map = {item['id']: item['statistics'] for item in stats_response['items']}
-                
-                for video in videos:
-                    if video['id'] in stats_map:
-                        stats = stats_map[video['id']]
-                        video.update({
-                            'viewCount': int(stats.get('viewCount', 0)),
-                            'likeCount': int(stats.get('likeCount', 0)),
-                            'commentCount': int(stats.get('commentCount', 0))
-                        })
-            
-            response_data = {'videos': videos, 'channelId': channel_id}
-            
-            # Cache the successful response
-            set_cached_data('videos', response_data, session)
-            
-            return jsonify(response_data)
+            return cached_response(videos_response(channel_id, limit, offset, fields), 0, 'miss')
             
         except Exception as e:
             if 'quota' in str(e).lower():
                 logger.error('YouTube API quota exceeded')
-                # Try to return cached data even if it's expired
-                cached_data = get_cached_data('videos', session)
-                if cached_data:
-                    logger.info('Returning cached video data due to quota error')
-                    return jsonify(cached_data)
+                # Serve whatever the catalog already holds for this channel, unless it
+                # was last synced longer ago than the hard expiry
+                channel_id = session.get('channel_id')
+                _, age = get_cached_entry('videos', session)
+                fallback = age is not None and age <= CACHE_HARD_EXPIRY_SECONDS
+                if channel_id and fallback and video_store.count(channel_id):
+                    logger.info('Returning catalog video data due to quota error')
+                    return cached_response(videos_response(channel_id, limit, offset, fields), age, 'expired')
                     
                 # If no cache, return demo data
                 logger.info('Returning demo data due to quota error')
@@ -398,6 +562,36 @@ def get_videos():
         return jsonify({'error': str(e)}), 500
 
 
+def load_comments(youtube, channel_id=None):
+    """Sync recent videos' comments into the store; None if the user has no channel."""
+    # Channel lookup is memoized (costs 1 quota point only when it expires)
+    channel = channel_meta.get(youtube, channel_id)
+    if not channel:
+        return None
+        
+    channel_id = channel['id']
+    
+    # Get the most recent videos (costs 1 quota point)
+    playlistitems_response = youtube.playlistItems().list(
+        part='snippet',
+        playlistId=uploads_playlist_id(channel),
+        maxResults=5  # Reduced from 50 to save quota
+    ).execute()
+    
+    video_ids = [item['snippet']['resourceId']['videoId'] 
+                for item in playlistitems_response['items']]
+    
+    # Only threads newer than each video's watermark are fetched and merged
+    comment_sync.sync_channel(youtube, channel_id, video_ids)
+    # so open threads are re-listed a batch at a time for their current likes and replies
+    try:
+        triage.recheck(youtube, channel_id, comment_sync)
+    except Exception as e:
+        logger.warning(f'Error re-checking open comment threads for channel {channel_id}: {str(e)}')
+    
+    # The cache only remembers when the store was last synced
+    return {'channelId': channel_id}
+
 @app.route('/api/comments', methods=['GET'])
 def get_comments():
     try:
@@ -405,101 +599,61 @@ def get_comments():
             logger.error('No credentials in session')
             return jsonify({'error': 'Not authenticated'}), 401
 
-        # Check cache first
-        cached_data = get_cached_data('comments', session)
-        if cached_data:
-            logger.info('Returning cached comment data')
-            return jsonify(cached_data)
+        # Clients pass back the cursor from their last poll to get only the delta
+        since = request.args.get('since', 0, type=int)
+        limit = max(1, min(request.args.get('limit', COMMENTS_PAGE_SIZE, type=int), COMMENTS_MAX_RESULTS))
+        try:
+            fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS)
+        except FieldError as e:
+            return jsonify({'error': str(e)}), 400
 
-        credentials = Credentials(**session['credentials'])
+        # A fresh cache entry means the store was synced recently
+        cached_data, age = get_cached_entry('comments', session)
 
-        if not credentials.valid:
-            if credentials.expired and credentials.refresh_token:
-                try:
-                    credentials.refresh(Request())
-                    session['credentials'] = {
-                        'token': credentials.token,
-                        'refresh_token': credentials.refresh_token,
-                        'token_uri': credentials.token_uri,
-                        'client_id': credentials.client_id,
-                        'client_secret': credentials.client_secret,
-                        'scopes': credentials.scopes
-                    }
-                    session.modified = True
-                except Exception as e:
-                    logger.error(f'Error refreshing token: {str(e)}', exc_info=True)
-                    return jsonify({'error': 'Failed to refresh token'}), 401
-            else:
-                return jsonify({'error': 'Invalid credentials'}), 401
-
-        youtube = build('youtube', 'v3', credentials=credentials)
+        # Keep this channel's comments synced while someone is looking at them
+        if session.get('channel_id'):
+            try:
+                schedule_refresh('comments', session, load_comments)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 401
+        if cached_data is not None and age <= CACHE_FRESH_SECONDS:
+            logger.info('Returning comments from store without syncing')
+            return cached_response(comments_response(cached_data['channelId'], since, limit, fields), age, 'fresh')
+        if cached_data is not None and age <= CACHE_STALE_SECONDS:
+            logger.info('Returning stored comments and syncing in the background')
+            revalidate('comments', session, load_comments)
+            return cached_response(comments_response(cached_data['channelId'], since, limit, fields), age, 'stale')
+
+        try:
+            youtube = get_youtube_client()
+        except Exception as e:
+            return jsonify({'error': str(e)}), 401
         
         try:
-            # First get the channel ID (costs 1 quota point)
-            channels_response = youtube.channels().list(
-                part='id,contentDetails',
-                mine=True
-            ).execute()
-            
-            if not channels_response['items']:
+            # Concurrent misses for the same channel share one sync
+            flight_key = f'comments:{session.get("channel_id") or youtube.credentials.refresh_token}'
+            synced = revalidator.refresh(flight_key, lambda: load_comments(youtube, session.get('channel_id')))
+            if synced is None:
                 return jsonify({'error': 'No YouTube channel found'}), 404
-                
-            channel_id = channels_response['items'][0]['id']
-            uploads_playlist_id = channels_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-            
-            # Get the most recent videos (costs 2 quota points)
-            playlistitems_response = youtube.playlistItems().list(
-                part='snippet',
-                playlistId=uploads_playlist_id,
-                maxResults=5  # Reduced from 50 to save quota
-            ).execute()
+            channel_id = synced['channelId']
+            session['channel_id'] = channel_id
             
-            video_ids = [item['snippet']['resourceId']['videoId'] 
-                        for item in playlistitems_response['items']]
+            # Remember when the store was last synced
+            set_cached_data('comments', synced, session)
             
-            all_comments = []
-            for video_id in video_ids:
-                try:
-                    # Get comments for each video (costs 1 quota point per video)
-                    comments_response = youtube.commentThreads().list(
-                        part='snippet',
-                        videoId=video_id,
-                        maxResults=20  # Reduced from 100 to save quota
-                    ).execute()
-                    
-                    for item in comments_response.get('items', []):
-                        comment = item['snippet']['topLevelComment']['snippet']
-                        all_comments.append({
-                            'id': item['id'],
-                            'videoId': video_id,
-                            'authorDisplayName': comment['authorDisplayName'],
-                            'authorProfileImageUrl': comment['authorProfileImageUrl'],
-                            'textDisplay': comment['textDisplay'],
-                            'likeCount': comment['likeCount'],
-                            'publishedAt': comment['publishedAt'],
-                            'updatedAt': comment['updatedAt']
-                        })
-                except Exception as e:
-                    if 'quota' in str(e).lower():
-                        break  # Stop processing more videos if we hit quota limit
-                    logger.warning(f'Error fetching comments for video {video_id}: {str(e)}')
-                    continue
-            
-            response_data = {'comments': all_comments, 'channelId': channel_id}
-            
-            # Cache the successful response
-            set_cached_data('comments', response_data, session)
-            
-            return jsonify(response_data)
+            return cached_response(comments_response(channel_id, since, limit, fields), 0, 'miss')
             
         except Exception as e:
             if 'quota' in str(e).lower():
                 logger.error('YouTube API quota exceeded')
-                # Try to return cached data even if it's expired
-                cached_data = get_cached_data('comments', session)
-                if cached_data:
-                    logger.info('Returning cached comment data due to quota error')
-                    return jsonify(cached_data)
+                # Serve whatever the store already holds for this channel, unless it
+                # was last synced longer ago than the hard expiry
+                channel_id = session.get('channel_id')
+                _, age = get_cached_entry('comments', session)
+                fallback = age is not None and age <= CACHE_HARD_EXPIRY_SECONDS
+                if channel_id and fallback and comment_store.has_comments(channel_id):
+                    logger.info('Returning stored comment data due to quota error')
+                    return cached_response(comments_response(channel_id, since, limit, fields), age, 'expired')
                     
                 # If no cache, return demo data
                 logger.info('Returning demo data due to quota error')
@@ -513,6 +667,188 @@ def get_comments():
         logger.error(f'Error in get_comments: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def comments_response(channel_id, since=0, limit=COMMENTS_PAGE_SIZE, fields=None):
+    """Build the /api/comments payload from the merged comment store, with only `fields` per comment."""
+    comments, cursor, more = comment_store.get_comments(channel_id, since=since, limit=limit)
+    return {
+        'comments': Records(comments, fields or list(COMMENT_FIELDS.items())),
+        'channelId': channel_id,
+        'cursor': cursor,
+        'hasMore': more
+    }
+
+@app.route('/api/comments/search', methods=['GET'])
+def search_comments():
+    """Search the stored comments; pass back nextCursor as `cursor` for the next page."""
+    if 'credentials' not in session:
+        logger.warning('Attempt to search comments without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not session.get('channel_id'):
+        return jsonify({'error': 'No channel found'}), 404
+
+    channel_id = session['channel_id']
+    limit = max(1, min(request.args.get('limit', 50, type=int), SEARCH_MAX_RESULTS))
+    try:
+        fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS)
+        comments, next_cursor = comment_store.search(
+            channel_id,
+            query=request.args.get('q') or None,
+            video_id=request.args.get('videoId') or None,
+            author=request.args.get('author') or None,
+            published_after=parse_timestamp(request.args.get('publishedAfter')),
+            published_before=parse_timestamp(request.args.get('publishedBefore')),
+            min_likes=request.args.get('minLikes', type=int),
+            max_likes=request.args.get('maxLikes', type=int),
+            limit=limit,
+            cursor=request.args.get('cursor') or None
+        )
+    except (FieldError, SearchError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Searches cover what has been synced; keep syncing while the channel is being viewed
+    try:
+        schedule_refresh('comments', session, load_comments)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 401
+    return jsonify({
+        'comments': Records(comments, fields),
+        'channelId': channel_id,
+        'nextCursor': next_cursor
+    })
+
+def ndjson_response(records):
+    """Stream records as newline-delimited JSON, one line per record as it is produced."""
+    def generate():
+        for record in records:
+            yield json.dumps(record, separators=(',', ':')) + '\n'
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold pages back
+    return response
+
+def stream_pages(kind, pages, channel_id, budget):
+    """Wrap pages of items as NDJSON records: a header, one record per item, then a trailer."""
+    yield {'type': 'start', 'channelId': channel_id}
+    count = 0
+    try:
+        for items in pages:
+            for item in items:
+                yield {'type': kind, kind: item}
+            count += len(items)
+    except Exception as e:
+        logger.error(f'Error streaming {kind}s: {str(e)}')
+        yield {'type': 'error', 'error': str(e), 'quotaExceeded': 'quota' in str(e).lower()}
+    yield {'type': 'end', 'count': count, 'pages': budget.pages, 'truncated': budget.exhausted}
+
+def stream_setup():
+    """Return (youtube, channel, budget) for a streaming route from the current session."""
+    youtube = get_youtube_client()
+    channel = channel_meta.get(youtube, session.get('channel_id'))
+    max_pages = min(request.args.get('maxPages', STREAM_MAX_PAGES, type=int), STREAM_MAX_PAGES)
+    # Streams stop (truncated) before they reach the quota kept for replies and moderation
+    return youtube, channel, PageBudget(max_pages, ledger, PRIORITY_LOW)
+
+@app.route('/api/videos/stream', methods=['GET'])
+def stream_videos():
+    if 'credentials' not in session:
+        logger.warning('Attempt to stream videos without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        youtube, channel, budget = stream_setup()
+        if not channel:
+            return jsonify({'error': 'No YouTube channel found'}), 404
+        session['channel_id'] = channel['id']
+    except Exception as e:
+        logger.error(f'Error starting video stream: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+    # Every upload, newest first, fetched and sent 50 at a time
+    pages = iter_videos(youtube, uploads_playlist_id(channel), budget)
+    return ndjson_response(stream_pages('video', pages, channel['id'], budget))
+
+@app.route('/api/comments/stream', methods=['GET'])
+def stream_comments():
+    if 'credentials' not in session:
+        logger.warning('Attempt to stream comments without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        youtube, channel, budget = stream_setup()
+        if not channel:
+            return jsonify({'error': 'No YouTube channel found'}), 404
+        session['channel_id'] = channel['id']
+    except Exception as e:
+        logger.error(f'Error starting comment stream: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+    # Every thread on every upload; pages are merged into the store as they are sent
+    pages = iter_channel_comments(youtube, channel['id'], uploads_playlist_id(channel), comment_store, budget)
+    return ndjson_response(stream_pages('comment', pages, channel['id'], budget))
+
+@app.route('/api/comments/spam', methods=['GET'])
+def get_spam_comments():
+    """Synced comments scored as likely spam, most likely first, for bulk moderation."""
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch spam comments without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not session.get('channel_id'):
+        return jsonify({'error': 'No channel found'}), 404
+
+    channel_id = session['channel_id']
+    limit = max(1, min(request.args.get('limit', 50, type=int), SPAM_MAX_RESULTS))
+    try:
+        fields = parse_fields(request.args.get('fields'), SCORE_FIELDS)
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'comments': Records(scorer.flagged(channel_id, limit, request.args.get('videoId')), fields),
+        'channelId': channel_id
+    })
+
+@app.route('/api/triage', methods=['GET'])
+def get_triage():
+    """The unanswered comment threads to reply to first."""
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch triage queue without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not session.get('channel_id'):
+        return jsonify({'error': 'No channel found'}), 404
+
+    channel_id = session['channel_id']
+    limit = max(1, min(request.args.get('limit', 20, type=int), TRIAGE_MAX_RESULTS))
+    try:
+        fields = parse_fields(request.args.get('fields'), TRIAGE_FIELDS)
+    except FieldError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # New comments enter the queue as they are synced
+    try:
+        schedule_refresh('comments', session, load_comments)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 401
+    return jsonify({
+        'comments': Records(triage.next(channel_id, limit, request.args.get('videoId')), fields),
+        'channelId': channel_id
+    })
+
+@app.route('/api/triage/dismiss', methods=['POST'])
+def dismiss_triage():
+    if 'credentials' not in session:
+        logger.warning('Attempt to dismiss comments without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    comment_ids = data.get('commentIds')
+    if not comment_ids or not isinstance(comment_ids, list):
+        return jsonify({'error': 'A list of commentIds is required'}), 400
+    if len(comment_ids) > MAX_ITEMS_PER_REQUEST:
+        return jsonify({'error': f'At most {MAX_ITEMS_PER_REQUEST} comments per request'}), 400
+
+    dismissed = triage.dismiss(session.get('channel_id'), [str(comment_id) for comment_id in comment_ids])
+    return jsonify({'success': True, 'dismissed': dismissed})
+
 @app.route('/api/like', methods=['POST'])
 def like_comment():
     if 'credentials' not in session:
@@ -629,11 +965,48 @@ def unheart_comment():
         logger.error(f'Error unhearting comment: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/comments/moderate', methods=['POST'])
+def moderate_comments():
+    if 'credentials' not in session:
+        logger.warning('Attempt to moderate comments without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        data = request.get_json()
+        items = data.get('actions') if data else None
+        
+        if not items or not isinstance(items, list):
+            logger.warning('Missing actions in moderation request')
+            return jsonify({'error': 'A list of actions is required'}), 400
+        if len(items) > MAX_ITEMS_PER_REQUEST:
+            return jsonify({'error': f'At most {MAX_ITEMS_PER_REQUEST} actions per request'}), 400
+            
+        youtube = get_youtube_client()
+        
+        # Apply all actions with multi-ID setModerationStatus calls sent as one batch
+        results = moderation.moderate(youtube, session.get('channel_id'), items)
+        # Held and rejected comments no longer need an answer
+        triage.dismiss(session.get('channel_id'), [
+            result['commentId'] for result in results
+            if result['success'] and result['action'] in ('hold', 'reject', 'reject_and_ban')
+        ])
+        
+        return jsonify({
+            'success': all(result['success'] for result in results),
+            'results': results
+        })
+    except Exception as e:
+        logger.error(f'Error moderating comments: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/reply', methods=['POST'])
 def reply_to_comment():
     if 'credentials' not in session:
         logger.warning('Attempt to reply to comment without authentication')
         return jsonify({'error': 'Not authenticated'}), 401
+    # Replies are stored and checked for double-posting under the channel that sends them
+    if not session.get('channel_id'):
+        return jsonify({'error': 'No channel found'}), 404
     
     try:
         data = request.get_json()
@@ -644,28 +1017,58 @@ def reply_to_comment():
             logger.warning('Missing required fields in reply request')
             return jsonify({'error': 'Comment ID and reply text are required'}), 400
             
-        youtube = get_youtube_client()
+        # The queue stores only a reference; this worker now holds the credentials it points to
+        try:
+            credential_key = getattr(credential_manager.get(session['credentials']), 'key', None)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 401
+        if credential_key is None:
+            return jsonify({'error': 'Sign in again to allow replies to be sent in the background'}), 401
         
-        # Create the reply
-        reply = youtube.comments().insert(
-            part='snippet',
-            body={
-                'snippet': {
-                    'parentId': parent_id,
-                    'textOriginal': reply_text
-                }
-            }
-        ).execute()
+        # Queue the reply; the background sender posts it and retries transient failures
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotencyKey')
+        record = reply_queue.enqueue(
+            session['channel_id'],
+            parent_id,
+            reply_text,
+            credential_key,
+            idempotency_key
+        )
         
-        logger.debug(f'Created reply to comment {parent_id}')
+        logger.debug(f'Queued reply {record["id"]} to comment {parent_id}')
+        # Out of the triage queue now; back in it if the reply fails for good
+        triage.mark_replied(session['channel_id'], parent_id)
         return jsonify({
-            'success': True, 
-            'reply': reply
-        })
+            'success': True,
+            'pending': record['status'] != 'sent',
+            'replyId': record['id'],
+            'status': record['status'],
+            'reply': record['reply']
+        }), 202
     except Exception as e:
         logger.error(f'Error replying to comment: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/replies', methods=['GET'])
+def list_replies():
+    if 'credentials' not in session:
+        logger.warning('Attempt to list replies without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    return jsonify({'replies': reply_queue.list(session.get('channel_id'), request.args.get('status'), limit)})
+
+@app.route('/api/replies/<reply_id>', methods=['GET'])
+def get_reply_status(reply_id):
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch reply status without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    record = reply_queue.get(reply_id)
+    if record is None or record['channelId'] != session.get('channel_id'):
+        return jsonify({'error': 'Reply not found'}), 404
+    return jsonify(record)
+
 @app.route('/api/analytics', methods=['GET'])
 def get_analytics():
     if 'credentials' not in session:
@@ -677,12 +1080,9 @@ def get_analytics():
         youtube = get_youtube_client()
         
         # Get channel details including monetization status
-        channel_response = youtube.channels().list(
-            part='status,statistics',
-            mine=True
-        ).execute()
+        channel = channel_meta.get(youtube, session.get('channel_id'), fresh_stats=True)
         
-        if not channel_response.get('items'):
+        if not channel:
             logger.warning('No channel found for analytics')
             return jsonify({
                 'monetized': False,
@@ -691,7 +1091,7 @@ def get_analytics():
                 'totalEarnings': '0.00'
             })
             
-        channel = channel_response['items'][0]
+        session['channel_id'] = channel['id']
         stats = channel.get('statistics', {})
         
         analytics_data = {
@@ -717,30 +1117,114 @@ def get_live_stats():
         youtube = get_youtube_client()
         
         # Get channel statistics
-        channels_response = youtube.channels().list(
-            part='statistics,snippet',
-            mine=True
-        ).execute()
+        channel = channel_meta.get(youtube, session.get('channel_id'), fresh_stats=True)
         
-        if not channels_response.get('items'):
+        if not channel:
             logger.warning('No channel found for user')
             return jsonify({'error': 'No channel found'}), 404
             
-        channel = channels_response['items'][0]
-        stats = channel['statistics']
+        session['channel_id'] = channel['id']
+        schedule_stats_sampling(session)
         
-        return jsonify({
-            'subscriberCount': stats.get('subscriberCount', '0'),
-            'viewCount': stats.get('viewCount', '0'),
-            'videoCount': stats.get('videoCount', '0'),
-            'channelName': channel['snippet']['title'],
-            'channelThumbnail': channel['snippet']['thumbnails'].get('default', {}).get('url', '')
-        })
+        return jsonify(live_stats_payload(channel))
         
     except Exception as e:
         logger.error(f'Error fetching live stats: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+def schedule_stats_sampling(session):
+    """Sample this channel's statistics for the history while someone is looking at it."""
+    credentials = credential_manager.get(session['credentials'])
+    channel_id = session['channel_id']
+
+    def sample():
+        # Sampling is optional work; leave the reserve for moderation
+        if not ledger.can_spend(1, PRIORITY_LOW):
+            return
+        # A statistics refresh records a snapshot; per-video ones come from catalog syncs
+        channel_meta.get(get_client(credentials, channel_id), channel_id, fresh_stats=True)
+        stats_history.rollup(channel_id)
+
+    jobs.schedule(f'stats-sample:{channel_id}', sample, TIMESERIES_SAMPLE_SECONDS, channel_id)
+
+@app.route('/api/stats/history', methods=['GET'])
+def get_stats_history():
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch stats history without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not session.get('channel_id'):
+        return jsonify({'error': 'No channel found'}), 404
+
+    channel_id = session['channel_id']
+    video_id = request.args.get('videoId')
+    if video_id and not video_store.known_ids(channel_id, [video_id]):
+        return jsonify({'error': 'Video not found'}), 404
+
+    resolution = request.args.get('resolution')
+    if resolution is not None and resolution not in RESOLUTIONS:
+        return jsonify({'error': f'resolution must be one of {", ".join(RESOLUTIONS)}'}), 400
+
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 7 * 24 * 60 * 60, type=float)
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+
+    try:
+        schedule_stats_sampling(session)
+        series = f'video:{video_id}' if video_id else f'channel:{channel_id}'
+        return jsonify(stats_history.history(channel_id, series, start, end, resolution))
+    except Exception as e:
+        logger.error(f'Error fetching stats history: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+def fetch_live_stats(channel_id, credentials):
+    """Fetch one channel's live stats for the push poller."""
+    if not ledger.can_spend(1, PRIORITY_LOW):
+        return None
+    youtube = get_client(credentials, channel_id)
+    channel = channel_meta.get(youtube, channel_id, fresh_stats=True)
+    return live_stats_payload(channel) if channel else None
+
+live_stats_hub = LiveStatsHub(fetch_live_stats)
+
+@app.route('/api/live-stats/stream', methods=['GET'])
+def stream_live_stats():
+    if 'credentials' not in session:
+        logger.warning('Attempt to stream live stats without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        youtube = get_youtube_client()
+        channel = channel_meta.get(youtube, session.get('channel_id'))
+        
+        if not channel:
+            logger.warning('No channel found for user')
+            return jsonify({'error': 'No channel found'}), 404
+            
+        channel_id = channel['id']
+        session['channel_id'] = channel_id
+        subscriber = live_stats_hub.subscribe(channel_id, youtube.credentials)
+    except Exception as e:
+        logger.error(f'Error starting live stats stream: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+    def events():
+        try:
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'  # Stops proxies from closing an idle stream
+                    continue
+                yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        finally:
+            live_stats_hub.unsubscribe(channel_id, subscriber)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/hashtags', methods=['GET'])
 def get_hashtags():
     if 'credentials' not in session:
@@ -751,166 +1235,65 @@ def get_hashtags():
         youtube = get_youtube_client()
         
         # Get user's channel first
-        channels_response = youtube.channels().list(
-            part='id,topicDetails,brandingSettings',
-            mine=True
-        ).execute()
+        channel = channel_meta.get(youtube, session.get('channel_id'))
         
-        if not channels_response.get('items'):
+        if not channel:
             logger.warning('No channel found for user')
             return jsonify({'error': 'No channel found'}), 404
             
-        channel = channels_response['items'][0]
-        channel_topics = channel.get('topicDetails', {}).get('topicCategories', [])
-        channel_keywords = channel.get('brandingSettings', {}).get('channel', {}).get('keywords', '').split(',')
-        
-        # Extract topic IDs and clean keywords
-        topic_ids = [topic.split('/')[-1].lower() for topic in channel_topics]
-        keywords = [kw.strip().lower() for kw in channel_keywords if kw.strip()]
-        
-        # Search for popular videos in the same niche
-        search_results = []
-        for topic in topic_ids + keywords[:3]:  # Use both topics and top keywords
-            try:
-                search_response = youtube.search().list(
-                    part='id',
-                    q=topic,
-                    type='video',
-                    videoCategoryId='10',  # Music category
-                    maxResults=50,
-                    order='viewCount',
-                    publishedAfter=(datetime.utcnow() - timedelta(days=90)).isoformat() + 'Z'
-                ).execute()
-                
-                video_ids = [item['id']['videoId'] for item in search_response.get('items', [])]
-                if video_ids:
-                    # Get detailed video information
-                    videos_response = youtube.videos().list(
-                        part='snippet,statistics',
-                        id=','.join(video_ids)
-                    ).execute()
-                    search_results.extend(videos_response.get('items', []))
-                    
-                    # Log for debugging
-                    logger.debug(f'Found {len(videos_response.get("items", []))} videos for topic {topic}')
-                    
-            except Exception as e:
-                logger.warning(f'Error searching for topic {topic}: {str(e)}')
-                continue
-        
-        # Extract and analyze hashtags
-        hashtag_stats = {}
-        hashtag_pattern = r'#(\w+)'
-        
-        logger.debug(f'Analyzing {len(search_results)} videos for hashtags')
-        
-        for video in search_results:
-            description = video['snippet'].get('description', '')
-            title = video['snippet'].get('title', '')
-            tags = video['snippet'].get('tags', [])
-            view_count = int(video['statistics'].get('viewCount', 0))
-            like_count = int(video['statistics'].get('likeCount', 0))
-            
-            # Find hashtags in description and title
-            hashtags = re.findall(hashtag_pattern, description + ' ' + title)
-            # Add tags that start with #
-            hashtags.extend([tag[1:] for tag in tags if tag.startswith('#')])
-            
-            # Log for debugging
-            if hashtags:
-                logger.debug(f'Found hashtags in video {video["id"]}: {hashtags}')
-            
-            # Calculate engagement score
-            engagement_score = view_count * 0.7 + like_count * 0.3
-            
-            # Update hashtag statistics
-            for hashtag in hashtags:
-                hashtag = hashtag.lower()
-                if hashtag not in hashtag_stats:
-                    hashtag_stats[hashtag] = {
-                        'count': 0,
-                        'total_views': 0,
-                        'total_likes': 0,
-                        'total_score': 0,
-                        'videos': []
-                    }
-                
-                hashtag_stats[hashtag]['count'] += 1
-                hashtag_stats[hashtag]['total_views'] += view_count
-                hashtag_stats[hashtag]['total_likes'] += like_count
-                hashtag_stats[hashtag]['total_score'] += engagement_score
-                hashtag_stats[hashtag]['videos'].append({
-                    'title': title,
-                    'views': view_count,
-                    'likes': like_count
-                })
-        
-        logger.debug(f'Found {len(hashtag_stats)} unique hashtags')
-        
-        # Calculate hashtag effectiveness scores
-        hashtag_scores = []
-        for hashtag, stats in hashtag_stats.items():
-            if stats['count'] >= 2:  # Lower threshold for testing
-                avg_views = stats['total_views'] / stats['count']
-                avg_likes = stats['total_likes'] / stats['count']
-                frequency_score = min(stats['count'] / 5, 1)  # Adjusted threshold
-                engagement_score = stats['total_score'] / stats['count']
-                
-                # Calculate percentiles for normalization
-                if len(stats['videos']) >= 2:
-                    view_percentile = np.percentile([v['views'] for v in stats['videos']], 75)
-                    like_percentile = np.percentile([v['likes'] for v in stats['videos']], 75)
-                else:
-                    view_percentile = avg_views
-                    like_percentile = avg_likes
-                
-                # Prevent division by zero
-                if view_percentile == 0:
-                    view_percentile = 1
-                if like_percentile == 0:
-                    like_percentile = 1
-                
-                # Final score calculation
-                final_score = (
-                    (avg_views / view_percentile) * 0.4 +
-                    (avg_likes / like_percentile) * 0.3 +
-                    frequency_score * 0.3
-                )
-                
-                hashtag_scores.append({
-                    'hashtag': hashtag,
-                    'score': final_score,
-                    'usage_count': stats['count'],
-                    'avg_views': int(avg_views),
-                    'avg_likes': int(avg_likes),
-                    'example_videos': sorted(stats['videos'], 
-                                          key=lambda x: x['views'], 
-                                          reverse=True)[:3]
-                })
-        
-        # Sort hashtags by score and get top 20
-        top_hashtags = sorted(hashtag_scores, key=lambda x: x['score'], reverse=True)[:20]
-        
-        # Group hashtags by effectiveness
-        grouped_hashtags = {
-            'trending': top_hashtags[:5],
-            'popular': top_hashtags[5:10],
-            'growing': top_hashtags[10:15],
-            'niche': top_hashtags[15:20]
-        }
-        
-        logger.debug(f'Grouped hashtags: {grouped_hashtags}')
-        
-        return jsonify({
-            'hashtags': grouped_hashtags,
-            'channel_topics': [topic.split('/')[-1] for topic in channel_topics],
-            'updated_at': datetime.utcnow().isoformat()
-        })
+        channel_id = channel['id']
+        session['channel_id'] = channel_id
+
+        cached_data, age = get_cached_entry('hashtags', session)
+        if cached_data is not None and age <= HASHTAGS_FRESH_SECONDS:
+            return cached_response(cached_data, age, 'fresh')
+
+        # The searches take seconds, so they run on the job queue instead of this worker
+        credentials = youtube.credentials
+        owner = {'channel_id': channel_id}
+
+        def analyze():
+            data = hashtag_engine.analyze(get_client(credentials, channel_id), channel)
+            set_cached_data('hashtags', data, owner)
+
+        job = jobs.submit(f'hashtags:{channel_id}', analyze, channel_id)
+
+        if cached_data is not None:
+            return cached_response(dict(cached_data, job_id=job['id']), age, 'stale')
+        return jsonify({'job_id': job['id'], 'status': job['status']}), 202
         
     except Exception as e:
         logger.error(f'Error analyzing hashtags: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch job status without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    job = jobs.get(job_id)
+    if not job or job['owner'] != session.get('channel_id'):
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch cache stats without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify(dict(cache.stats(), etags=pool.etag_stats(), state=state.stats()))
+
+@app.route('/api/quota', methods=['GET'])
+def get_quota():
+    if 'credentials' not in session:
+        logger.warning('Attempt to fetch quota usage without authentication')
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify(ledger.summary(session.get('channel_id')))
+
 if __name__ == '__main__':
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # For development only
     app.run(host='localhost', port=5000, debug=True)
@@ -0,0 +1,65 @@
+"""Compare per-request build() against the pooled YouTube client.
+
+Usage: python benchmarks/bench_client_pool.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+import youtube_stub
+from youtube_client import ClientPool
+
+
+def per_request_build(api_endpoint, credentials):
+    youtube = build('youtube', 'v3', credentials=credentials,
+                    client_options={'api_endpoint': api_endpoint})
+    return youtube.channels().list(part='id,contentDetails', mine=True).execute()
+
+
+def pooled(pool, credentials):
+    youtube = pool.client(credentials)
+    return youtube.channels().list(part='id,contentDetails', mine=True).execute()
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def report(name, timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f'{name:<20} mean={timings.mean():7.2f}ms p50={p50:7.2f}ms p95={p95:7.2f}ms p99={p99:7.2f}ms')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    server, api_endpoint = youtube_stub.start()
+    credentials = Credentials(token='benchmark-token')
+    pool = ClientPool(api_endpoint=api_endpoint)
+
+    # Warm up both paths so imports and the first connection are not counted
+    per_request_build(api_endpoint, credentials)
+    pooled(pool, credentials)
+
+    before = measure(lambda: per_request_build(api_endpoint, credentials), iterations)
+    after = measure(lambda: pooled(pool, credentials), iterations)
+
+    print(f'{iterations} x channels().list against {api_endpoint}')
+    report('build() per request', before)
+    report('pooled client', after)
+    print(f'speedup (mean): {before.mean() / after.mean():.1f}x')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
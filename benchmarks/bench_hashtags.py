@@ -0,0 +1,121 @@
+"""Benchmark hashtag scoring: the old per-hashtag dict loop vs the columnar engine.
+
+Usage: python benchmarks/bench_hashtags.py [videos]
+"""
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from hashtags import HashtagTable, extract_hashtags
+
+
+def synthetic_videos(n, vocabulary=2000, seed=42):
+    rng = random.Random(seed)
+    # Zipf-like popularity so a few hashtags are very common, like real niches
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    words = [f'tag{rank}' for rank in range(vocabulary)]
+    videos = []
+    for i in range(n):
+        hashtags = rng.choices(words, weights=weights, k=rng.randint(0, 8))
+        videos.append({
+            'id': f'video{i}',
+            'snippet': {
+                'title': f'Video {i} ' + ' '.join(f'#{h}' for h in hashtags[:2]),
+                'description': 'Lorem ipsum ' + ' '.join(f'#{h}' for h in hashtags[2:]),
+                'tags': [f'#{h}' for h in rng.sample(words[:50], 1)] + ['plain tag'],
+            },
+            'statistics': {
+                'viewCount': str(int(rng.paretovariate(1.2) * 1000)),
+                'likeCount': str(int(rng.paretovariate(1.5) * 50)),
+            }
+        })
+    return videos
+
+
+def legacy_scores(search_results):
+    """The scoring loop get_hashtags used before the engine, kept for comparison."""
+    hashtag_stats = {}
+    hashtag_pattern = r'#(\w+)'
+    for video in search_results:
+        description = video['snippet'].get('description', '')
+        title = video['snippet'].get('title', '')
+        tags = video['snippet'].get('tags', [])
+        view_count = int(video['statistics'].get('viewCount', 0))
+        like_count = int(video['statistics'].get('likeCount', 0))
+        hashtags = re.findall(hashtag_pattern, description + ' ' + title)
+        hashtags.extend([tag[1:] for tag in tags if tag.startswith('#')])
+        engagement_score = view_count * 0.7 + like_count * 0.3
+        for hashtag in hashtags:
+            hashtag = hashtag.lower()
+            if hashtag not in hashtag_stats:
+                hashtag_stats[hashtag] = {'count': 0, 'total_views': 0, 'total_likes': 0,
+                                          'total_score': 0, 'videos': []}
+            hashtag_stats[hashtag]['count'] += 1
+            hashtag_stats[hashtag]['total_views'] += view_count
+            hashtag_stats[hashtag]['total_likes'] += like_count
+            hashtag_stats[hashtag]['total_score'] += engagement_score
+            hashtag_stats[hashtag]['videos'].append({'title': title, 'views': view_count, 'likes': like_count})
+
+    hashtag_scores = []
+    for hashtag, stats in hashtag_stats.items():
+        if stats['count'] >= 2:
+            avg_views = stats['total_views'] / stats['count']
+            avg_likes = stats['total_likes'] / stats['count']
+            frequency_score = min(stats['count'] / 5, 1)
+            view_percentile = np.percentile([v['views'] for v in stats['videos']], 75)
+            like_percentile = np.percentile([v['likes'] for v in stats['videos']], 75)
+            if view_percentile == 0:
+                view_percentile = 1
+            if like_percentile == 0:
+                like_percentile = 1
+            final_score = ((avg_views / view_percentile) * 0.4 + (avg_likes / like_percentile) * 0.3 +
+                           frequency_score * 0.3)
+            hashtag_scores.append({
+                'hashtag': hashtag,
+                'score': final_score,
+                'usage_count': stats['count'],
+                'avg_views': int(avg_views),
+                'avg_likes': int(avg_likes),
+                'example_videos': sorted(stats['videos'], key=lambda x: x['views'], reverse=True)[:3]
+            })
+    return sorted(hashtag_scores, key=lambda x: x['score'], reverse=True)[:20]
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    videos = synthetic_videos(n)
+    occurrences = sum(len(extract_hashtags(video)) for video in videos)
+    print(f'{n} videos, {occurrences} hashtag occurrences')
+
+    expected, legacy_ms = timed(lambda: legacy_scores(videos))
+    table, build_ms = timed(lambda: HashtagTable.from_videos(videos))
+    actual, score_ms = timed(lambda: table.score())
+
+    assert [h['hashtag'] for h in actual] == [h['hashtag'] for h in expected], 'ranking differs'
+    for got, want in zip(actual, expected):
+        assert abs(got['score'] - want['score']) < 1e-9, got['hashtag']
+        assert got['example_videos'] == want['example_videos'], got['hashtag']
+
+    print(f'legacy dict loop     {legacy_ms:8.1f}ms')
+    print(f'engine extraction    {build_ms:8.1f}ms')
+    print(f'engine grouped score {score_ms:8.1f}ms')
+    print(f'engine total         {build_ms + score_ms:8.1f}ms ({legacy_ms / (build_ms + score_ms):.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
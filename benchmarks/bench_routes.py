@@ -0,0 +1,198 @@
+"""Drive every /api/* route through the Flask app against the offline API simulator.
+
+Each route is requested --iterations times with a seeded session for the
+simulated channel. Reports latency of the first (cold) request and
+p50/p95/p99 over all of them, plus upstream calls and quota units per
+request. Only calls made while serving the request are attributed to it,
+including ones on the fan-out pool; work the app does in the background
+(job queue, reply sender) is totalled separately.
+
+Usage: python benchmarks/bench_routes.py [--size medium] [--iterations 30] [--latency-ms 0]
+                                         [--error-rate 0] [--quota-limit UNITS] [--route PATH] [--json FILE]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import youtube_stub
+
+CREDENTIALS = {
+    'token': 'benchmark-token',
+    'refresh_token': 'benchmark-refresh-token',
+    'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'benchmark',
+    'client_secret': 'benchmark',
+    'scopes': []
+}
+
+# (method, path, JSON body); path and body may be functions of (iteration, state)
+ROUTES = [
+    ('GET', '/api/videos', None),
+    ('GET', '/api/comments', None),
+    ('GET', '/api/videos/stream?maxPages=4', None),
+    ('GET', '/api/comments/stream?maxPages=10', None),
+    ('GET', '/api/comments/search?q=comment&minLikes=10', None),
+    ('GET', '/api/triage', None),
+    ('GET', '/api/comments/spam', None),
+    ('POST', '/api/like', lambda i, state: {'commentId': f'video0-thread{i}'}),
+    ('POST', '/api/unlike', lambda i, state: {'commentId': f'video0-thread{i}'}),
+    ('POST', '/api/heart', lambda i, state: {'commentId': f'video0-thread{i}'}),
+    ('POST', '/api/unheart', lambda i, state: {'commentId': f'video0-thread{i}'}),
+    ('POST', '/api/comments/moderate', lambda i, state: {'actions': [
+        {'commentId': f'video1-thread{i * 20 + j}', 'action': 'reject' if j % 2 else 'publish'} for j in range(20)
+    ]}),
+    ('POST', '/api/reply', lambda i, state: {'commentId': f'video2-thread{i}', 'replyText': f'Thanks! ({i})'}),
+    ('GET', '/api/replies', None),
+    ('GET', lambda i, state: f'/api/replies/{state.get("replyId", "none")}', None),
+    ('GET', '/api/analytics', None),
+    ('GET', '/api/live-stats', None),
+    ('GET', '/api/stats/history', None),
+    ('GET', '/api/hashtags', None),
+    ('GET', lambda i, state: f'/api/jobs/{state.get("jobId", "none")}', None),
+    ('GET', '/api/cache/stats', None),
+    ('GET', '/api/quota', None),
+]
+
+
+class Attribution:
+    """youtube_client listener counting the calls made on behalf of the request being benchmarked.
+
+    Those run on the benchmark's thread (including streamed bodies, which run
+    after the request is timed) or carry the request's timer onto the pool.
+    """
+
+    def __init__(self, current_timer, method_cost):
+        self.current_timer = current_timer
+        self.method_cost = method_cost
+        self.thread = threading.get_ident()
+        self.calls = 0
+        self.units = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request, elapsed, error):
+        if self.current_timer() is None and threading.get_ident() != self.thread:
+            return
+        with self._lock:
+            self.calls += 1
+            # Like the simulator, only calls that were served are charged
+            if error is None:
+                self.units += self.method_cost(request.methodId)
+
+    def take(self):
+        with self._lock:
+            counts = self.calls, self.units
+            self.calls = self.units = 0
+        return counts
+
+
+def route_name(method, path):
+    if callable(path):
+        path = path(0, {}).rsplit('/', 1)[0] + '/<id>'
+    return f'{method} {path.split("?")[0]}'
+
+
+def run_route(client, attribution, method, path, body, iterations, state):
+    timings, calls, units, statuses = [], [], [], Counter()
+    attribution.take()
+    for i in range(iterations):
+        url = path(i, state) if callable(path) else path
+        kwargs = {'json': body(i, state)} if body else {}
+        if method == 'POST':
+            kwargs['headers'] = {'Idempotency-Key': f'bench-{i}'}
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()  # Drains streamed responses
+        timings.append((time.perf_counter() - start) * 1000)
+        call_count, unit_count = attribution.take()
+        calls.append(call_count)
+        units.append(unit_count)
+        statuses[response.status_code] += 1
+        if response.is_json and isinstance(response.get_json(silent=True), dict):
+            data = response.get_json()
+            state['replyId'] = data.get('replyId', state.get('replyId'))
+            state['jobId'] = data.get('job_id', state.get('jobId'))
+
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'first_ms': round(float(timings[0]), 2),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'calls_per_request': round(float(np.mean(calls)), 2),
+        'units_per_request': round(float(np.mean(units)), 2),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=youtube_stub.CHANNEL_SIZES, default='medium')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--quota-limit', type=int, default=None, help='units before the simulator returns quotaExceeded')
+    parser.add_argument('--route', action='append', help='only routes whose path starts with this (repeatable)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    server, api_endpoint = youtube_stub.start(
+        latency=args.latency_ms / 1000, size=args.size, error_rate=args.error_rate, quota_limit=args.quota_limit
+    )
+    data_dir = tempfile.mkdtemp(prefix='echotube-bench-')
+    # Read at import time by the app's modules
+    os.environ.update(YOUTUBE_API_ENDPOINT=api_endpoint, ECHOTUBE_DATA_DIR=data_dir,
+                      LOG_LEVEL='WARNING', FLASK_SECRET_KEY='benchmark')
+    import app
+    from metrics import current_timer
+    from quota import method_cost
+    logging.disable(logging.ERROR)  # Injected errors are expected
+
+    attribution = Attribution(current_timer, method_cost)
+    app.pool.add_listener(attribution)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['credentials'] = dict(CREDENTIALS)
+        session['channel_id'] = youtube_stub.CHANNEL_ID
+
+    uploads, threads = youtube_stub.CHANNEL_SIZES[args.size]
+    print(f'{args.size} channel ({uploads} uploads, {uploads * threads} comments), {args.iterations} requests '
+          f'per route, {args.latency_ms:.0f}ms latency, {args.error_rate:.0%} errors')
+    print(f'{"route":<30} {"first":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"calls":>6} {"units":>6}  statuses')
+
+    state, results = {}, {}
+    for method, path, body in ROUTES:
+        name = route_name(method, path)
+        if args.route and not any(name.split(' ', 1)[1].startswith(prefix) for prefix in args.route):
+            continue
+        result = results[name] = run_route(client, attribution, method, path, body, args.iterations, state)
+        statuses = ' '.join(f'{status}x{count}' for status, count in result['statuses'].items())
+        print(f'{name:<30} {result["first_ms"]:>6.1f}ms {result["p50_ms"]:>6.1f}ms {result["p95_ms"]:>6.1f}ms '
+              f'{result["p99_ms"]:>6.1f}ms {result["calls_per_request"]:>6.2f} {result["units_per_request"]:>6.1f}  '
+              f'{statuses}')
+
+    upstream = server.simulator.stats()
+    served, failed = sum(upstream['calls'].values()), sum(upstream['errors'].values())
+    attributed = sum(round(r['calls_per_request'] * args.iterations) for r in results.values())
+    print(f'upstream total: {served} calls served, {failed} failed by injection, {upstream["units"]} units; '
+          f'{served + failed - attributed} calls from background work')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'routes': results, 'upstream': upstream}, f, indent=2)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Comment scoring throughput in comments/second: vectorized features, a per-comment loop, and a full sync.
+
+Usage: python benchmarks/bench_scoring.py [--comments 50000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read when the app's modules are imported
+os.environ['ECHOTUBE_DATA_DIR'] = tempfile.mkdtemp(prefix='echotube-bench-')
+
+from bench_search import synthetic_comments, CHANNEL_ID
+from scoring import SENTIMENT_WORDS, WORD
+
+SPAM = ('FREE GIFT CARDS 🔥🔥 <a href="https://www.example.com/win">https://www.example.com/win</a>',
+        'check out my channel!!! 😍😍😍 www.example.com/sub4sub',
+        'I MADE $5000 A WEEK FROM HOME, ASK ME HOW 💰💰')
+# Phrases many viewers post independently; copies of these are not spam
+BENIGN = ('Great video!', 'great video', 'First!', 'Thanks for sharing', 'Love this', '😂', '🔥🔥', '👏👏👏', '😍')
+CAMPAIGN_LENGTH = 10
+
+
+def scoring_comments(n, seed=0):
+    """Synthetic comments with 5% spam and 10% benign duplicates.
+
+    Spam comes in campaigns: a bot account posting copies of one text in a
+    burst. Benign duplicates are common phrases and emoji from regular
+    viewers, which is where a copy check that ignores the author goes wrong.
+    """
+    rng = random.Random(seed)
+    campaign = 0
+    for comment in synthetic_comments(n, seed=seed):
+        if not campaign and rng.random() < 0.05 / CAMPAIGN_LENGTH:
+            campaign, bot, text = CAMPAIGN_LENGTH, rng.randrange(20), rng.choice(SPAM)
+        if campaign:
+            campaign -= 1
+            comment.update(textDisplay=text, authorDisplayName=f'Bot {bot}')
+        elif rng.random() < 0.1:
+            comment['textDisplay'] = rng.choice(BENIGN)
+        comment['authorChannelId'] = f'UC{comment["authorDisplayName"].replace(" ", "")}'
+        yield comment
+
+
+def benign_burst(start='2024-07-01T12:00:00Z'):
+    """The same phrases and emoji from different viewers a minute apart, as under a popular upload."""
+    texts = ['😂', '🔥🔥', '👏👏👏', '😍'] + ['Great video!'] * 40
+    base = datetime.strptime(start, '%Y-%m-%dT%H:%M:%SZ')
+    for i, text in enumerate(texts):
+        published = (base + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        yield {'id': f'Ugb{i:09d}', 'videoId': 'video0', 'authorDisplayName': f'Fan {i}',
+               'authorChannelId': f'UCFan{i}', 'authorProfileImageUrl': '', 'textDisplay': text,
+               'likeCount': 0, 'publishedAt': published, 'updatedAt': published}
+
+
+def loop_features(texts):
+    """The same text features one comment at a time, for comparison."""
+    features = []
+    for text in texts:
+        words = WORD.findall(text.lower())
+        positive = sum(1 for word in words if SENTIMENT_WORDS.get(word) == 1)
+        negative = sum(1 for word in words if SENTIMENT_WORDS.get(word) == -1)
+        upper = sum(1 for ch in text if 'A' <= ch <= 'Z')
+        letters = upper + sum(1 for ch in text if 'a' <= ch <= 'z')
+        emoji = sum(1 for ch in text if 0x1F000 <= ord(ch) <= 0x1FAFF or 0x2600 <= ord(ch) <= 0x27BF)
+        links = text.count('://') + text.count('www.') - text.count('://www.')
+        features.append((links, upper / letters if letters >= 8 else 0.0, emoji / max(len(text), 1),
+                         (positive - negative) / max(positive + negative, 1)))
+    return features
+
+
+def rate(fn, items, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(items), batch_size):
+        fn(items[i:i + batch_size])
+    return len(items) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--comments', type=int, default=50000)
+    args = parser.parse_args()
+
+    from comment_sync import CommentStore
+    from scoring import CommentScorer, plain_text, text_features, SPAM_THRESHOLD
+
+    comments = list(scoring_comments(args.comments))
+    texts = [plain_text(c['textDisplay']) for c in comments]
+    print(f'{args.comments} comments')
+    for batch_size in (100, 1000):
+        print(f'text features, vectorized, batches of {batch_size:<5} {rate(text_features, texts, batch_size):>10,.0f}/s')
+    print(f'text features, per-comment loop          {rate(loop_features, texts, 100):>10,.0f}/s')
+
+    plain_store, scored_store = CommentStore('comments_unscored'), CommentStore()
+    scorer = CommentScorer(scored_store)
+    scored_store.add_listener(scorer.update)
+    print(f'sync merge without scoring, pages of 100 '
+          f'{rate(lambda batch: plain_store.merge(CHANNEL_ID, batch), comments, 100):>10,.0f}/s')
+    print(f'sync merge with scoring, pages of 100    '
+          f'{rate(lambda batch: scored_store.merge(CHANNEL_ID, batch), comments, 100):>10,.0f}/s')
+    print(f're-merge, scores cached                  '
+          f'{rate(lambda batch: scored_store.merge(CHANNEL_ID, batch), comments, 100):>10,.0f}/s')
+
+    flagged = {row['id'] for row in scorer.flagged(CHANNEL_ID, limit=len(comments))}
+    spam = {c['id'] for c in comments if c['authorDisplayName'].startswith('Bot')}
+    benign = {c['id'] for c in comments if plain_text(c['textDisplay']) in BENIGN}
+    print(f'flagged {len(flagged)} at spam >= {SPAM_THRESHOLD}: precision {len(flagged & spam) / max(len(flagged), 1):.2f}, '
+          f'recall {len(flagged & spam) / max(len(spam), 1):.2f} against the {len(spam)} injected')
+    print(f'benign duplicates flagged: {len(flagged & benign)} of {len(benign)}')
+
+    burst = list(benign_burst())
+    scored_store.merge(CHANNEL_ID, burst)
+    flagged = {row['id'] for row in scorer.flagged(CHANNEL_ID, limit=len(comments) + len(burst))}
+    print(f'same phrases from {len(burst)} viewers within the hour flagged: {len(flagged & {c["id"] for c in burst})}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Time comment search over a synthetic channel, and what the index costs incremental syncs.
+
+Comments are merged 100 at a time, like comment_sync pages, then every
+query runs --iterations times (first page, then a page deep into the results).
+
+Usage: python benchmarks/bench_search.py [--comments 120000] [--iterations 20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+CHANNEL_ID = 'UCbenchmark'
+WORDS = ('great video thanks love this tutorial how did you edit music song camera lens light color '
+         'question help please more part next when where why awesome amazing best first').split()
+
+QUERIES = {
+    'text, common word': dict(query='video'),
+    'text, rare phrase': dict(query='camera lens question'),
+    'text prefix': dict(query='tuto'),
+    'video, last day': dict(video_id='video7', published_after='2024-06-28T00:00:00Z'),
+    'question on video, last day': dict(query='how', video_id='video7', published_after='2024-06-28T00:00:00Z'),
+    'author': dict(author='Viewer 42'),
+    'likes >= 200': dict(min_likes=200),
+    'text + likes + range': dict(query='awesome', min_likes=100, published_after='2024-03-01T00:00:00Z',
+                                 published_before='2024-05-01T00:00:00Z'),
+    'no filters': dict(),
+}
+
+
+def synthetic_comments(n, videos=120, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        # Spread over the first half of 2024, oldest first
+        published = (datetime(2024, 1, 1) + timedelta(seconds=i * 180 * 86400 // n)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        yield {
+            'id': f'Ugz{i:09d}', 'videoId': f'video{rng.randrange(videos)}',
+            'authorDisplayName': f'Viewer {rng.randrange(2000)}', 'authorProfileImageUrl': '',
+            'textDisplay': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))),
+            'likeCount': int(rng.paretovariate(1.2)) - 1, 'publishedAt': published, 'updatedAt': published,
+        }
+
+
+def timed(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, [50, 95]), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--comments', type=int, default=120000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ['ECHOTUBE_DATA_DIR'] = tempfile.mkdtemp(prefix='echotube-bench-')
+    from comment_sync import CommentStore
+    store = CommentStore()
+
+    comments = list(synthetic_comments(args.comments))
+    start = time.perf_counter()
+    for i in range(0, len(comments), 100):
+        store.merge(CHANNEL_ID, comments[i:i + 100])
+    elapsed = time.perf_counter() - start
+    print(f'{args.comments} comments merged in {elapsed:.1f}s ({elapsed / len(comments) * 100 * 1000:.1f}ms per 100)')
+
+    print(f'{"query":<30} {"p50":>8} {"p95":>8} {"deep p50":>9}  results')
+    for name, filters in QUERIES.items():
+        (p50, p95), (page, cursor) = timed(lambda: store.search(CHANNEL_ID, **filters), args.iterations)
+        more = '+' if cursor else ''
+        # Follow the cursor 20 pages in, then time that page
+        for _ in range(20):
+            if cursor is None:
+                break
+            _, cursor = store.search(CHANNEL_ID, cursor=cursor, **filters)
+        deep = '-'
+        if cursor is not None:
+            (deep_p50, _), _ = timed(lambda: store.search(CHANNEL_ID, cursor=cursor, **filters), args.iterations)
+            deep = f'{deep_p50:.1f}ms'
+        print(f'{name:<30} {p50:>6.1f}ms {p95:>6.1f}ms {deep:>9}  {len(page)}{more}')
+
+
+if __name__ == '__main__':
+    main()
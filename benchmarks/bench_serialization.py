@@ -0,0 +1,81 @@
+"""Compare building and serializing /api/comments as dicts vs Comment records.
+
+Usage: python benchmarks/bench_serialization.py [comments]
+"""
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from comment_sync import Comment, COMMENT_FIELDS
+from serialization import Records, dumps, compress, brotli
+
+
+def synthetic_rows(n):
+    # Like a real channel: a few hundred regulars commenting across 120 videos
+    return [(
+        f'Ugz{i:08d}AaBbCcDdEe4AaABAg', f'video{i % 120:03d}', f'Viewer {i % 400}',
+        f'https://yt3.ggpht.com/ytc/AIdro_{i % 400:05d}kVv2cXyZ=s48-c-k-c0x00ffffff-no-rj',
+        f'Great video! Question about part {i % 7}: how did you do the <b>edit</b> at 3:{i % 60:02d}?',
+        i % 250, '2024-05-01T12:00:00Z', '2024-05-01T12:00:00Z'
+    ) for i in range(n)]
+
+
+def as_dicts(rows):
+    return [dict(zip(COMMENT_FIELDS, row)) for row in rows]
+
+
+def as_records(rows):
+    return [Comment(*row) for row in rows]
+
+
+def measure(fn, iterations=5):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.median(timings), result
+
+
+def retained(fn):
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    rows = synthetic_rows(n)
+    fields = list(COMMENT_FIELDS.items())
+    compact = dict(separators=(',', ':'), sort_keys=True)
+
+    before, body = measure(lambda: json.dumps({'comments': as_dicts(rows), 'cursor': n}, **compact))
+    after, fast_body = measure(lambda: dumps({'comments': Records(as_records(rows), fields), 'cursor': n},
+                                             lambda value: json.dumps(value, **compact), sort_keys=True))
+    assert json.loads(body) == json.loads(fast_body)
+    projected = list(COMMENT_FIELDS.items())[:1] + [('textDisplay', 'text_display'), ('likeCount', 'like_count')]
+    _, small_body = measure(lambda: dumps({'comments': Records(as_records(rows), projected)}, json.dumps))
+
+    print(f'{n} comments')
+    print(f'build + serialize, dicts:    {before:7.1f}ms')
+    print(f'build + serialize, records:  {after:7.1f}ms  ({before / after:.1f}x)')
+    print(f'retained, dicts:    {retained(lambda: as_dicts(rows)) / 1e6:6.1f} MB')
+    print(f'retained, records:  {retained(lambda: as_records(rows)) / 1e6:6.1f} MB')
+    payload = fast_body.encode()
+    print(f'payload: {len(payload) / 1e6:.2f} MB, fields=id,textDisplay,likeCount: {len(small_body) / 1e6:.2f} MB')
+    for encoding in ('gzip', 'br') if brotli is not None else ('gzip',):
+        elapsed, compressed = measure(lambda: compress(payload, encoding))
+        print(f'{encoding}: {len(compressed) / 1e6:.2f} MB in {elapsed:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
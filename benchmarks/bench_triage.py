@@ -0,0 +1,75 @@
+"""Time "next comments to answer" from the triage index vs rescanning and scoring every thread.
+
+Usage: python benchmarks/bench_triage.py [--comments 120000] [--iterations 20]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bench_search import synthetic_comments, timed, CHANNEL_ID
+
+
+def triage_comments(n, seed=0):
+    rng = random.Random(seed)
+    for comment in synthetic_comments(n, seed=seed):
+        comment['authorChannelId'] = f'UCviewer{rng.randrange(2000)}'
+        comment['totalReplyCount'] = rng.randrange(3)
+        comment['creatorReplied'] = rng.random() < 0.3
+        yield comment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--comments', type=int, default=120000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ['ECHOTUBE_DATA_DIR'] = tempfile.mkdtemp(prefix='echotube-bench-')
+    from comment_sync import CommentStore
+    from video_catalog import VideoStore
+    from triage import TriageQueue, priority_key, current_priority
+
+    store, video_store = CommentStore(), VideoStore()
+    triage = TriageQueue(store, video_store)
+    store.add_listener(triage.update)
+    comments = list(triage_comments(args.comments))
+
+    timings = []
+    for merge_store in (CommentStore('comments_untriaged'), store):
+        start = time.perf_counter()
+        for i in range(0, len(comments), 100):
+            merge_store.merge(CHANNEL_ID, comments[i:i + 100])
+        timings.append((time.perf_counter() - start) / len(comments) * 100 * 1000)
+    print(f'{args.comments} threads; merging 100: {timings[0]:.1f}ms, {timings[1]:.1f}ms with triage updates')
+
+    def rescan():
+        # What the queue replaces: score every unanswered thread, then sort
+        conn = store._conn()
+        rows = conn.execute('''
+            SELECT c.id, c.like_count, c.published_at, t.author_channel_id FROM comments c
+            JOIN comment_triage t ON t.comment_id = c.id WHERE c.channel_id = ? AND t.state = 'open'
+        ''', (CHANNEL_ID,)).fetchall()
+        history = dict(conn.execute('''
+            SELECT author_channel_id, COUNT(*) FROM comment_triage WHERE channel_id = ? GROUP BY author_channel_id
+        ''', (CHANNEL_ID,)).fetchall())
+        now = time.time()
+        scores = np.array([current_priority(priority_key(row[1], history.get(row[3], 0), row[2], row[2]), now)
+                           for row in rows])
+        return [rows[i][0] for i in np.argsort(-scores)[:20]]
+
+    for name, fn in (('triage index, next 20', lambda: triage.next(CHANNEL_ID, 20)),
+                     ('triage index, next 20 on a video', lambda: triage.next(CHANNEL_ID, 20, 'video7')),
+                     ('rescan and sort, next 20', rescan)):
+        (p50, p95), _ = timed(fn, args.iterations)
+        print(f'{name:<34} p50 {p50:7.2f}ms  p95 {p95:7.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Compare gunicorn's threads and gevent modes under many concurrent clients.
+
+Starts the YouTube stub with a per-request delay standing in for Google's
+latency, runs one single-process gunicorn worker per server mode against it,
+and drives /api/live-stats (one upstream call per request) from 50, 200 and
+500 keep-alive clients, each logged in as a different channel.
+
+Usage: python benchmarks/load_test.py [seconds per level] [upstream latency ms]
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+import youtube_stub
+
+MODES = ('threads', 'gevent')
+CONCURRENCY = (50, 200, 500)
+PATH = '/api/live-stats'
+SECRET_KEY = 'load-test'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def session_cookie(channel_id):
+    """A signed session cookie for a logged-in user, as the OAuth callback would set it."""
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    return 'session=' + serializer.dumps({
+        'credentials': {
+            'token': f'token-{channel_id}',
+            'refresh_token': f'refresh-{channel_id}',
+            'token_uri': 'https://oauth2.googleapis.com/token',
+            'client_id': 'load-test',
+            'client_secret': 'load-test',
+            'scopes': []
+        },
+        'channel_id': channel_id
+    })
+
+
+def start_server(mode, port, api_endpoint, data_dir):
+    env = dict(os.environ,
+               ECHOTUBE_SERVER_MODE=mode,
+               YOUTUBE_API_ENDPOINT=api_endpoint,
+               ECHOTUBE_DATA_DIR=data_dir,
+               FLASK_SECRET_KEY=SECRET_KEY,
+               CHANNEL_STATS_TTL='0')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+         '--workers', '1', '--bind', f'127.0.0.1:{port}', '--backlog', '2048'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', PATH)
+            conn.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def client(port, cookie, stop, latencies, errors):
+    conn = None
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', PATH, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run_level(port, concurrency, duration):
+    stop = threading.Event()
+    latencies, errors = [], []
+    cookies = [session_cookie(f'UCload{i}') for i in range(concurrency)]
+    threads = [threading.Thread(target=client, args=(port, cookie, stop, latencies, errors), daemon=True)
+               for cookie in cookies]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings = np.array(latencies or [0.0]) * 1000
+    p50, p95 = np.percentile(timings, [50, 95])
+    return len(latencies) / elapsed, p50, p95, len(errors)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.5
+    server, api_endpoint = youtube_stub.start(latency=latency)
+
+    print(f'GET {PATH}, {duration:.0f}s per level, {latency * 1000:.0f}ms upstream latency, 1 worker')
+    print(f'{"mode":<8} {"clients":>7} {"req/s":>8} {"p50":>9} {"p95":>9} {"errors":>6}')
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as data_dir:
+            port = free_port()
+            process = start_server(mode, port, api_endpoint, data_dir)
+            try:
+                for concurrency in CONCURRENCY:
+                    rate, p50, p95, errors = run_level(port, concurrency, duration)
+                    print(f'{mode:<8} {concurrency:>7} {rate:>8.1f} {p50:>7.1f}ms {p95:>7.1f}ms {errors:>6}')
+            finally:
+                process.terminate()
+                process.wait()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
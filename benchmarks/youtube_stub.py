@@ -0,0 +1,352 @@
+"""Offline stand-in for the parts of the YouTube Data API the app uses.
+
+Serves channels, search, playlistItems, videos, commentThreads and comments
+(list, insert, setModerationStatus), plus the /batch endpoint, for one
+synthetic channel. A Simulator sets the channel size, adds latency, injects
+transient errors and runs out of quota, and counts calls and quota units.
+"""
+import json
+import time
+import random
+import hashlib
+import socket
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CHANNEL_ID = 'UCbenchmark'
+UPLOADS_PLAYLIST_ID = 'UUbenchmark'
+THREADS_NEWEST = datetime(2024, 6, 1)  # publishedAt of each upload's newest comment thread
+
+# (uploads, comment threads per upload), from a brand new channel to 100k comments
+CHANNEL_SIZES = {
+    'tiny': (3, 10),
+    'small': (20, 50),
+    'medium': (120, 250),
+    'large': (400, 250),
+}
+
+# Unit cost per method; other list calls cost 1
+QUOTA_COSTS = {
+    'youtube.search.list': 100,
+    'youtube.comments.insert': 50,
+    'youtube.comments.setModerationStatus': 50,
+}
+
+QUOTA_EXCEEDED = {'error': {
+    'code': 403,
+    'message': 'The request cannot be completed because you have exceeded your quota.',
+    'errors': [{'message': 'quotaExceeded', 'domain': 'youtube.quota', 'reason': 'quotaExceeded'}]
+}}
+BACKEND_ERROR = {'error': {
+    'code': 503,
+    'message': 'The service is currently unavailable.',
+    'errors': [{'message': 'backendError', 'domain': 'global', 'reason': 'backendError'}]
+}}
+
+
+class Simulator:
+    """Channel size, fault injection and call accounting for one stub server.
+
+    latency is added to every HTTP round trip (a batch pays it once);
+    error_rate is the share of calls answered with a 503; after quota_limit
+    units every call gets a quotaExceeded 403, like a project out of quota.
+    """
+
+    def __init__(self, size='medium', latency=0, error_rate=0, quota_limit=None, seed=0):
+        self.videos, self.threads_per_video = CHANNEL_SIZES[size]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_limit = quota_limit
+        self.random = random.Random(seed)
+        self.replies = {}  # parent id -> comments inserted as replies to it
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the call and quota counters."""
+        with self._lock:
+            self.calls = Counter()
+            self.errors = Counter()
+            self.units = 0
+
+    def charge(self, method):
+        """Account for one call; return an injected (status, error body), or None to serve it."""
+        with self._lock:
+            if self.quota_limit is not None and self.units >= self.quota_limit:
+                self.errors[method] += 1
+                return 403, QUOTA_EXCEEDED
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors[method] += 1
+                return 503, BACKEND_ERROR
+            self.calls[method] += 1
+            self.units += QUOTA_COSTS.get(method, 1)
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors), 'units': self.units}
+
+
+def page(params, total, default_size):
+    """Return (range of item indexes, nextPageToken or None) for a paginated list call."""
+    size = int(params.get('maxResults', [str(default_size)])[0])
+    start = int(params.get('pageToken', ['0'])[0])
+    end = min(start + size, total)
+    return range(start, end), (str(end) if end < total else None)
+
+
+def channels_list(sim, params, body):
+    return {
+        'kind': 'youtube#channelListResponse',
+        'items': [{
+            'id': CHANNEL_ID,
+            'contentDetails': {'relatedPlaylists': {'uploads': UPLOADS_PLAYLIST_ID}},
+            'statistics': {
+                'viewCount': str(sim.videos * 100),
+                'subscriberCount': '10',
+                'videoCount': str(sim.videos)
+            },
+            'snippet': {'title': 'Benchmark Channel', 'thumbnails': {'default': {'url': ''}}},
+        }]
+    }
+
+
+def playlist_items_list(sim, params, body):
+    indexes, next_page_token = page(params, sim.videos, 5)
+    response = {'items': [{
+        'snippet': {'resourceId': {'videoId': f'video{i}'}},
+        'contentDetails': {'videoId': f'video{i}'}
+    } for i in indexes]}
+    if next_page_token:
+        response['nextPageToken'] = next_page_token
+    return response
+
+
+def comment_thread(sim, video_id, i, with_replies):
+    thread_id = f'{video_id}-thread{i}'
+    # order=time lists newest first: thread0 is the newest, a minute apart
+    published = (THREADS_NEWEST - timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    with sim._lock:
+        replies = list(sim.replies.get(thread_id, []))
+    item = {
+        'id': thread_id,
+        'snippet': {
+            'channelId': CHANNEL_ID,
+            'videoId': video_id,
+            'totalReplyCount': len(replies),
+            'topLevelComment': {'snippet': {
+                'authorDisplayName': f'user{i}',
+                'authorProfileImageUrl': '',
+                'authorChannelId': {'value': f'UCuser{i}'},
+                'textDisplay': f'comment {i}',
+                'likeCount': i,
+                'publishedAt': published,
+                'updatedAt': published,
+            }}
+        }
+    }
+    if with_replies and replies:
+        item['replies'] = {'comments': replies[:5]}  # Like the API, only some of the replies
+    return item
+
+
+def comment_threads_list(sim, params, body):
+    with_replies = 'replies' in params.get('part', [''])[0].split(',')
+    if 'id' in params:
+        # Threads by ID; unknown IDs are left out, like deleted ones
+        items = []
+        for thread_id in params['id'][0].split(','):
+            video_id, _, i = thread_id.rpartition('-thread')
+            if video_id and i.isdigit() and int(i) < sim.threads_per_video:
+                items.append(comment_thread(sim, video_id, int(i), with_replies))
+        return {'items': items}
+
+    video_id = params['videoId'][0]
+    indexes, next_page_token = page(params, sim.threads_per_video, 20)
+    response = {'items': [comment_thread(sim, video_id, i, with_replies) for i in indexes]}
+    if next_page_token:
+        response['nextPageToken'] = next_page_token
+    return response
+
+
+def comments_list(sim, params, body):
+    parent_id = params['parentId'][0]
+    with sim._lock:
+        return {'items': list(sim.replies.get(parent_id, []))}
+
+
+def comments_insert(sim, params, body):
+    snippet = body['snippet']
+    with sim._lock:
+        replies = sim.replies.setdefault(snippet['parentId'], [])
+        comment = {
+            'id': f'{snippet["parentId"]}.reply{len(replies)}',
+            'snippet': {
+                'parentId': snippet['parentId'],
+                'textOriginal': snippet['textOriginal'],
+                'textDisplay': snippet['textOriginal'],
+                'authorChannelId': {'value': CHANNEL_ID},
+                'publishedAt': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            }
+        }
+        replies.append(comment)
+    return comment
+
+
+def comments_set_moderation_status(sim, params, body):
+    return None  # 204 No Content
+
+
+def search_list(sim, params, body):
+    max_results = int(params.get('maxResults', ['10'])[0])
+    return {'items': [{
+        'id': {'videoId': f'video{i}'},
+        'snippet': {
+            'title': f'Video {i}',
+            'description': f'Description {i} #bench #video{i % 3}',
+            'thumbnails': {'high': {'url': ''}},
+            'publishedAt': '2024-01-01T00:00:00Z',
+        }
+    } for i in range(max_results)]}
+
+
+def videos_list(sim, params, body):
+    video_ids = params['id'][0].split(',')
+    return {'items': [{
+        'id': video_id,
+        'snippet': {
+            'title': video_id,
+            'description': f'#bench #{video_id}',
+            'tags': [],
+            'thumbnails': {'high': {'url': ''}},
+            'publishedAt': '2024-01-01T00:00:00Z',
+        },
+        'statistics': {'viewCount': '100', 'likeCount': '10', 'commentCount': str(sim.threads_per_video)},
+    } for video_id in video_ids]}
+
+
+# (HTTP method, path) -> (API method id, handler)
+ROUTES = {
+    ('GET', '/youtube/v3/search'): ('youtube.search.list', search_list),
+    ('GET', '/youtube/v3/videos'): ('youtube.videos.list', videos_list),
+    ('GET', '/youtube/v3/channels'): ('youtube.channels.list', channels_list),
+    ('GET', '/youtube/v3/playlistItems'): ('youtube.playlistItems.list', playlist_items_list),
+    ('GET', '/youtube/v3/commentThreads'): ('youtube.commentThreads.list', comment_threads_list),
+    ('GET', '/youtube/v3/comments'): ('youtube.comments.list', comments_list),
+    ('POST', '/youtube/v3/comments'): ('youtube.comments.insert', comments_insert),
+    ('POST', '/youtube/v3/comments/setModerationStatus'):
+        ('youtube.comments.setModerationStatus', comments_set_moderation_status),
+}
+
+
+def dispatch(sim, method, path, body):
+    """Serve one API call; return (status, response body or None)."""
+    url = urlparse(path)
+    route = ROUTES.get((method, url.path))
+    if route is None:
+        return 404, {'error': {'code': 404, 'message': 'not found'}}
+    method_id, handler = route
+    injected = sim.charge(method_id)
+    if injected is not None:
+        return injected
+    result = handler(sim, parse_qs(url.query), json.loads(body) if body else None)
+    return (204, None) if result is None else (200, result)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; avoid Nagle stalls on reused sockets
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        self.serve('GET')
+
+    def do_POST(self):
+        self.serve('POST')
+
+    def serve(self, method):
+        sim = self.server.simulator
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        # Stand in for the round trip to Google
+        if sim.latency:
+            time.sleep(sim.latency)
+        if method == 'POST' and urlparse(self.path).path == '/batch':
+            return self.serve_batch(sim, body)
+
+        status, response = dispatch(sim, method, self.path, body)
+        payload = json.dumps(response).encode() if response is not None else b''
+        etag = f'"{hashlib.sha1(payload).hexdigest()}"'
+        if status == 200 and method == 'GET' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 200:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def serve_batch(self, sim, body):
+        """Answer a multipart/mixed batch with one application/http part per call."""
+        message = BytesParser().parsebytes(
+            f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode() + body
+        )
+        boundary = f'batch_{hashlib.sha1(body).hexdigest()[:16]}'
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            head, _, part_body = request.replace('\r\n', '\n').partition('\n\n')
+            method, path = head.split('\n', 1)[0].split(' ')[:2]
+            status, response = dispatch(sim, method, path, part_body.strip())
+            payload = json.dumps(response) if response is not None else ''
+            parts.append(
+                f'--{boundary}\r\n'
+                'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{part["Content-ID"][1:]}\r\n\r\n'
+                f'HTTP/1.1 {status} {self.responses.get(status, ("",))[0]}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(payload)}\r\n\r\n'
+                f'{payload}\r\n'
+            )
+        payload = (''.join(parts) + f'--{boundary}--\r\n').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/mixed; boundary={boundary}')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Load tests open hundreds of connections at once
+
+    def __init__(self, address, simulator):
+        super().__init__(address, Handler)
+        self.simulator = simulator
+
+
+def start(port=0, latency=0, **config):
+    """Start the stub in a daemon thread and return (server, api_endpoint).
+
+    latency adds that many seconds to every response, like a real upstream;
+    other keyword arguments (size, error_rate, quota_limit, seed) configure the
+    Simulator, available as server.simulator.
+    """
+    server = StubServer(('127.0.0.1', port), Simulator(latency=latency, **config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
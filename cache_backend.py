@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # 'memory' or 'sqlite'
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1000))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 30 * 60))
+# A hit moves an entry up the LRU at most this often, so SQLite reads rarely take the write lock
+CACHE_TOUCH_SECONDS = 60
+
+
+class CacheStats:
+    """Hit/miss/eviction counters for one cache instance."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL and a memory cap."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, default_ttl=CACHE_DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.counters = CacheStats()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.counters.expirations += 1
+                self.counters.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Store value only if key is absent or expired; return True if stored."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= time.time():
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def _store(self, key, value, ttl):
+        size = len(json.dumps(value, default=str))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.time() + (ttl or self.default_ttl), size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.counters.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def delete_if(self, key, value):
+        """Delete key only while it holds value; return True if deleted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != value:
+                return False
+            self._remove(key)
+            return True
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters.as_dict(), backend='memory', entries=len(self._entries), bytes=self._bytes)
+
+
+class SQLiteCache:
+    """LRU + TTL cache in a SQLite file shared by every gunicorn worker.
+
+    Counters are per process; entries and eviction are shared. Hits update
+    an entry's LRU position only every CACHE_TOUCH_SECONDS, and expired
+    entries are purged by writes, so most reads never take the write lock.
+    With max_entries and max_bytes of None nothing is evicted.
+    """
+
+    def __init__(self, db_name='cache', max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 default_ttl=CACHE_DEFAULT_TTL):
+        self.db_name = db_name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.counters = CacheStats()
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at);
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute('SELECT value, expires_at, accessed_at FROM cache WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or row['expires_at'] < now:
+            self.counters.misses += 1
+            return None
+        if self.max_entries is not None and now - row['accessed_at'] > CACHE_TOUCH_SECONDS:
+            with conn:
+                conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+        self.counters.hits += 1
+        return json.loads(row['value'])
+
+    def set(self, key, value, ttl=None):
+        payload = json.dumps(value, default=str)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size,
+                    expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+            ''', (key, payload, len(payload), now + (ttl or self.default_ttl), now))
+            self._evict(conn, now)
+
+    def add(self, key, value, ttl=None):
+        """Store value only if key is absent or expired; return True if stored.
+
+        Atomic across workers, so it doubles as a short-lived lease.
+        """
+        payload = json.dumps(value, default=str)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            stored = conn.execute('''
+                INSERT INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value, size = excluded.size,
+                    expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+                WHERE cache.expires_at < excluded.accessed_at
+            ''', (key, payload, len(payload), now + (ttl or self.default_ttl), now)).rowcount
+        return stored > 0
+
+    def delete(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_if(self, key, value):
+        """Delete key only while it holds value; return True if deleted.
+
+        Atomic across workers, so a lease is only ever released by its owner.
+        """
+        conn = self._conn()
+        with conn:
+            deleted = conn.execute('DELETE FROM cache WHERE key = ? AND value = ?',
+                                   (key, json.dumps(value, default=str))).rowcount
+        return deleted > 0
+
+    def _evict(self, conn, now):
+        expired = conn.execute('DELETE FROM cache WHERE expires_at < ?', (now,)).rowcount
+        self.counters.expirations += expired
+        if self.max_entries is None:
+            return
+
+        count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for row in conn.execute('SELECT key, size FROM cache ORDER BY accessed_at'):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((row['key'],))
+            count -= 1
+            total -= row['size']
+        conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+        self.counters.evictions += len(victims)
+
+    def stats(self):
+        count, total = self._conn().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        return dict(self.counters.as_dict(), backend='sqlite', entries=count, bytes=total)
+
+
+def create_cache(backend=CACHE_BACKEND, evict=True):
+    """Return the cache backend selected by CACHE_BACKEND.
+
+    evict=False gives a separate cache that is never evicted, for leases and
+    state that response traffic must not push out; its entries only expire.
+    That one is SQLite whatever the backend: job status polls, leases and
+    shared credentials must reach every worker.
+    """
+    if not evict:
+        return SQLiteCache('cache_state', max_entries=None, max_bytes=None)
+    if backend == 'sqlite':
+        return SQLiteCache()
+    if backend != 'memory':
+        logger.warning(f'Unknown CACHE_BACKEND {backend!r}, falling back to memory')
+    return MemoryCache()
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import logging
+
+from db import get_connection
+from refresh import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Every part any route needs, fetched together for the same 1 quota point
+CHANNEL_PARTS = 'id,contentDetails,statistics,snippet,status,topicDetails,brandingSettings'
+
+# Playlist IDs, title, topics and keywords change rarely; statistics change constantly
+CHANNEL_META_TTL = int(os.getenv('CHANNEL_META_TTL', 6 * 60 * 60))
+CHANNEL_STATS_TTL = int(os.getenv('CHANNEL_STATS_TTL', 30))
+
+
+class ChannelStore:
+    """Persisted channel resources plus time-stamped statistics snapshots.
+
+    Survives restarts and deploys, so a worker with an empty cache can still
+    answer from the last fetch instead of calling YouTube.
+    """
+
+    def __init__(self, db_name='channels'):
+        self.db_name = db_name
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS channels (
+                    id TEXT PRIMARY KEY,
+                    title TEXT,
+                    uploads_playlist_id TEXT,
+                    resource TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    stats_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS channel_stats (
+                    channel_id TEXT NOT NULL,
+                    taken_at REAL NOT NULL,
+                    subscriber_count INTEGER,
+                    view_count INTEGER,
+                    video_count INTEGER,
+                    PRIMARY KEY (channel_id, taken_at)
+                );
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def get(self, channel_id):
+        """Return the last stored {'channel', 'fetched_at', 'stats_at'} entry, or None."""
+        row = self._conn().execute('SELECT * FROM channels WHERE id = ?', (channel_id,)).fetchone()
+        if row is None:
+            return None
+        return {'channel': json.loads(row['resource']), 'fetched_at': row['fetched_at'], 'stats_at': row['stats_at']}
+
+    def save(self, entry, snapshot=True):
+        """Upsert a channel entry and, by default, snapshot its statistics."""
+        channel = entry['channel']
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO channels (id, title, uploads_playlist_id, resource, fetched_at, stats_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title,
+                    uploads_playlist_id = excluded.uploads_playlist_id,
+                    resource = excluded.resource,
+                    fetched_at = excluded.fetched_at,
+                    stats_at = excluded.stats_at
+            ''', (channel['id'], channel.get('snippet', {}).get('title'),
+                  channel.get('contentDetails', {}).get('relatedPlaylists', {}).get('uploads'),
+                  json.dumps(channel), entry['fetched_at'], entry['stats_at']))
+            if snapshot:
+                stats = channel.get('statistics', {})
+                conn.execute('''
+                    INSERT OR IGNORE INTO channel_stats (channel_id, taken_at, subscriber_count, view_count, video_count)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (channel['id'], entry['stats_at'], int(stats.get('subscriberCount', 0)),
+                      int(stats.get('viewCount', 0)), int(stats.get('videoCount', 0))))
+
+    def get_stats(self, channel_id, since=0):
+        """Statistics snapshots taken after `since` (epoch seconds), oldest first."""
+        rows = self._conn().execute('''
+            SELECT taken_at, subscriber_count, view_count, video_count FROM channel_stats
+            WHERE channel_id = ? AND taken_at > ? ORDER BY taken_at
+        ''', (channel_id, since)).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune_stats(self, channel_id, before):
+        """Drop snapshots taken before `before`, once they have been rolled up."""
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM channel_stats WHERE channel_id = ? AND taken_at < ?', (channel_id, before))
+
+
+class ChannelMetadata:
+    """Memoizes channels().list(mine=True) per channel in the shared cache.
+
+    One full lookup serves every route for CHANNEL_META_TTL; routes that show
+    statistics ask for fresh_stats and only re-fetch the statistics part.
+    Entries are also written through to a ChannelStore, which refills the
+    cache after a restart.
+    """
+
+    def __init__(self, cache, store=None):
+        self.cache = cache
+        self.store = store
+        self.flight = SingleFlight()
+
+    def _key(self, channel_id):
+        return f'channel:{channel_id}'
+
+    def get(self, youtube, channel_id=None, fresh_stats=False):
+        """Return the channel resource for the authorized user, or None if they have none."""
+        now = time.time()
+        entry = self.cache.get(self._key(channel_id)) if channel_id else None
+        if entry is None and channel_id and self.store is not None:
+            entry = self.store.get(channel_id)
+            if entry is not None:
+                self.cache.set(self._key(channel_id), entry, ttl=CHANNEL_META_TTL)
+
+        if entry and now - entry['fetched_at'] <= CHANNEL_META_TTL:
+            if not fresh_stats or now - entry['stats_at'] <= CHANNEL_STATS_TTL:
+                return entry['channel']
+            return self.flight.do(f'stats:{channel_id}', lambda: self._refresh_stats(youtube, entry))
+
+        if not channel_id:
+            return self._fetch(youtube)
+        return self.flight.do(f'channel:{channel_id}', lambda: self._fetch(youtube))
+
+    def _fetch(self, youtube):
+        response = youtube.channels().list(part=CHANNEL_PARTS, mine=True).execute()
+        if not response.get('items'):
+            return None
+
+        channel = response['items'][0]
+        # Later calls on this client are attributed to the now-known channel
+        if getattr(youtube, 'channel_id', None) is None:
+            youtube.channel_id = channel['id']
+        now = time.time()
+        self._store({'channel': channel, 'fetched_at': now, 'stats_at': now})
+        logger.info(f'Fetched metadata for channel {channel["id"]}')
+        return channel
+
+    def _refresh_stats(self, youtube, entry):
+        channel = entry['channel']
+        response = youtube.channels().list(part='statistics', id=channel['id']).execute()
+        if response.get('items'):
+            channel['statistics'] = response['items'][0].get('statistics', {})
+        entry['stats_at'] = time.time()
+        self._store(entry)
+        return channel
+
+    def _store(self, entry):
+        self.cache.set(self._key(entry['channel']['id']), entry, ttl=CHANNEL_META_TTL)
+        if self.store is not None:
+            self.store.save(entry)
+
+    def invalidate(self, channel_id):
+        self.cache.delete(self._key(channel_id))
+
+
+def uploads_playlist_id(channel):
+    return channel['contentDetails']['relatedPlaylists']['uploads']
@@ -0,0 +1,454 @@
+import re
+import sys
+import base64
+import logging
+from datetime import datetime, timezone
+from functools import partial
+
+from db import get_connection
+from fanout import fanout, is_quota_error
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100  # commentThreads().list maximum, still 1 quota point per page
+MAX_NEW_PAGES = 5  # Pages of new threads to pull per video per sync
+BACKFILL_PAGES = 1  # Pages of older history to pull per video per sync
+COMMENTS_PAGE_SIZE = 100  # Comments per /api/comments response unless the client asks for fewer or more
+COMMENTS_MAX_RESULTS = 500
+THREAD_IDS_PER_CALL = 50  # Threads re-listed per commentThreads().list(id=...) call, 1 quota point
+SEARCH_MAX_RESULTS = 500
+
+
+class SearchError(ValueError):
+    pass
+
+
+class CommentStore:
+    """Persisted, merged comment threads plus per-video sync watermarks.
+
+    Every inserted or changed comment gets a per-channel sequence number, so
+    clients can poll with the last cursor they saw and receive only the delta.
+    Comment text and authors are also in an FTS5 index that triggers keep in
+    step with every merge, for search().
+    """
+
+    def __init__(self, db_name='comments'):
+        self.db_name = db_name
+        self._initialized = set()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(channel_id, comments) after every merge, with the parsed comments merged."""
+        self._listeners.append(listener)
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS comments (
+                    id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    author_display_name TEXT,
+                    author_profile_image_url TEXT,
+                    text_display TEXT,
+                    like_count INTEGER,
+                    published_at TEXT,
+                    updated_at TEXT,
+                    seq INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_comments_channel_seq ON comments (channel_id, seq);
+                CREATE INDEX IF NOT EXISTS idx_comments_video_published ON comments (video_id, published_at);
+                CREATE INDEX IF NOT EXISTS idx_comments_channel_published
+                    ON comments (channel_id, published_at, id);
+                -- Search filters, each ending in the (published_at, id) it pages by
+                CREATE INDEX IF NOT EXISTS idx_comments_channel_video
+                    ON comments (channel_id, video_id, published_at, id);
+                CREATE INDEX IF NOT EXISTS idx_comments_channel_author
+                    ON comments (channel_id, author_display_name, published_at, id);
+                -- External content: the index holds only tokens, rows stay in comments
+                CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+                    text_display, author_display_name,
+                    content='comments', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );
+                CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+                    INSERT INTO comments_fts (rowid, text_display, author_display_name)
+                    VALUES (new.rowid, new.text_display, new.author_display_name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS comments_fts_update
+                AFTER UPDATE OF text_display, author_display_name ON comments BEGIN
+                    INSERT INTO comments_fts (comments_fts, rowid, text_display, author_display_name)
+                    VALUES ('delete', old.rowid, old.text_display, old.author_display_name);
+                    INSERT INTO comments_fts (rowid, text_display, author_display_name)
+                    VALUES (new.rowid, new.text_display, new.author_display_name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+                    INSERT INTO comments_fts (comments_fts, rowid, text_display, author_display_name)
+                    VALUES ('delete', old.rowid, old.text_display, old.author_display_name);
+                END;
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    video_id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    newest_published_at TEXT,
+                    backfill_page_token TEXT,
+                    -- A walk down to the watermark that stopped at MAX_NEW_PAGES: where to resume it,
+                    -- and the newest publishedAt it has seen, which becomes the watermark once it ends
+                    resume_page_token TEXT,
+                    resume_newest_at TEXT,
+                    synced_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_watermarks_channel ON watermarks (channel_id, synced_at);
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def get_watermark(self, video_id):
+        row = self._conn().execute(
+            'SELECT * FROM watermarks WHERE video_id = ?', (video_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def set_watermark(self, channel_id, video_id, newest_published_at, backfill_page_token,
+                      resume_page_token=None, resume_newest_at=None):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO watermarks (video_id, channel_id, newest_published_at, backfill_page_token,
+                                        resume_page_token, resume_newest_at, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    newest_published_at = excluded.newest_published_at,
+                    backfill_page_token = excluded.backfill_page_token,
+                    resume_page_token = excluded.resume_page_token,
+                    resume_newest_at = excluded.resume_newest_at,
+                    synced_at = excluded.synced_at
+            ''', (video_id, channel_id, newest_published_at, backfill_page_token, resume_page_token,
+                  resume_newest_at, datetime.utcnow().isoformat()))
+
+    def stored_ids(self, comment_ids):
+        """The subset of comment_ids already in the store."""
+        if not comment_ids:
+            return set()
+        rows = self._conn().execute(
+            f'SELECT id FROM comments WHERE id IN ({",".join("?" * len(comment_ids))})', list(comment_ids)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def merge(self, channel_id, comments):
+        """Upsert comments; only new or changed rows get a new sequence number."""
+        if not comments:
+            return
+        conn = self._conn()
+        with conn:
+            # Take the write lock before reading MAX(seq) so concurrent syncs never reuse a number
+            conn.execute('BEGIN IMMEDIATE')
+            seq = conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM comments WHERE channel_id = ?', (channel_id,)
+            ).fetchone()[0]
+            rows = []
+            for comment in comments:
+                seq += 1
+                rows.append((
+                    comment['id'], channel_id, comment['videoId'],
+                    comment['authorDisplayName'], comment['authorProfileImageUrl'],
+                    comment['textDisplay'], comment['likeCount'],
+                    comment['publishedAt'], comment['updatedAt'], seq
+                ))
+            conn.executemany('''
+                INSERT INTO comments (id, channel_id, video_id, author_display_name, author_profile_image_url,
+                                      text_display, like_count, published_at, updated_at, seq)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    text_display = excluded.text_display,
+                    like_count = excluded.like_count,
+                    updated_at = excluded.updated_at,
+                    seq = excluded.seq
+                WHERE comments.updated_at != excluded.updated_at
+                   OR comments.like_count != excluded.like_count
+            ''', rows)
+        for listener in self._listeners:
+            try:
+                listener(channel_id, comments)
+            except Exception as e:
+                logger.warning(f'Comment listener failed for channel {channel_id}: {str(e)}')
+
+    def get_comments(self, channel_id, since=0, limit=COMMENTS_PAGE_SIZE):
+        """Return (Comment records, cursor, more).
+
+        Without since, the `limit` newest comments by publishedAt; the cursor
+        covers everything stored so far and more says whether there are older
+        comments (page through them with search()). With since, the first
+        `limit` merged after it; more says whether there is more after the
+        cursor, so poll again with it to get the rest.
+        """
+        conn = self._conn()
+        if not since:
+            # Read the cursor first: whatever is merged after it comes with the next poll
+            cursor = conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM comments WHERE channel_id = ?', (channel_id,)
+            ).fetchone()[0]
+            rows = conn.execute(f'''
+                SELECT {COMMENT_COLUMNS} FROM comments WHERE channel_id = ? AND seq <= ?
+                ORDER BY published_at DESC, id DESC LIMIT ?
+            ''', (channel_id, cursor, limit + 1)).fetchall()
+            return [Comment(*row) for row in rows[:limit]], cursor, len(rows) > limit
+
+        # One extra row says whether there is more
+        rows = conn.execute(f'''
+            SELECT {COMMENT_COLUMNS}, seq FROM comments WHERE channel_id = ? AND seq > ? ORDER BY seq LIMIT ?
+        ''', (channel_id, since, limit + 1)).fetchall()
+
+        comments = [Comment(*row[:-1]) for row in rows[:limit]]
+        cursor = rows[:limit][-1]['seq'] if rows else since
+        return comments, cursor, len(rows) > limit
+
+    def search(self, channel_id, query=None, video_id=None, author=None, published_after=None,
+               published_before=None, min_likes=None, max_likes=None, limit=50, cursor=None):
+        """Return (Comment records, next page cursor or None) matching every given filter, newest first.
+
+        query is free text matched against comment text and author names, the
+        last word as a prefix; published_after/before are inclusive
+        publishedAt timestamps, like the stored ones.
+        """
+        where, params = ['channel_id = ?'], [channel_id]
+        if query is not None:
+            # Matches come from the FTS index; the rest is filtered from the comments table
+            where.append('rowid IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)')
+            params.append(match_expression(query))
+        for clause, value in (('video_id = ?', video_id), ('author_display_name = ?', author),
+                              ('published_at >= ?', published_after), ('published_at <= ?', published_before),
+                              ('like_count >= ?', min_likes), ('like_count <= ?', max_likes)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        if cursor is not None:
+            where.append('(published_at, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        # One extra row says whether there is another page
+        rows = self._conn().execute(f'''
+            SELECT {COMMENT_COLUMNS} FROM comments WHERE {' AND '.join(where)}
+            ORDER BY published_at DESC, id DESC LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        comments = [Comment(*row) for row in rows[:limit]]
+        next_cursor = encode_cursor(comments[-1]) if len(rows) > limit else None
+        return comments, next_cursor
+
+    def synced_at(self, channel_id):
+        """When any of the channel's videos was last synced, or None."""
+        return self._conn().execute(
+            'SELECT MAX(synced_at) FROM watermarks WHERE channel_id = ?', (channel_id,)
+        ).fetchone()[0]
+
+    def has_comments(self, channel_id):
+        row = self._conn().execute(
+            'SELECT 1 FROM comments WHERE channel_id = ? LIMIT 1', (channel_id,)
+        ).fetchone()
+        return row is not None
+
+
+class Comment:
+    """A stored comment, as /api/comments returns it.
+
+    Slotted, with the strings that repeat across a channel's comments
+    interned, so holding thousands costs a fraction of the equivalent dicts.
+    """
+
+    __slots__ = ('id', 'video_id', 'author_display_name', 'author_profile_image_url', 'text_display',
+                 'like_count', 'published_at', 'updated_at')
+
+    def __init__(self, id, video_id, author_display_name, author_profile_image_url, text_display,
+                 like_count, published_at, updated_at):
+        self.id = id
+        self.video_id = sys.intern(video_id)
+        self.author_display_name = sys.intern(author_display_name or '')
+        self.author_profile_image_url = sys.intern(author_profile_image_url or '')
+        self.text_display = text_display
+        self.like_count = like_count
+        self.published_at = published_at
+        self.updated_at = updated_at
+
+
+# API field name -> Comment attribute, in response order
+COMMENT_FIELDS = {
+    'id': 'id',
+    'videoId': 'video_id',
+    'authorDisplayName': 'author_display_name',
+    'authorProfileImageUrl': 'author_profile_image_url',
+    'textDisplay': 'text_display',
+    'likeCount': 'like_count',
+    'publishedAt': 'published_at',
+    'updatedAt': 'updated_at'
+}
+COMMENT_COLUMNS = ', '.join(Comment.__slots__)
+
+
+def match_expression(query):
+    """FTS5 MATCH for free text: every word must appear, the last one as a prefix (search as you type).
+
+    Words are quoted, so FTS5 operators and column filters in the text are
+    searched for literally rather than interpreted.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        raise SearchError('q must contain at least one word')
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def encode_cursor(comment):
+    return base64.urlsafe_b64encode(f'{comment.published_at}|{comment.id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The (publishedAt, id) a page ended at."""
+    try:
+        published_at, comment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    except ValueError:
+        raise SearchError('Invalid cursor')
+    return published_at, comment_id
+
+
+def parse_timestamp(value):
+    """Normalize an ISO 8601 time to the stored publishedAt format (UTC, seconds), or None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise SearchError(f'Invalid timestamp: {value}')
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_thread(item, video_id):
+    """Flatten a commentThreads item into the shape /api/comments returns.
+
+    creatorReplied is whether the channel owner is among the replies included
+    with part=replies (YouTube includes only some of them).
+    """
+    snippet = item['snippet']
+    comment = snippet['topLevelComment']['snippet']
+    owner = snippet.get('channelId')
+    replies = item.get('replies', {}).get('comments', [])
+    return {
+        'id': item['id'],
+        'videoId': video_id,
+        'authorDisplayName': comment['authorDisplayName'],
+        'authorProfileImageUrl': comment['authorProfileImageUrl'],
+        'textDisplay': comment['textDisplay'],
+        'likeCount': comment['likeCount'],
+        'publishedAt': comment['publishedAt'],
+        'updatedAt': comment['updatedAt'],
+        'authorChannelId': comment.get('authorChannelId', {}).get('value'),
+        'totalReplyCount': snippet.get('totalReplyCount', 0),
+        'creatorReplied': owner is not None and any(
+            reply['snippet'].get('authorChannelId', {}).get('value') == owner for reply in replies
+        )
+    }
+
+
+class CommentSync:
+    """Fetches only comment threads newer than each video's watermark."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _list_threads(self, youtube, video_id, page_token=None):
+        params = {
+            'part': 'snippet,replies',  # Same quota cost; replies tell triage whether the creator answered
+            'videoId': video_id,
+            'maxResults': PAGE_SIZE,
+            'order': 'time',
+            'textFormat': 'html'
+        }
+        if page_token:
+            params['pageToken'] = page_token
+        return youtube.commentThreads().list(**params).execute()
+
+    def sync_video(self, youtube, channel_id, video_id):
+        """Merge new (and some older backfill) threads for one video; return the merged count.
+
+        New threads are walked newest first down to the watermark. A walk that
+        runs out of MAX_NEW_PAGES is resumed from its page token by the next
+        sync, and the watermark only moves once the walk has reached it, so a
+        burst of new threads is never skipped.
+        """
+        watermark = self.store.get_watermark(video_id)
+        newest_published = watermark['newest_published_at'] if watermark else None
+        backfill_token = watermark['backfill_page_token'] if watermark else None
+        page_token = watermark['resume_page_token'] if watermark else None
+        walk_newest = watermark['resume_newest_at'] if page_token else None
+
+        fetched = []
+        for _ in range(MAX_NEW_PAGES):
+            response = self._list_threads(youtube, video_id, page_token)
+            items = [parse_thread(item, video_id) for item in response.get('items', [])]
+            # order='time' is newest first; threads from the watermark's own second may or may not be stored
+            stored = self.store.stored_ids([c['id'] for c in items])
+            fetched.extend(c for c in items if c['id'] not in stored
+                           and (not newest_published or c['publishedAt'] >= newest_published))
+            walk_newest = max([walk_newest or ''] + [c['publishedAt'] for c in items]) or None
+            page_token = response.get('nextPageToken')
+
+            if watermark is None:
+                # First sync: keep the token so older history is backfilled gradually
+                backfill_token = page_token
+                page_token = None
+                break
+            if not page_token or newest_published and any(c['publishedAt'] < newest_published for c in items):
+                # Reached the threads stored by the last completed walk
+                page_token = None
+                break
+        if not page_token:
+            newest_published = max(newest_published or '', walk_newest or '') or None
+            walk_newest = None
+
+        for _ in range(BACKFILL_PAGES if watermark else 0):
+            if not backfill_token:
+                break
+            response = self._list_threads(youtube, video_id, backfill_token)
+            fetched.extend(parse_thread(item, video_id) for item in response.get('items', []))
+            backfill_token = response.get('nextPageToken')
+
+        self.store.merge(channel_id, fetched)
+        self.store.set_watermark(channel_id, video_id, newest_published, backfill_token, page_token, walk_newest)
+        return len(fetched)
+
+    def refresh_threads(self, youtube, channel_id, thread_ids):
+        """Re-list stored threads by ID and merge their current text, likes and replies.
+
+        Return the IDs YouTube still returned; the others were deleted or held for review.
+        """
+        found = set()
+        for start in range(0, len(thread_ids), THREAD_IDS_PER_CALL):
+            response = youtube.commentThreads().list(
+                part='snippet,replies',
+                id=','.join(thread_ids[start:start + THREAD_IDS_PER_CALL]),
+                textFormat='html'
+            ).execute()
+            comments = [parse_thread(item, item['snippet']['videoId']) for item in response.get('items', [])]
+            self.store.merge(channel_id, comments)
+            found.update(comment['id'] for comment in comments)
+        return found
+
+    def sync_channel(self, youtube, channel_id, video_ids):
+        """Sync videos concurrently, skipping failures and stopping at the first quota error."""
+        result = fanout.run(channel_id, {
+            video_id: partial(self.sync_video, youtube, channel_id, video_id)
+            for video_id in video_ids
+        })
+        for video_id, e in result.errors.items():
+            if is_quota_error(e):
+                logger.warning(f'Quota exceeded while syncing comments for video {video_id}')
+            else:
+                logger.warning(f'Error syncing comments for video {video_id}: {str(e)}')
+
+        merged = sum(result.results.values())
+        timings = ', '.join(f'{video_id}={ms:.0f}ms' for video_id, ms in result.timings.items())
+        logger.info(f'Merged {merged} new or changed comments for channel {channel_id}: '
+                    f'{result.summary()} [{timings}]')
+        return result
+
+comment_store = CommentStore()
+comment_sync = CommentSync(comment_store)
@@ -0,0 +1,188 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from refresh import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Refresh access tokens this long before they expire, so no request carries a dying token
+CREDENTIAL_REFRESH_MARGIN = int(os.getenv('CREDENTIAL_REFRESH_MARGIN', 5 * 60))
+REFRESH_LEASE_SECONDS = 30
+REFRESH_WAIT_SECONDS = 10  # How long to wait for another worker's refresh before doing our own
+REFRESH_POLL_SECONDS = 0.2
+MAX_CACHED_CREDENTIALS = 1000  # Users whose Credentials a worker keeps; the least recently used go first
+
+
+def credentials_info(credentials):
+    """The session representation of a Credentials object."""
+    return {
+        'token': credentials.token,
+        'refresh_token': credentials.refresh_token,
+        'token_uri': credentials.token_uri,
+        'client_id': credentials.client_id,
+        'client_secret': credentials.client_secret,
+        'scopes': credentials.scopes,
+        # Naive UTC, like Credentials.expiry; lets a rebuilt copy refresh ahead of expiry
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None
+    }
+
+
+def credentials_from_info(info, cls=Credentials):
+    """Build credentials from a credentials_info() dict (older sessions have no expiry)."""
+    info = dict(info)
+    expiry = info.pop('expiry', None)
+    return cls(**info, expiry=datetime.fromisoformat(expiry) if expiry else None)
+
+
+class ManagedCredentials(Credentials):
+    """Credentials whose refreshes, including the transport's 401 retries, go through a CredentialManager."""
+
+    manager = None
+    key = None
+
+    def refresh(self, request):
+        self.manager.refresh(self, request)
+
+
+class CredentialManager:
+    """One Credentials object per user per worker, refreshed ahead of expiry.
+
+    Concurrent refreshes for a user collapse into one per worker (single-flight)
+    and one across workers (a lease in the shared cache); the new token is
+    published in the cache so other workers adopt it instead of refreshing.
+    """
+
+    def __init__(self, cache, margin=CREDENTIAL_REFRESH_MARGIN):
+        self.cache = cache
+        self.margin = timedelta(seconds=margin)
+        self.flight = SingleFlight()
+        self._credentials = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, refresh_token):
+        # The refresh token identifies the grant and survives access token refreshes
+        return hashlib.sha256(refresh_token.encode()).hexdigest()[:32]
+
+    def get(self, info):
+        """Return usable credentials for a session's credentials dict."""
+        if not info.get('refresh_token'):
+            return credentials_from_info(info)
+
+        key = self._key(info['refresh_token'])
+        with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = self._build(key, info)
+            self._keep(key, credentials)
+
+        self._adopt_shared(credentials)
+        if self._expiring(credentials):
+            credentials.refresh(Request())
+        return credentials
+
+    def find(self, key):
+        """This worker's credentials for a key from get() or remember(), refreshed if expiring; None if it has none.
+
+        The key is what to store in place of the credentials themselves, e.g.
+        for background work done on a user's behalf.
+        """
+        with self._lock:
+            credentials = self._credentials.get(key)
+        if credentials is None:
+            return None
+        self._adopt_shared(credentials)
+        if self._expiring(credentials):
+            credentials.refresh(Request())
+        return credentials
+
+    def keys(self):
+        """Keys of the users whose credentials this worker holds."""
+        with self._lock:
+            return list(self._credentials)
+
+    def remember(self, credentials):
+        """Register freshly issued credentials (e.g. from the OAuth callback) and share them."""
+        if not credentials.refresh_token:
+            return credentials
+        key = self._key(credentials.refresh_token)
+        managed = self._build(key, credentials_info(credentials))
+        with self._lock:
+            self._keep(key, managed)
+        self._publish(managed)
+        return managed
+
+    def _build(self, key, info):
+        credentials = credentials_from_info(info, ManagedCredentials)
+        credentials.manager = self
+        credentials.key = key
+        return credentials
+
+    def _keep(self, key, credentials):
+        # Called with the lock held
+        self._credentials[key] = credentials
+        self._credentials.move_to_end(key)
+        while len(self._credentials) > MAX_CACHED_CREDENTIALS:
+            self._credentials.popitem(last=False)
+
+    def _expiring(self, credentials):
+        # Without a known expiry the transport still refreshes on a 401
+        return credentials.expiry is not None and credentials.expiry - self.margin <= datetime.utcnow()
+
+    def _shared_key(self, key):
+        return f'credentials:{key}'
+
+    def _adopt_shared(self, credentials):
+        """Take over a newer token another worker published; return True if one was adopted."""
+        shared = self.cache.get(self._shared_key(credentials.key))
+        if not shared:
+            return False
+        expiry = datetime.fromisoformat(shared['expiry'])
+        if credentials.expiry is not None and expiry <= credentials.expiry:
+            return False
+        credentials.token = shared['token']
+        credentials.expiry = expiry
+        return True
+
+    def _publish(self, credentials):
+        if credentials.expiry is None:
+            return
+        ttl = max(int((credentials.expiry - datetime.utcnow()).total_seconds()), 1)
+        self.cache.set(self._shared_key(credentials.key),
+                       {'token': credentials.token, 'expiry': credentials.expiry.isoformat()}, ttl=ttl)
+
+    def refresh(self, credentials, request):
+        """Refresh credentials once per user at a time, across threads and workers."""
+        self.flight.do(credentials.key, lambda: self._refresh(credentials, request))
+
+    def _refresh(self, credentials, request):
+        token = credentials.token
+        if self._adopt_shared(credentials) and not self._expiring(credentials):
+            return
+
+        lease_key = f'credentials-refresh:{credentials.key}'
+        lease = uuid.uuid4().hex
+        if not self.cache.add(lease_key, lease, ttl=REFRESH_LEASE_SECONDS):
+            # Another worker is refreshing; wait for it to publish the new token
+            deadline = time.time() + REFRESH_WAIT_SECONDS
+            while time.time() < deadline:
+                time.sleep(REFRESH_POLL_SECONDS)
+                if self._adopt_shared(credentials) and credentials.token != token:
+                    return
+            logger.warning('Timed out waiting for another worker to refresh credentials')
+
+        try:
+            Credentials.refresh(credentials, request)
+            self._publish(credentials)
+            logger.debug('Refreshed credentials')
+        finally:
+            # After a timed-out wait the lease is still the other worker's
+            self.cache.delete_if(lease_key, lease)
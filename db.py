@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+# Local state (comment store, shared cache, ...) lives in SQLite files here
+DATA_DIR = os.getenv('ECHOTUBE_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+BUSY_TIMEOUT = 30  # Seconds a statement waits for another worker's write lock before failing
+# Under gevent SQLite's own busy wait would block the OS thread, and with it every
+# greenlet in the process, so it waits this long at a time and sleeps cooperatively between tries
+COOPERATIVE_BUSY_TIMEOUT = 0.005
+COOPERATIVE_RETRY_SECONDS = 0.02
+
+_local = threading.local()
+_shared = {}
+
+
+def cooperative():
+    """True under the gevent worker, where "threads" are greenlets sharing one OS thread."""
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+class CooperativeConnection(sqlite3.Connection):
+    """A connection shared by greenlets that waits for locks without blocking the process.
+
+    A statement that finds the database locked is retried, sleeping in
+    between; under gevent that yields, so other greenlets keep running while
+    this one waits for another worker's write lock. A greenlet holds the
+    connection for a whole `with conn:` transaction, so no other greenlet's
+    statements can slip into it while it waits.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()  # Greenlet-aware once gevent has patched threading
+
+    def _retry(self, method, *args):
+        deadline = time.monotonic() + BUSY_TIMEOUT
+        with self._lock:
+            while True:
+                try:
+                    return method(*args)
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) or time.monotonic() >= deadline:
+                        raise
+                time.sleep(COOPERATIVE_RETRY_SECONDS)
+
+    def execute(self, *args):
+        return self._retry(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._retry(super().executemany, *args)
+
+    def executescript(self, *args):
+        return self._retry(super().executescript, *args)
+
+    def __enter__(self):
+        self._lock.acquire()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        try:
+            return super().__exit__(*exc_info)
+        finally:
+            self._lock.release()
+
+
+def get_connection(name):
+    """Return this thread's connection to the named SQLite database.
+
+    Under gevent every request is its own short-lived greenlet, so connections
+    are shared per process instead. Their busy wait is kept short and retried
+    cooperatively, and a transaction keeps the connection to its greenlet
+    (CooperativeConnection), so statements from different requests cannot
+    interleave.
+    """
+    shared = cooperative()
+    if shared:
+        connections = _shared
+    else:
+        connections = getattr(_local, 'connections', None)
+        if connections is None:
+            connections = _local.connections = {}
+
+    key = (os.getpid(), name)
+    conn = connections.get(key)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        path = os.path.join(DATA_DIR, f'{name}.db')
+        if shared:
+            conn = sqlite3.connect(path, timeout=COOPERATIVE_BUSY_TIMEOUT, check_same_thread=False,
+                                   factory=CooperativeConnection)
+        else:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        # WAL lets every gunicorn worker read while one of them writes
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        connections[key] = conn
+    return conn
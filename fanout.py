@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', 16))
+PER_USER_LIMIT = int(os.getenv('FANOUT_PER_USER_LIMIT', 4))
+
+
+def is_quota_error(e):
+    return 'quota' in str(e).lower()
+
+
+class FanOutResult:
+    """Outcome of one fan-out: results, failures and timings for tuning."""
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.timings = {}  # key -> milliseconds spent in the call
+        self.skipped = []  # keys never started because of a quota error
+        self.quota_exceeded = False
+        self.wall_ms = 0.0
+
+    def summary(self):
+        timings = sorted(self.timings.values())
+        slowest = timings[-1] if timings else 0.0
+        total = sum(timings)
+        return {
+            'calls': len(timings),
+            'errors': len(self.errors),
+            'skipped': len(self.skipped),
+            'quota_exceeded': self.quota_exceeded,
+            'wall_ms': round(self.wall_ms, 1),
+            'sum_call_ms': round(total, 1),
+            'max_call_ms': round(slowest, 1),
+            # >1 means calls overlapped; compare against the concurrency limit
+            'parallelism': round(total / self.wall_ms, 2) if self.wall_ms else 0.0
+        }
+
+
+class FanOut:
+    """Runs independent upstream calls on a shared thread pool.
+
+    Each user gets at most `per_user_limit` calls in flight, so one large
+    channel cannot take over the pool. After the first quota error no further
+    calls are started, matching the sequential loops this replaces.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, per_user_limit=PER_USER_LIMIT):
+        self.per_user_limit = per_user_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, user_key):
+        with self._lock:
+            semaphore = self._semaphores.get(user_key)
+            if semaphore is None:
+                semaphore = self._semaphores[user_key] = threading.BoundedSemaphore(self.per_user_limit)
+            return semaphore
+
+    def run(self, user_key, calls):
+        """Run `calls` (key -> zero-argument callable) and return a FanOutResult."""
+        result = FanOutResult()
+        semaphore = self._semaphore(user_key)
+        stop = threading.Event()
+        futures = []
+        start = time.perf_counter()
+
+        def call(key, fn):
+            try:
+                if stop.is_set():
+                    result.skipped.append(key)
+                    return
+                call_start = time.perf_counter()
+                try:
+                    result.results[key] = fn()
+                except Exception as e:
+                    result.errors[key] = e
+                    if is_quota_error(e):
+                        result.quota_exceeded = True
+                        stop.set()
+                finally:
+                    result.timings[key] = (time.perf_counter() - call_start) * 1000
+            finally:
+                semaphore.release()
+
+        for key, fn in calls.items():
+            # Waiting here (on the request thread) caps this user's in-flight calls
+            semaphore.acquire()
+            if stop.is_set():
+                semaphore.release()
+                result.skipped.append(key)
+                continue
+            # Carry the request's context along, so per-request timing sees pooled calls
+            futures.append(self._executor.submit(contextvars.copy_context().run, call, key, fn))
+
+        for future in futures:
+            future.result()
+
+        result.wall_ms = (time.perf_counter() - start) * 1000
+        return result
+
+
+fanout = FanOut()
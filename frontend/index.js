@@ -1,6 +1,9 @@
 // Constants
 const API_BASE_URL = 'http://localhost:5000';
 
+// Times to re-request hashtags after a background analysis finishes before giving up
+const HASHTAG_JOB_RETRIES = 3;
+
 // Basic fetch configuration
 const fetchConfig = {
     credentials: 'include',
@@ -24,7 +27,9 @@ let commentFilters = {
 let isAuthenticated = false;
 let videos = [];
 let statsUpdateInterval = null;
+let statsEventSource = null;
 let hashtagData = null;
+let hashtagEtag = null;
 let hashtagUpdateInterval = null;
 
 // Tab Management
@@ -41,9 +46,10 @@ function switchTab(tab) {
     currentTab = tab;
     
     // Handle live updates
-    if (tab === TABS.LIVE && !statsUpdateInterval) {
+    const liveUpdatesRunning = statsUpdateInterval || statsEventSource;
+    if (tab === TABS.LIVE && !liveUpdatesRunning) {
         startLiveUpdates();
-    } else if (tab !== TABS.LIVE && statsUpdateInterval) {
+    } else if (tab !== TABS.LIVE && liveUpdatesRunning) {
         stopLiveUpdates();
     }
     
@@ -644,10 +650,21 @@ async function handleReply(commentId) {
         return;
     }
     
+    // One key per reply: resubmitting the same text reuses it, so the server
+    // drops the duplicate (or retries it if it failed) instead of posting twice
+    if (replyInput.dataset.replyText !== replyText) {
+        replyInput.dataset.replyText = replyText;
+        replyInput.dataset.idempotencyKey = crypto.randomUUID();
+    }
+    
     try {
         const response = await fetch(`${API_BASE_URL}/api/reply`, {
             ...fetchConfig,
             method: 'POST',
+            headers: {
+                ...fetchConfig.headers,
+                'Idempotency-Key': replyInput.dataset.idempotencyKey
+            },
             body: JSON.stringify({
                 commentId,
                 replyText
@@ -659,10 +676,18 @@ async function handleReply(commentId) {
             throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
         }
         
-        // Clear the input
+        // Clear the input; the next reply gets a new key
         replyInput.value = '';
+        delete replyInput.dataset.replyText;
+        delete replyInput.dataset.idempotencyKey;
         
-        // Show success message
+        // The reply is queued and sent in the background
+        const { replyId, status } = await response.json();
+        showMessage('Reply queued');
+        if (status !== 'sent' && !(await waitForReply(replyId))) {
+            showMessage('Reply pending: it will be posted in the background');
+            return;
+        }
         showMessage('Reply posted successfully!');
         
         // Refresh comments to show the new reply
@@ -834,28 +859,31 @@ async function fetchLiveStats() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        const oldStats = channelStats;
-        channelStats = data;
-        
-        // Update the dashboard if we're on the live tab
-        if (currentTab === TABS.LIVE) {
-            if (oldStats) {
-                // Update individual elements to avoid full re-render
-                updateStatElement('subscriberCount', data.subscriberCount, oldStats.subscriberCount);
-                updateStatElement('viewCount', data.viewCount, oldStats.viewCount);
-                updateStatElement('videoCount', data.videoCount, oldStats.videoCount);
-                document.querySelector('.last-updated').textContent = `Last updated: ${new Date().toLocaleTimeString()}`;
-            } else {
-                createDashboard();
-            }
-        }
+        applyLiveStats(await response.json());
     } catch (error) {
         console.error('Error fetching live stats:', error);
         showError('Failed to fetch live statistics');
     }
 }
 
+function applyLiveStats(data) {
+    const oldStats = channelStats;
+    channelStats = data;
+    
+    // Update the dashboard if we're on the live tab
+    if (currentTab === TABS.LIVE) {
+        if (oldStats) {
+            // Update individual elements to avoid full re-render
+            updateStatElement('subscriberCount', data.subscriberCount, oldStats.subscriberCount);
+            updateStatElement('viewCount', data.viewCount, oldStats.viewCount);
+            updateStatElement('videoCount', data.videoCount, oldStats.videoCount);
+            document.querySelector('.last-updated').textContent = `Last updated: ${new Date().toLocaleTimeString()}`;
+        } else {
+            createDashboard();
+        }
+    }
+}
+
 function updateStatElement(id, newValue, oldValue) {
     const element = document.getElementById(id);
     if (!element) return;
@@ -900,11 +928,35 @@ function updateStatElement(id, newValue, oldValue) {
 }
 
 function startLiveUpdates() {
+    if (window.EventSource) {
+        // The server polls YouTube once per channel and pushes only what changed
+        statsEventSource = new EventSource(`${API_BASE_URL}/api/live-stats/stream`, { withCredentials: true });
+        statsEventSource.addEventListener('snapshot', event => applyLiveStats(JSON.parse(event.data)));
+        statsEventSource.addEventListener('update', event => {
+            applyLiveStats({ ...channelStats, ...JSON.parse(event.data) });
+        });
+        statsEventSource.onerror = () => {
+            // EventSource reconnects by itself unless the server refused the stream
+            if (statsEventSource && statsEventSource.readyState === EventSource.CLOSED) {
+                statsEventSource = null;
+                startLivePolling();
+            }
+        };
+        return;
+    }
+    startLivePolling();
+}
+
+function startLivePolling() {
     fetchLiveStats(); // Initial fetch
     statsUpdateInterval = setInterval(fetchLiveStats, 30000); // Update every 30 seconds
 }
 
 function stopLiveUpdates() {
+    if (statsEventSource) {
+        statsEventSource.close();
+        statsEventSource = null;
+    }
     if (statsUpdateInterval) {
         clearInterval(statsUpdateInterval);
         statsUpdateInterval = null;
@@ -980,7 +1032,7 @@ function createHashtagCard(hashtag, stats) {
     `;
 }
 
-async function fetchHashtags() {
+async function fetchHashtags(attempt = 0) {
     try {
         const response = await fetch(`${API_BASE_URL}/api/hashtags`, {
             ...fetchConfig,
@@ -991,8 +1043,23 @@ async function fetchHashtags() {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        hashtagData = data;
+        if (response.status === 202) {
+            // Analysis is running in the background; fetch again once it finishes
+            if (attempt >= HASHTAG_JOB_RETRIES) {
+                throw new Error('Hashtag analysis finished but its result is missing');
+            }
+            const job = await response.json();
+            await waitForJob(job.job_id);
+            return fetchHashtags(attempt + 1);
+        }
+        
+        // The browser revalidated with If-None-Match; skip re-rendering identical data
+        const etag = response.headers.get('ETag');
+        if (etag && etag === hashtagEtag) {
+            return;
+        }
+        hashtagEtag = etag;
+        hashtagData = await response.json();
         
         if (currentTab === TABS.HASHTAGS) {
             createDashboard();
@@ -1003,6 +1070,49 @@ async function fetchHashtags() {
     }
 }
 
+async function waitForJob(jobId, intervalMs = 2000, maxPolls = 150) {
+    for (let poll = 0; poll < maxPolls; poll++) {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const response = await fetch(`${API_BASE_URL}/api/jobs/${jobId}`, {
+            ...fetchConfig,
+            method: 'GET'
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const job = await response.json();
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Background job failed');
+        }
+        if (job.status === 'done') {
+            return job;
+        }
+    }
+    throw new Error('Timed out waiting for background job');
+}
+
+// Resolves to null if the reply is still queued after maxPolls, e.g. deferred until the quota resets
+async function waitForReply(replyId, intervalMs = 2000, maxPolls = 150) {
+    for (let poll = 0; poll < maxPolls; poll++) {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const response = await fetch(`${API_BASE_URL}/api/replies/${replyId}`, {
+            ...fetchConfig,
+            method: 'GET'
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const reply = await response.json();
+        if (reply.status === 'failed') {
+            throw new Error(reply.error || 'Reply could not be posted');
+        }
+        if (reply.status === 'sent') {
+            return reply;
+        }
+    }
+    return null;
+}
+
 function startHashtagUpdates() {
     fetchHashtags(); // Initial fetch
     hashtagUpdateInterval = setInterval(fetchHashtags, 300000); // Update every 5 minutes
@@ -0,0 +1,15 @@
+import os
+
+# ECHOTUBE_SERVER_MODE=threads (default) serves each request on one of a fixed
+# pool of threads; gevent serves each on a greenlet, so a worker can keep
+# hundreds of slow YouTube calls in flight without a thread per call.
+SERVER_MODE = os.getenv('ECHOTUBE_SERVER_MODE', 'threads')
+
+if SERVER_MODE == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('GEVENT_WORKER_CONNECTIONS', 1000))
+elif SERVER_MODE == 'threads':
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 32))
+else:
+    raise ValueError(f'Unknown ECHOTUBE_SERVER_MODE: {SERVER_MODE}')
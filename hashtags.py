@@ -0,0 +1,230 @@
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from refresh import SingleFlight
+from quota import method_cost, PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+HASHTAG_PATTERN = re.compile(r'#(\w+)')
+# Topic searches are not user-specific, so channels sharing a topic share the result
+TOPIC_SEARCH_TTL = int(os.getenv('TOPIC_SEARCH_TTL', 6 * 60 * 60))
+TOPIC_SEARCH_COST = method_cost('youtube.search.list') + method_cost('youtube.videos.list')
+
+
+def extract_hashtags(video):
+    """Return the lowercase hashtags in a video's title, description and #tags."""
+    snippet = video['snippet']
+    hashtags = HASHTAG_PATTERN.findall(snippet.get('description', '') + ' ' + snippet.get('title', ''))
+    hashtags.extend(tag[1:] for tag in snippet.get('tags', []) if tag.startswith('#'))
+    return [hashtag.lower() for hashtag in hashtags]
+
+
+class HashtagTable:
+    """Columnar hashtag occurrences: one row per (hashtag, video) pair."""
+
+    def __init__(self, names, hashtag_ids, video_index, titles, views, likes):
+        self.names = names  # hashtag id -> name, in order of first appearance
+        self.hashtag_ids = hashtag_ids
+        self.video_index = video_index
+        self.titles = titles
+        self.views = views
+        self.likes = likes
+
+    @classmethod
+    def from_videos(cls, videos):
+        ids = {}
+        names = []
+        hashtag_ids = []
+        video_index = []
+        titles = []
+        views = np.empty(len(videos), dtype=np.int64)
+        likes = np.empty(len(videos), dtype=np.int64)
+
+        for i, video in enumerate(videos):
+            titles.append(video['snippet'].get('title', ''))
+            views[i] = int(video['statistics'].get('viewCount', 0))
+            likes[i] = int(video['statistics'].get('likeCount', 0))
+            for hashtag in extract_hashtags(video):
+                hashtag_id = ids.get(hashtag)
+                if hashtag_id is None:
+                    hashtag_id = ids[hashtag] = len(names)
+                    names.append(hashtag)
+                hashtag_ids.append(hashtag_id)
+                video_index.append(i)
+
+        return cls(names, np.array(hashtag_ids, dtype=np.int64), np.array(video_index, dtype=np.int64),
+                   titles, views, likes)
+
+    def score(self, min_count=2, top_n=20, examples=3):
+        """Score hashtags in one grouped pass and return the top_n, best first."""
+        n_hashtags = len(self.names)
+        if n_hashtags == 0:
+            return []
+
+        views = self.views[self.video_index]
+        likes = self.likes[self.video_index]
+        counts = np.bincount(self.hashtag_ids, minlength=n_hashtags)
+        avg_views = np.bincount(self.hashtag_ids, weights=views, minlength=n_hashtags) / np.maximum(counts, 1)
+        avg_likes = np.bincount(self.hashtag_ids, weights=likes, minlength=n_hashtags) / np.maximum(counts, 1)
+
+        # Group occurrences by hashtag, most viewed first (ties keep input order)
+        order = np.lexsort((-views, self.hashtag_ids))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        view_p75 = self._grouped_p75(views[order], starts, counts)
+        like_order = np.lexsort((-likes, self.hashtag_ids))
+        like_p75 = self._grouped_p75(likes[like_order], starts, counts)
+
+        # Prevent division by zero
+        view_p75[view_p75 == 0] = 1
+        like_p75[like_p75 == 0] = 1
+
+        frequency = np.minimum(counts / 5, 1)
+        scores = (avg_views / view_p75) * 0.4 + (avg_likes / like_p75) * 0.3 + frequency * 0.3
+
+        eligible = np.flatnonzero(counts >= min_count)
+        ranked = eligible[np.argsort(-scores[eligible], kind='stable')][:top_n]
+
+        results = []
+        for hashtag_id in ranked:
+            start = starts[hashtag_id]
+            top = order[start:start + min(examples, counts[hashtag_id])]
+            results.append({
+                'hashtag': self.names[hashtag_id],
+                'score': float(scores[hashtag_id]),
+                'usage_count': int(counts[hashtag_id]),
+                'avg_views': int(avg_views[hashtag_id]),
+                'avg_likes': int(avg_likes[hashtag_id]),
+                'example_videos': [{
+                    'title': self.titles[self.video_index[row]],
+                    'views': int(views[row]),
+                    'likes': int(likes[row])
+                } for row in top]
+            })
+        return results
+
+    @staticmethod
+    def _grouped_p75(values_desc, starts, counts):
+        """75th percentile per group (linear interpolation, like np.percentile).
+
+        values_desc holds each group's values contiguously, largest first.
+        """
+        position = 0.75 * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        last = starts + counts - 1
+        # Ascending rank r sits at index last - r in a descending group
+        low_values = values_desc[np.maximum(last - lower, 0)]
+        high_values = values_desc[np.maximum(last - upper, 0)]
+        return low_values + (high_values - low_values) * (position - lower)
+
+
+def group_hashtags(top_hashtags):
+    """Group hashtags by effectiveness."""
+    return {
+        'trending': top_hashtags[:5],
+        'popular': top_hashtags[5:10],
+        'growing': top_hashtags[10:15],
+        'niche': top_hashtags[15:20]
+    }
+
+
+def compact_video(video):
+    """Keep only the fields hashtag scoring needs, so cached searches stay small."""
+    snippet = video['snippet']
+    statistics = video.get('statistics', {})
+    return {
+        'id': video['id'],
+        'snippet': {
+            'title': snippet.get('title', ''),
+            'description': snippet.get('description', ''),
+            'tags': [tag for tag in snippet.get('tags', []) if tag.startswith('#')]
+        },
+        'statistics': {
+            'viewCount': statistics.get('viewCount', 0),
+            'likeCount': statistics.get('likeCount', 0)
+        }
+    }
+
+
+class HashtagEngine:
+    """Topic searches shared across channels plus vectorized hashtag scoring."""
+
+    def __init__(self, cache, ledger):
+        self.cache = cache
+        self.ledger = ledger
+        self.flight = SingleFlight()
+
+    def search_topic(self, youtube, topic):
+        """Return popular recent videos for a topic, or None if the budget does not allow a search."""
+        key = f'topic-search:{topic}'
+        videos = self.cache.get(key)
+        if videos is not None:
+            return videos
+        # Searches are expensive; stop before eating into the moderation reserve
+        if not self.ledger.can_spend(TOPIC_SEARCH_COST, PRIORITY_LOW):
+            return None
+        return self.flight.do(key, lambda: self._search(youtube, topic, key))
+
+    def _search(self, youtube, topic, key):
+        search_response = youtube.search().list(
+            part='id',
+            q=topic,
+            type='video',
+            videoCategoryId='10',  # Music category
+            maxResults=50,
+            order='viewCount',
+            publishedAfter=(datetime.utcnow() - timedelta(days=90)).isoformat() + 'Z'
+        ).execute()
+
+        videos = []
+        video_ids = [item['id']['videoId'] for item in search_response.get('items', [])]
+        if video_ids:
+            # Get detailed video information
+            videos_response = youtube.videos().list(
+                part='snippet,statistics',
+                id=','.join(video_ids)
+            ).execute()
+            videos = [compact_video(video) for video in videos_response.get('items', [])]
+            logger.debug(f'Found {len(videos)} videos for topic {topic}')
+
+        self.cache.set(key, videos, ttl=TOPIC_SEARCH_TTL)
+        return videos
+
+    def analyze(self, youtube, channel):
+        """Build the /api/hashtags payload for a channel resource."""
+        channel_topics = channel.get('topicDetails', {}).get('topicCategories', [])
+        channel_keywords = channel.get('brandingSettings', {}).get('channel', {}).get('keywords', '').split(',')
+
+        # Extract topic IDs and clean keywords
+        topic_ids = [topic.split('/')[-1].lower() for topic in channel_topics]
+        keywords = [kw.strip().lower() for kw in channel_keywords if kw.strip()]
+
+        search_results = []
+        quota_limited = False
+        for topic in topic_ids + keywords[:3]:  # Use both topics and top keywords
+            try:
+                videos = self.search_topic(youtube, topic)
+            except Exception as e:
+                logger.warning(f'Error searching for topic {topic}: {str(e)}')
+                continue
+            if videos is None:
+                logger.warning('Skipping remaining hashtag searches, quota reserve reached')
+                quota_limited = True
+                break
+            search_results.extend(videos)
+
+        logger.debug(f'Analyzing {len(search_results)} videos for hashtags')
+        top_hashtags = HashtagTable.from_videos(search_results).score()
+
+        return {
+            'hashtags': group_hashtags(top_hashtags),
+            'channel_topics': [topic.split('/')[-1] for topic in channel_topics],
+            'updated_at': datetime.utcnow().isoformat(),
+            'quota_limited': quota_limited
+        }
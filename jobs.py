@@ -0,0 +1,138 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+JOB_RECORD_TTL = 60 * 60
+# Scheduled refreshes stop for channels nobody has looked at for this long
+SCHEDULE_IDLE_SECONDS = int(os.getenv('SCHEDULE_IDLE_SECONDS', 2 * 60 * 60))
+SCHEDULER_TICK_SECONDS = 5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class _Schedule:
+    def __init__(self, fn, interval, owner):
+        self.fn = fn
+        self.interval = interval
+        self.owner = owner
+        self.next_run = time.time() + interval
+        self.last_seen = time.time()
+
+
+class JobQueue:
+    """Runs slow upstream work on a worker pool, one job per key at a time.
+
+    Job records live in a shared SQLite cache that is never evicted, so any
+    gunicorn worker can answer a status poll, and a lease per key keeps two
+    workers from running the same job.
+    """
+
+    def __init__(self, cache, max_workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS):
+        self.cache = cache
+        self.lease_seconds = lease_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jobs')
+        self._active = {}  # key -> job id, for jobs queued or running in this process
+        self._schedules = {}
+        self._lock = threading.Lock()
+        self._scheduler = None
+
+    def submit(self, key, fn, owner=None):
+        """Enqueue fn under key, or return the job already queued or running for it."""
+        with self._lock:
+            job_id = self._active.get(key)
+        if job_id:
+            return self.get(job_id)
+
+        job_id = uuid.uuid4().hex
+        lease_key = f'job-key:{key}'
+        if not self.cache.add(lease_key, job_id, ttl=self.lease_seconds):
+            existing = self.cache.get(lease_key)
+            record = self.get(existing) if existing else None
+            if record:
+                return record
+
+        record = {
+            'id': job_id,
+            'key': key,
+            'owner': owner,
+            'status': QUEUED,
+            'createdAt': datetime.utcnow().isoformat(),
+            'startedAt': None,
+            'finishedAt': None,
+            'error': None
+        }
+        self._save(record)
+        with self._lock:
+            self._active[key] = job_id
+        self._executor.submit(self._run, dict(record), fn)
+        return record
+
+    def _run(self, record, fn):
+        record['status'] = RUNNING
+        record['startedAt'] = datetime.utcnow().isoformat()
+        self._save(record)
+        start = time.perf_counter()
+        try:
+            fn()
+            record['status'] = DONE
+        except Exception as e:
+            logger.warning(f'Job {record["key"]} failed: {str(e)}')
+            record['status'] = FAILED
+            record['error'] = str(e)
+        finally:
+            record['finishedAt'] = datetime.utcnow().isoformat()
+            record['durationMs'] = round((time.perf_counter() - start) * 1000, 1)
+            self._save(record)
+            with self._lock:
+                self._active.pop(record['key'], None)
+            # Only our own lease: if it ran out, another worker may hold the key now
+            self.cache.delete_if(f'job-key:{record["key"]}', record['id'])
+
+    def _save(self, record):
+        self.cache.set(f'job:{record["id"]}', dict(record), ttl=JOB_RECORD_TTL)
+
+    def get(self, job_id):
+        return self.cache.get(f'job:{job_id}')
+
+    def schedule(self, key, fn, interval, owner=None):
+        """Run fn under key every interval seconds while someone keeps asking for it.
+
+        Calling again replaces fn (e.g. with fresher credentials) and resets the idle timer.
+        """
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                self._schedules[key] = _Schedule(fn, interval, owner)
+            else:
+                schedule.fn = fn
+                schedule.interval = interval
+                schedule.last_seen = time.time()
+            if self._scheduler is None or not self._scheduler.is_alive():
+                self._scheduler = threading.Thread(target=self._run_scheduler, name='job-scheduler', daemon=True)
+                self._scheduler.start()
+
+    def _run_scheduler(self):
+        while True:
+            now = time.time()
+            due = []
+            with self._lock:
+                for key, schedule in list(self._schedules.items()):
+                    if now - schedule.last_seen > SCHEDULE_IDLE_SECONDS:
+                        del self._schedules[key]
+                    elif schedule.next_run <= now:
+                        schedule.next_run = now + schedule.interval
+                        due.append((key, schedule))
+            for key, schedule in due:
+                self.submit(key, schedule.fn, schedule.owner)
+            time.sleep(SCHEDULER_TICK_SECONDS)
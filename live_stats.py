@@ -0,0 +1,127 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATS_INTERVAL = int(os.getenv('LIVE_STATS_INTERVAL', 30))
+SUBSCRIBER_QUEUE_SIZE = 16
+POLL_TICK_SECONDS = 1
+
+
+def live_stats_payload(channel):
+    """Shape a channel resource the way /api/live-stats returns it."""
+    stats = channel.get('statistics', {})
+    return {
+        'subscriberCount': stats.get('subscriberCount', '0'),
+        'viewCount': stats.get('viewCount', '0'),
+        'videoCount': stats.get('videoCount', '0'),
+        'channelName': channel['snippet']['title'],
+        'channelThumbnail': channel['snippet']['thumbnails'].get('default', {}).get('url', '')
+    }
+
+
+class _Channel:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.subscribers = set()
+        self.last = None
+        self.next_poll = 0
+
+
+class LiveStatsHub:
+    """Polls each watched channel once per interval and pushes changes to subscribers.
+
+    However many tabs are open, a channel costs one upstream lookup per interval
+    per worker; subscribers receive a snapshot first and then only changed fields.
+    """
+
+    def __init__(self, fetch, interval=LIVE_STATS_INTERVAL, max_workers=8):
+        self.fetch = fetch  # fetch(channel_id, credentials) -> payload or None
+        self.interval = interval
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='live-stats')
+
+    def subscribe(self, channel_id, credentials):
+        """Register a subscriber and return the queue its events arrive on."""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = _Channel(credentials)
+            channel.credentials = credentials  # Keep the most recently refreshed token
+            channel.subscribers.add(subscriber)
+            snapshot = channel.last
+        if snapshot is not None:
+            subscriber.put_nowait(('snapshot', snapshot))
+        self._ensure_running()
+        return subscriber
+
+    def unsubscribe(self, channel_id, subscriber):
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers:
+                del self._channels[channel_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='live-stats-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            now = time.time()
+            with self._lock:
+                due = [(channel_id, channel) for channel_id, channel in self._channels.items()
+                       if channel.next_poll <= now]
+                for _, channel in due:
+                    channel.next_poll = now + self.interval
+            for channel_id, channel in due:
+                self._executor.submit(self._poll, channel_id, channel)
+            time.sleep(POLL_TICK_SECONDS)
+
+    def _poll(self, channel_id, channel):
+        try:
+            payload = self.fetch(channel_id, channel.credentials)
+        except Exception as e:
+            logger.warning(f'Error polling live stats for channel {channel_id}: {str(e)}')
+            return
+        if payload is None:
+            return
+
+        if channel.last is None:
+            event = ('snapshot', payload)
+        else:
+            changed = {key: value for key, value in payload.items() if channel.last.get(key) != value}
+            event = ('update', changed) if changed else None
+        channel.last = payload
+        if event is not None:
+            self._publish(channel, event)
+
+    def _publish(self, channel, event):
+        with self._lock:
+            subscribers = list(channel.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A slow client missed updates; replace its backlog with the full state
+                while not subscriber.empty():
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(('snapshot', channel.last))
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from googleapiclient.errors import HttpError
+
+from db import get_connection
+from quota import method_cost
+
+logger = logging.getLogger(__name__)
+
+# Seconds between each worker publishing its counters for /metrics to aggregate
+METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', 15))
+# Workers that have not published for this long (restarted, scaled down) are dropped
+METRICS_WORKER_RETENTION = 24 * 60 * 60
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HISTOGRAMS = {
+    'echotube_request_duration_seconds': 'Time to produce a response, by route and status',
+    'echotube_request_phase_seconds': 'Time a request spent in each phase (cache, credentials, upstream, serialize)',
+    'echotube_upstream_request_duration_seconds': 'YouTube Data API call latency, by method and status',
+}
+COUNTERS = {
+    'echotube_upstream_quota_units_total': 'Quota units spent on YouTube Data API calls, by method',
+}
+
+_current = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """Seconds and call counts per phase for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}  # phase -> [seconds, count]
+
+    def add(self, phase, seconds):
+        totals = self.phases.setdefault(phase, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total):
+        """Server-Timing header value; upstream is summed over calls, which may have run in parallel."""
+        entries = []
+        for phase, (seconds, count) in self.phases.items():
+            entry = f'{phase};dur={seconds * 1000:.1f}'
+            if count > 1:
+                entry += f';desc="{count} calls"'
+            entries.append(entry)
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+def start_request():
+    """Start timing the current request; phases recorded from this context are attributed to it."""
+    timer = RequestTimer()
+    _current.set(timer)
+    return timer
+
+
+def end_request():
+    _current.set(None)
+
+
+def current_timer():
+    return _current.get()
+
+
+@contextmanager
+def request_phase(phase):
+    """Add the time spent in the block to the current request's `phase`, if timing one."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer = _current.get()
+        if timer is not None:
+            timer.add(phase, time.perf_counter() - start)
+
+
+def upstream_status(request, error):
+    if error is None:
+        return '304' if request.not_modified else '200'
+    if isinstance(error, HttpError):
+        return str(error.resp.status)
+    return 'error'
+
+
+class Metrics:
+    """Prometheus-style histograms and counters, aggregated across workers.
+
+    Observations only touch this worker's in-memory series; every worker
+    publishes a snapshot to SQLite every METRICS_FLUSH_SECONDS, and render()
+    sums the latest snapshot of each worker.
+    """
+
+    def __init__(self, db_name='metrics', flush_seconds=METRICS_FLUSH_SECONDS, buckets=LATENCY_BUCKETS):
+        self.db_name = db_name
+        self.flush_seconds = flush_seconds
+        self.buckets = buckets
+        self._initialized = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._histograms = {}  # (name, labels) -> per-bucket counts, +Inf count, then sum
+        self._counters = {}  # (name, labels) -> value
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS worker_metrics (
+                    worker TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL,
+                    snapshot TEXT NOT NULL
+                )
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def _ensure_worker(self):
+        # Called with the lock held; a forked worker starts its own series and flusher
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker = f'{self._pid}-{time.time():.0f}'
+            self._histograms = {}
+            self._counters = {}
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._ensure_worker()
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._ensure_worker()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def on_request(self, request, elapsed, error):
+        """youtube_client listener: time and cost every upstream call."""
+        method = request.methodId or 'unknown'
+        self.observe('echotube_upstream_request_duration_seconds', elapsed,
+                     method=method, status=upstream_status(request, error))
+        self.inc('echotube_upstream_quota_units_total', method_cost(method), method=method)
+        timer = _current.get()
+        if timer is not None:
+            timer.add('upstream', elapsed)
+
+    def observe_request(self, route, status, timer):
+        total = timer.elapsed()
+        self.observe('echotube_request_duration_seconds', total, route=route, status=str(status))
+        for phase, (seconds, _) in timer.phases.items():
+            self.observe('echotube_request_phase_seconds', seconds, route=route, phase=phase)
+        return total
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            }
+
+    def flush(self):
+        """Publish this worker's series for render() in any worker."""
+        if self._worker is None:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO worker_metrics (worker, updated_at, snapshot) VALUES (?, ?, ?)
+                ON CONFLICT(worker) DO UPDATE SET updated_at = excluded.updated_at, snapshot = excluded.snapshot
+            ''', (self._worker, time.time(), json.dumps(self._snapshot())))
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f'Failed to publish metrics: {str(e)}')
+
+    def collect(self):
+        """Return (histograms, counters) summed over every live worker's latest snapshot."""
+        self.flush()
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM worker_metrics WHERE updated_at < ?',
+                         (time.time() - METRICS_WORKER_RETENTION,))
+        histograms, counters = {}, {}
+        for row in conn.execute('SELECT snapshot FROM worker_metrics').fetchall():
+            snapshot = json.loads(row['snapshot'])
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                total = histograms.get(key)
+                histograms[key] = series if total is None else [a + b for a, b in zip(total, series)]
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        histograms, counters = self.collect()
+        lines = []
+        for name, description in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_labels(labels, le=le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {series[-1]:.6f}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        for name, description in COUNTERS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+metrics = Metrics()
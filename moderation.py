@@ -0,0 +1,129 @@
+import os
+import logging
+
+from fanout import is_quota_error
+
+logger = logging.getLogger(__name__)
+
+# action -> (moderationStatus, banAuthor); like/heart map to what the single-comment routes send
+MODERATION_ACTIONS = {
+    'like': ('published', False),
+    'unlike': ('published', False),
+    'heart': ('published', False),
+    'unheart': ('published', False),
+    'publish': ('published', False),
+    'hold': ('heldForReview', False),
+    'reject': ('rejected', False),
+    'reject_and_ban': ('rejected', True),
+}
+MAX_IDS_PER_CALL = 50  # setModerationStatus costs 50 units per call, however many IDs it carries
+MAX_ITEMS_PER_REQUEST = 1000
+MODERATION_DEDUPE_SECONDS = int(os.getenv('MODERATION_DEDUPE_SECONDS', 60))
+
+
+class ModerationBatcher:
+    """Applies many comment moderation actions with as few upstream calls as possible.
+
+    Actions are grouped by resulting status into multi-ID setModerationStatus
+    calls, and those calls are sent together in one HTTP batch. A batch runs
+    its calls in no set order, so only the last action requested for a
+    comment is sent; earlier ones with another outcome are superseded.
+    """
+
+    def __init__(self, cache, dedupe_seconds=MODERATION_DEDUPE_SECONDS):
+        self.cache = cache
+        self.dedupe_seconds = dedupe_seconds
+
+    def moderate(self, youtube, channel_id, items):
+        """Apply [{'commentId', 'action'}] items and return one result per item, in order."""
+        results = [{'commentId': item.get('commentId'), 'action': item.get('action')} for item in items]
+        groups = {}  # (status, ban) -> {comment_id: [result, ...]}
+        last_action = {result['commentId']: result['action'] for result in results
+                       if result['commentId'] and result['action'] in MODERATION_ACTIONS}
+
+        for result in results:
+            comment_id, action = result['commentId'], result['action']
+            if not comment_id or action not in MODERATION_ACTIONS:
+                result.update(success=False, error='commentId and a valid action are required')
+                continue
+            outcome = MODERATION_ACTIONS[action]
+            if outcome != MODERATION_ACTIONS[last_action[comment_id]]:
+                result.update(success=False, superseded=True,
+                              error=f'Superseded by a later {last_action[comment_id]} of this comment')
+                continue
+            group = groups.setdefault(outcome, {})
+            if comment_id in group:
+                # Same outcome already requested for this comment in this batch
+                group[comment_id].append(result)
+                continue
+            # Shared cache, so repeats from another tab or worker inside the window are dropped too.
+            # It holds the last action requested per comment: hold, publish, hold across requests sends both holds.
+            key = f'moderation:{channel_id}:{comment_id}'
+            action = last_action[comment_id]
+            if self.cache.get(key) == action:
+                result.update(success=True, deduplicated=True)
+                continue
+            self.cache.set(key, action, ttl=self.dedupe_seconds)
+            group[comment_id] = [result]
+
+        calls = []
+        for (status, ban_author), by_comment in groups.items():
+            comment_ids = list(by_comment)
+            for start in range(0, len(comment_ids), MAX_IDS_PER_CALL):
+                chunk = comment_ids[start:start + MAX_IDS_PER_CALL]
+                request = youtube.comments().setModerationStatus(
+                    id=','.join(chunk),
+                    moderationStatus=status,
+                    banAuthor=ban_author
+                )
+                calls.append((request, [r for comment_id in chunk for r in by_comment[comment_id]]))
+
+        if calls:
+            errors = self._execute(youtube, [request for request, _ in calls])
+            for (_, call_results), error in zip(calls, errors):
+                for result in call_results:
+                    if error is None:
+                        result['success'] = True
+                    else:
+                        result.update(success=False, error=str(error))
+                        # Let the user retry right away instead of waiting out the window
+                        self.cache.delete(f'moderation:{channel_id}:{result["commentId"]}')
+
+        logger.info(f'Moderated {len(items)} items for channel {channel_id} in {len(calls)} upstream calls')
+        return results
+
+    def _execute(self, youtube, requests):
+        """Execute requests as one HTTP batch; return one error (or None) per request.
+
+        If the batch itself fails, only the parts it never answered are sent
+        again one by one, so none is applied (or charged) twice.
+        """
+        if len(requests) == 1:
+            return [self._execute_one(requests[0])]
+
+        errors = [None] * len(requests)
+        answered = [False] * len(requests)
+
+        def callback(request_id, response, exception):
+            errors[int(request_id)] = exception
+            answered[int(request_id)] = True
+
+        try:
+            batch = youtube.new_batch_http_request(callback=callback)
+            for i, request in enumerate(requests):
+                batch.add(request, request_id=str(i))
+            batch.execute()
+            return errors
+        except Exception as e:
+            if is_quota_error(e):
+                return [e] * len(requests)
+            logger.warning(f'Batch moderation request failed, sending calls individually: {str(e)}')
+
+        return [errors[i] if answered[i] else self._execute_one(request) for i, request in enumerate(requests)]
+
+    def _execute_one(self, request):
+        try:
+            request.execute()
+            return None
+        except Exception as e:
+            return e
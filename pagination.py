@@ -0,0 +1,114 @@
+import os
+import logging
+
+from comment_sync import parse_thread, PAGE_SIZE
+from fanout import is_quota_error
+from quota import PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+UPLOADS_PAGE_SIZE = 50  # playlistItems().list and videos().list(id=...) maximum
+# Upper bound on upstream pages one streamed response may fetch (1 quota point each)
+STREAM_MAX_PAGES = int(os.getenv('STREAM_MAX_PAGES', 500))
+
+
+class PageBudget:
+    """Counts pages fetched for one streamed response and stops at a limit.
+
+    With a ledger it also stops once another page would not fit in the
+    day's quota at `priority`, so a long stream cannot eat into the reserve.
+    """
+
+    def __init__(self, max_pages=STREAM_MAX_PAGES, ledger=None, priority=PRIORITY_LOW):
+        self.max_pages = max_pages
+        self.ledger = ledger
+        self.priority = priority
+        self.pages = 0
+
+    @property
+    def exhausted(self):
+        if self.pages >= self.max_pages:
+            return True
+        return self.ledger is not None and not self.ledger.can_spend(1, self.priority)
+
+    def spend(self):
+        self.pages += 1
+
+
+def iter_pages(list_method, budget=None, **params):
+    """Yield each response of a list call, following nextPageToken until the last page."""
+    page_token = None
+    while budget is None or not budget.exhausted:
+        if page_token:
+            params['pageToken'] = page_token
+        response = list_method(**params).execute()
+        if budget is not None:
+            budget.spend()
+        yield response
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def iter_upload_ids(youtube, playlist_id, budget=None):
+    """Yield the uploads playlist one page of video IDs at a time, newest first."""
+    for response in iter_pages(youtube.playlistItems().list, budget,
+                               part='contentDetails', playlistId=playlist_id, maxResults=UPLOADS_PAGE_SIZE):
+        yield [item['contentDetails']['videoId'] for item in response.get('items', [])]
+
+
+def video_summary(item):
+    """Shape a videos().list item (snippet + statistics) the way /api/videos returns it."""
+    snippet = item['snippet']
+    stats = item.get('statistics', {})
+    thumbnails = snippet.get('thumbnails', {})
+    return {
+        'id': item['id'],
+        'title': snippet['title'],
+        'description': snippet.get('description', ''),
+        'thumbnail': thumbnails.get('high', thumbnails.get('default', {})).get('url', ''),
+        'publishedAt': snippet.get('publishedAt'),
+        'viewCount': int(stats.get('viewCount', 0)),
+        'likeCount': int(stats.get('likeCount', 0)),
+        'commentCount': int(stats.get('commentCount', 0))
+    }
+
+
+def iter_videos(youtube, playlist_id, budget=None):
+    """Yield pages of video summaries for every upload (2 quota points per 50 videos)."""
+    for video_ids in iter_upload_ids(youtube, playlist_id, budget):
+        if not video_ids:
+            continue
+        response = youtube.videos().list(part='snippet,statistics', id=','.join(video_ids)).execute()
+        if budget is not None:
+            budget.spend()
+        # videos().list does not promise playlist order
+        by_id = {item['id']: item for item in response.get('items', [])}
+        yield [video_summary(by_id[video_id]) for video_id in video_ids if video_id in by_id]
+
+
+def iter_comment_pages(youtube, video_id, budget=None):
+    """Yield every page of a video's comment threads, newest first, as /api/comments records."""
+    for response in iter_pages(youtube.commentThreads().list, budget, part='snippet,replies', videoId=video_id,
+                               maxResults=PAGE_SIZE, order='time', textFormat='html'):
+        yield [parse_thread(item, video_id) for item in response.get('items', [])]
+
+
+def iter_channel_comments(youtube, channel_id, playlist_id, store, budget=None):
+    """Yield pages of comments across all uploads, merging each page into the comment store.
+
+    A video whose comments cannot be listed (e.g. disabled) is skipped; a quota
+    error ends the walk.
+    """
+    for video_ids in iter_upload_ids(youtube, playlist_id, budget):
+        for video_id in video_ids:
+            try:
+                for comments in iter_comment_pages(youtube, video_id, budget):
+                    store.merge(channel_id, comments)
+                    yield comments
+            except Exception as e:
+                if is_quota_error(e):
+                    raise
+                logger.warning(f'Skipping comments for video {video_id}: {str(e)}')
+            if budget is not None and budget.exhausted:
+                return
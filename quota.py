@@ -0,0 +1,144 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# YouTube Data API quota resets at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+QUOTA_DAILY_LIMIT = int(os.getenv('QUOTA_DAILY_LIMIT', 10000))
+# Units that low-priority work (hashtag searches, background refreshes) may not touch,
+# so comment moderation and replies keep working late in the day
+QUOTA_RESERVE = int(os.getenv('QUOTA_RESERVE', 1500))
+
+# Unit cost per API method, from the YouTube Data API quota calculator
+QUOTA_COSTS = {
+    'youtube.search.list': 100,
+    'youtube.comments.insert': 50,
+    'youtube.comments.update': 50,
+    'youtube.comments.delete': 50,
+    'youtube.comments.setModerationStatus': 50,
+    'youtube.commentThreads.insert': 50,
+    'youtube.videos.update': 50,
+    'youtube.videos.rate': 50,
+    'youtube.videos.insert': 1600,
+}
+
+PRIORITY_HIGH = 'high'
+PRIORITY_LOW = 'low'
+
+
+def method_cost(method_id):
+    """Return the quota units one call to method_id costs."""
+    if method_id in QUOTA_COSTS:
+        return QUOTA_COSTS[method_id]
+    if method_id and method_id.endswith('.list'):
+        return 1
+    return 50  # Other write operations
+
+
+def quota_day(now=None):
+    """Return the Pacific calendar day the quota is currently counted against."""
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    return now.astimezone(QUOTA_TIMEZONE).date().isoformat()
+
+
+def next_reset(now=None):
+    now = (now or datetime.now(QUOTA_TIMEZONE)).astimezone(QUOTA_TIMEZONE)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TIMEZONE)
+    return midnight
+
+
+class QuotaLedger:
+    """Records the unit cost of every upstream call per channel and Pacific day.
+
+    Kept in SQLite so every gunicorn worker spends from the same budget.
+    """
+
+    def __init__(self, db_name='quota', daily_limit=QUOTA_DAILY_LIMIT, reserve=QUOTA_RESERVE):
+        self.db_name = db_name
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS quota_ledger (
+                    day TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    units INTEGER NOT NULL,
+                    PRIMARY KEY (day, channel_id, method)
+                )
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def record(self, channel_id, method_id, calls=1):
+        """Add the cost of `calls` calls to method_id to today's ledger."""
+        units = method_cost(method_id) * calls
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO quota_ledger (day, channel_id, method, calls, units) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(day, channel_id, method) DO UPDATE SET
+                    calls = calls + excluded.calls,
+                    units = units + excluded.units
+            ''', (quota_day(), channel_id or 'unknown', method_id or 'unknown', calls, units))
+        return units
+
+    def used(self, channel_id=None, day=None):
+        """Units used today, for one channel or (by default) the whole project."""
+        query = 'SELECT COALESCE(SUM(units), 0) FROM quota_ledger WHERE day = ?'
+        params = [day or quota_day()]
+        if channel_id:
+            query += ' AND channel_id = ?'
+            params.append(channel_id)
+        return self._conn().execute(query, params).fetchone()[0]
+
+    def remaining(self):
+        return max(self.daily_limit - self.used(), 0)
+
+    def can_spend(self, units, priority=PRIORITY_HIGH):
+        """True if `units` fit in today's budget; low priority work must leave the reserve."""
+        available = self.remaining()
+        if priority == PRIORITY_LOW:
+            available -= self.reserve
+        return units <= available
+
+    def summary(self, channel_id=None):
+        day = quota_day()
+        rows = self._conn().execute('''
+            SELECT channel_id, method, calls, units FROM quota_ledger WHERE day = ? ORDER BY units DESC
+        ''', (day,)).fetchall()
+        by_method = [
+            {'method': row['method'], 'calls': row['calls'], 'units': row['units']}
+            for row in rows if channel_id is None or row['channel_id'] == channel_id
+        ]
+        used = self.used()
+        return {
+            'day': day,
+            'resetAt': next_reset().isoformat(),
+            'dailyLimit': self.daily_limit,
+            'reserve': self.reserve,
+            'used': used,
+            'remaining': max(self.daily_limit - used, 0),
+            'channelUsed': sum(item['units'] for item in by_method) if channel_id else used,
+            'byMethod': by_method
+        }
+
+    def on_request(self, request, elapsed, error):
+        """youtube_client listener: charge every executed call to its channel."""
+        # Requests rejected for quota were never charged
+        if error is not None and 'quota' in str(error).lower():
+            return
+        self.record(request.owner.channel_id, request.methodId)
+
+
+ledger = QuotaLedger()
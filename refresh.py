@@ -0,0 +1,67 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn once per key at a time; concurrent callers share its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+
+class Revalidator:
+    """Refreshes stale cache entries in the background, once per key.
+
+    Background refreshes run on the job queue, which dedupes them within and
+    across workers; foreground misses for the same key share one call.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.flight = SingleFlight()
+
+    def refresh(self, key, fn):
+        """Run fn now, sharing the call with any concurrent refresh of key."""
+        return self.flight.do(key, fn)
+
+    def refresh_in_background(self, key, fn, owner=None):
+        """Queue fn unless key is already being refreshed; return the job record."""
+        if self.flight.in_flight(key):
+            return None
+        return self.jobs.submit(key, lambda: self.flight.do(key, fn), owner)
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from datetime import datetime
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from db import get_connection
+from fanout import is_quota_error
+from quota import method_cost, next_reset, PRIORITY_HIGH
+from youtube_client import get_client
+
+logger = logging.getLogger(__name__)
+
+REPLY_SENDS_PER_SECOND = float(os.getenv('REPLY_SENDS_PER_SECOND', 2))
+REPLY_MAX_ATTEMPTS = int(os.getenv('REPLY_MAX_ATTEMPTS', 8))
+REPLY_BACKOFF_BASE = 2  # Seconds before the first retry; doubles per attempt
+REPLY_BACKOFF_MAX = 15 * 60
+REPLY_LEASE_SECONDS = 120  # A send not finished in this long is assumed to have died with its worker
+REPLY_COST = method_cost('youtube.comments.insert')
+SENDER_IDLE_SECONDS = 1
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+RETRYABLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'backendError'}
+
+
+def error_reason(e):
+    """Return the first error reason of an HttpError, e.g. 'rateLimitExceeded'."""
+    details = getattr(e, 'error_details', None)
+    if isinstance(details, list) and details and isinstance(details[0], dict):
+        return details[0].get('reason')
+    return None
+
+
+def classify_error(e):
+    """Return (retryable, ambiguous) for a failed comments().insert.
+
+    Ambiguous failures may have reached YouTube, so the reply could already be
+    posted and has to be looked up before sending it again.
+    """
+    if isinstance(e, HttpError):
+        status = e.resp.status
+        if status == 429:
+            return True, False
+        if status >= 500:
+            return True, True
+        if status == 403:
+            return error_reason(e) in RETRYABLE_REASONS, False
+        return False, False
+    # Timeouts and dropped connections
+    if isinstance(e, (httplib2.HttpLib2Error, OSError)):
+        return True, True
+    return False, False
+
+
+def backoff_seconds(attempts):
+    """Full-jitter exponential backoff for the given number of failed attempts."""
+    return random.uniform(0, min(REPLY_BACKOFF_BASE * 2 ** attempts, REPLY_BACKOFF_MAX))
+
+
+class ReplyQueue:
+    """Durable outbox for comment replies, sent by a background thread.
+
+    Replies are stored in SQLite before the request returns, so a restart or a
+    transient API error never loses one. Each worker runs a sender; rows are
+    claimed atomically, and a reply whose last attempt may have reached YouTube
+    is looked up before it is sent again, so retries never double-post.
+
+    Rows hold only the CredentialManager key of the user's credentials, never
+    the tokens. A reply is sent by a worker that holds those credentials from
+    the user's session; after a restart it waits until the user is back.
+    """
+
+    def __init__(self, ledger, credential_manager, db_name='replies', sends_per_second=REPLY_SENDS_PER_SECOND,
+                 max_attempts=REPLY_MAX_ATTEMPTS):
+        self.ledger = ledger
+        self.credential_manager = credential_manager
+        self.db_name = db_name
+        self.min_interval = 1 / sends_per_second if sends_per_second > 0 else 0
+        self.max_attempts = max_attempts
+        self._initialized = set()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(row, status) whenever a reply is finally sent or has failed for good."""
+        self._listeners.append(listener)
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS replies (
+                    id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    parent_id TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    credential_key TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    needs_check INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    lease_until REAL,
+                    reply_id TEXT,
+                    reply TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    UNIQUE (channel_id, idempotency_key)
+                );
+                CREATE INDEX IF NOT EXISTS idx_replies_due ON replies (status, next_attempt_at);
+                CREATE INDEX IF NOT EXISTS idx_replies_channel ON replies (channel_id, created_at);
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def enqueue(self, channel_id, parent_id, text, credential_key, idempotency_key=None):
+        """Store a reply for sending with the CredentialManager key of the user's credentials; return its record.
+
+        Enqueueing the same idempotency key again returns the original record
+        instead of queueing a second reply. A reply that failed for good is
+        queued again, with fresh attempts and credentials, when its key is
+        reused; one that may have reached YouTube is still looked up first.
+        """
+        reply_id = uuid.uuid4().hex
+        now = datetime.utcnow().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO replies (id, channel_id, idempotency_key, parent_id, text, credential_key,
+                                     status, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(channel_id, idempotency_key) DO UPDATE SET
+                    credential_key = excluded.credential_key,
+                    status = excluded.status,
+                    attempts = 0,
+                    next_attempt_at = excluded.next_attempt_at,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+                WHERE replies.status = 'failed'
+            ''', (reply_id, channel_id, idempotency_key or reply_id, parent_id, text,
+                  credential_key, PENDING, time.time(), now, now))
+        record = self._find(channel_id, idempotency_key or reply_id)
+        self.start()
+        self._wake.set()
+        return record
+
+    def _find(self, channel_id, idempotency_key):
+        row = self._conn().execute(
+            'SELECT * FROM replies WHERE channel_id = ? AND idempotency_key = ?', (channel_id, idempotency_key)
+        ).fetchone()
+        return self._record(row)
+
+    def get(self, reply_id):
+        row = self._conn().execute('SELECT * FROM replies WHERE id = ?', (reply_id,)).fetchone()
+        return self._record(row)
+
+    def list(self, channel_id, status=None, limit=50):
+        """Most recent replies for a channel, optionally only those in one status."""
+        query = 'SELECT * FROM replies WHERE channel_id = ?'
+        params = [channel_id]
+        if status:
+            query += ' AND status = ?'
+            params.append(status)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        params.append(limit)
+        return [self._record(row) for row in self._conn().execute(query, params).fetchall()]
+
+    @staticmethod
+    def _record(row):
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'channelId': row['channel_id'],
+            'idempotencyKey': row['idempotency_key'],
+            'commentId': row['parent_id'],
+            'text': row['text'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'nextAttemptAt': datetime.utcfromtimestamp(row['next_attempt_at']).isoformat()
+            if row['status'] == PENDING else None,
+            'reply': json.loads(row['reply']) if row['reply'] else None,
+            'error': row['error'],
+            'createdAt': row['created_at'],
+            'updatedAt': row['updated_at']
+        }
+
+    def start(self):
+        """Start this process's sender thread if it is not running."""
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='reply-sender', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                row = self._claim()
+            except Exception as e:
+                logger.warning(f'Error claiming queued reply: {str(e)}')
+                row = None
+            if row is None:
+                self._wake.wait(SENDER_IDLE_SECONDS)
+                self._wake.clear()
+                continue
+            start = time.monotonic()
+            try:
+                self._send(row)
+            except Exception as e:
+                # Leave the row leased; it is picked up again (and checked) once the lease runs out
+                logger.error(f'Error sending reply {row["id"]}: {str(e)}', exc_info=True)
+            # Rate limit sends from this worker
+            elapsed = time.monotonic() - start
+            if elapsed < self.min_interval:
+                time.sleep(self.min_interval - elapsed)
+
+    def _claim(self):
+        """Atomically take the next due reply this worker has credentials for, including abandoned sends."""
+        keys = self.credential_manager.keys()
+        if not keys:
+            return None
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(f'''
+                SELECT * FROM replies
+                WHERE ((status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until <= ?))
+                  AND credential_key IN ({','.join('?' * len(keys))})
+                ORDER BY next_attempt_at LIMIT 1
+            ''', (PENDING, now, SENDING, now, *keys)).fetchone()
+            if row is None:
+                return None
+            # An abandoned send may have gone through before its worker died
+            needs_check = row['needs_check'] or row['status'] == SENDING
+            conn.execute('''
+                UPDATE replies SET status = ?, lease_until = ?, needs_check = ?, updated_at = ? WHERE id = ?
+            ''', (SENDING, now + REPLY_LEASE_SECONDS, int(needs_check), datetime.utcnow().isoformat(), row['id']))
+        row = dict(row)
+        row['needs_check'] = needs_check
+        return row
+
+    def _send(self, row):
+        channel_id = row['channel_id']
+        try:
+            # The user's live token, shared with their requests
+            credentials = self.credential_manager.find(row['credential_key'])
+            if credentials is None:
+                # Dropped from this worker since the claim; another one holding them can send it
+                self._defer(row, time.time(), 'Waiting for a worker with the user\'s credentials')
+                return
+            youtube = get_client(credentials, channel_id)
+        except Exception as e:
+            self._finish(row, FAILED, error=f'Invalid credentials: {str(e)}')
+            return
+
+        if row['needs_check']:
+            try:
+                existing = self._find_posted(youtube, row)
+            except Exception as e:
+                self._retry(row, e, ambiguous=True)
+                return
+            if existing is not None:
+                logger.info(f'Reply {row["id"]} was already posted as {existing["id"]}')
+                self._finish(row, SENT, reply=existing)
+                return
+
+        if not self.ledger.can_spend(REPLY_COST, PRIORITY_HIGH):
+            self._defer(row, next_reset().timestamp(), 'Daily quota exhausted, waiting for reset')
+            return
+
+        try:
+            reply = youtube.comments().insert(
+                part='snippet',
+                body={
+                    'snippet': {
+                        'parentId': row['parent_id'],
+                        'textOriginal': row['text']
+                    }
+                }
+            ).execute()
+        except Exception as e:
+            if is_quota_error(e):
+                self._defer(row, next_reset().timestamp(), str(e))
+                return
+            retryable, ambiguous = classify_error(e)
+            if retryable:
+                self._retry(row, e, ambiguous)
+            else:
+                self._finish(row, FAILED, error=str(e))
+            return
+
+        logger.debug(f'Created reply to comment {row["parent_id"]}')
+        self._finish(row, SENT, reply=reply)
+
+    def _find_posted(self, youtube, row):
+        """Return our reply if an earlier attempt already created it, else None."""
+        response = youtube.comments().list(
+            part='snippet',
+            parentId=row['parent_id'],
+            maxResults=100,
+            textFormat='plainText'
+        ).execute()
+        for comment in response.get('items', []):
+            snippet = comment['snippet']
+            author = snippet.get('authorChannelId', {}).get('value')
+            if author == row['channel_id'] and snippet.get('textOriginal') == row['text'] \
+                    and snippet.get('publishedAt', '') >= row['created_at'][:19]:
+                return comment
+        return None
+
+    def _retry(self, row, error, ambiguous):
+        attempts = row['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self._finish(row, FAILED, error=str(error), attempts=attempts)
+            return
+        delay = backoff_seconds(attempts)
+        logger.warning(f'Reply {row["id"]} attempt {attempts} failed, retrying in {delay:.1f}s: {str(error)}')
+        self._update(row['id'], status=PENDING, attempts=attempts, next_attempt_at=time.time() + delay,
+                     needs_check=int(bool(row['needs_check']) or ambiguous), error=str(error))
+
+    def _defer(self, row, until, reason):
+        # Not an attempt: nothing was sent
+        self._update(row['id'], status=PENDING, next_attempt_at=until, needs_check=int(bool(row['needs_check'])),
+                     error=reason)
+
+    def _finish(self, row, status, reply=None, error=None, attempts=None):
+        # The credential reference is only kept while the reply still has to be sent
+        self._update(row['id'], status=status, attempts=attempts if attempts is not None else row['attempts'] + 1,
+                     reply=json.dumps(reply) if reply else None, reply_id=reply['id'] if reply else None,
+                     error=error, credential_key=None, lease_until=None)
+        for listener in self._listeners:
+            try:
+                listener(row, status)
+            except Exception as e:
+                logger.warning(f'Reply listener failed for {row["id"]}: {str(e)}')
+
+    def _update(self, row_id, **fields):
+        fields['updated_at'] = datetime.utcnow().isoformat()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        conn = self._conn()
+        with conn:
+            conn.execute(f'UPDATE replies SET {assignments} WHERE id = ?', (*fields.values(), row_id))
@@ -0,0 +1,220 @@
+import re
+import html
+import hashlib
+import logging
+from itertools import chain, repeat
+
+import numpy as np
+
+from db import get_connection
+from comment_sync import Comment, COMMENT_FIELDS
+from triage import timestamp
+
+logger = logging.getLogger(__name__)
+
+SPAM_THRESHOLD = 0.8  # Spam probability from which a comment is flagged
+BURST_WINDOW = 60 * 60  # An author's comments within this many seconds count towards their burst
+# Copies of a text by the same author count within this many seconds either side of it; a common
+# phrase from many viewers, or a regular's weekly "great video", is not a copy
+REPEAT_WINDOW = 24 * 60 * 60
+MAX_FEATURE_CHARS = 2000  # Longer comments are featurized on their first this many characters
+SPAM_MAX_RESULTS = 500
+
+# Logistic model over links, repeats, burst, caps ratio and emoji density; hand-set, no training data needed
+SPAM_WEIGHTS = np.array([2.5, 1.5, 1.0, 2.0, 4.0])  # links, repeats and burst enter as log1p
+SPAM_BIAS = -4.0
+
+# Sentiment lexicon: word -> polarity
+SENTIMENT_WORDS = {
+    **dict.fromkeys(('love', 'loves', 'loved', 'great', 'awesome', 'amazing', 'best', 'thank', 'thanks', 'helpful',
+                     'excellent', 'perfect', 'beautiful', 'nice', 'cool', 'brilliant', 'wonderful', 'enjoy',
+                     'enjoyed', 'fantastic', 'legend', 'goat'), 1),
+    **dict.fromkeys(('hate', 'hates', 'hated', 'worst', 'bad', 'terrible', 'awful', 'boring', 'useless', 'stupid',
+                     'trash', 'garbage', 'dislike', 'disliked', 'clickbait', 'cringe', 'waste', 'scam', 'fake',
+                     'wrong', 'annoying', 'disappointed', 'misleading'), -1),
+}
+WORD = re.compile(r'\w+')
+TAG = re.compile(r'<[^>]+>')
+NON_WORD = re.compile(r'\W+')
+
+# /api/comments/spam fields: a stored comment plus its scores
+SCORE_FIELDS = {**COMMENT_FIELDS, 'spamScore': 'spam', 'sentiment': 'sentiment'}
+_COLUMNS = ', '.join(f'c.{column}' for column in Comment.__slots__)
+
+
+def plain_text(text_display):
+    """textDisplay (HTML) as the text a viewer sees."""
+    return html.unescape(TAG.sub(' ', text_display or ''))[:MAX_FEATURE_CHARS]
+
+
+def text_hash(text):
+    """Signed 64-bit hash of the text ignoring case, spacing and punctuation, to spot copy-pasted comments.
+
+    Texts without word characters (emoji, punctuation) all hash alike, so
+    they are left out of the copy count.
+    """
+    digest = hashlib.blake2b(NON_WORD.sub('', text.lower()).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def text_features(texts):
+    """Per-text (links, caps ratio, emoji density, sentiment) arrays for a batch of plain texts.
+
+    The batch becomes one (texts x characters) array of code points, so the
+    per-character counts are whole-array comparisons.
+    """
+    texts = np.array(texts, dtype=str)
+    if not texts.size:
+        return (np.zeros(0),) * 4
+    codes = texts.view(np.uint32).reshape(len(texts), -1)
+    length = np.count_nonzero(codes, axis=1)
+
+    upper = np.count_nonzero((codes >= 65) & (codes <= 90), axis=1)
+    letters = upper + np.count_nonzero((codes >= 97) & (codes <= 122), axis=1)
+    # "OK" or "LOL" is not shouting
+    caps_ratio = np.where(letters >= 8, upper / np.maximum(letters, 1), 0.0)
+    emoji = np.count_nonzero(((codes >= 0x1F000) & (codes <= 0x1FAFF)) | ((codes >= 0x2600) & (codes <= 0x27BF)),
+                             axis=1)
+    emoji_density = emoji / np.maximum(length, 1)
+
+    links = (np.char.count(texts, '://') + np.char.count(texts, 'www.') - np.char.count(texts, '://www.'))
+
+    # Lexicon polarity of every word in the batch, summed per text
+    words = [WORD.findall(text.lower()) for text in texts.tolist()]
+    counts = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    polarity = np.fromiter(map(SENTIMENT_WORDS.get, chain.from_iterable(words), repeat(0)),
+                           dtype=np.int8, count=int(counts.sum()))
+    owner = np.repeat(np.arange(len(words)), counts)
+    positive = np.bincount(owner, weights=polarity > 0, minlength=len(words))
+    negative = np.bincount(owner, weights=polarity < 0, minlength=len(words))
+    sentiment = (positive - negative) / np.maximum(positive + negative, 1)
+    return links, caps_ratio, emoji_density, sentiment
+
+
+def window_counts(group_codes, times, batch_size, before, after=0):
+    """For each of the first batch_size entries, how many entries of its group fall from `before` to `after` seconds around it.
+
+    The rest of the arrays are the groups' other comments; the counts include
+    the entry itself. Every (group, time) pair becomes one sortable integer
+    key, so each count is two binary searches.
+    """
+    keys = group_codes.astype(np.int64) * (1 << 33) + times.astype(np.int64)
+    ordered = np.sort(keys)
+    batch = keys[:batch_size]
+    return np.searchsorted(ordered, batch + after, 'right') - np.searchsorted(ordered, batch - before, 'left')
+
+
+def spam_probability(links, repeats, burst, caps_ratio, emoji_density):
+    """Logistic spam score; repeats and burst count the author's other copies and comments, not this one."""
+    features = np.column_stack([np.log1p(links), np.log1p(repeats), np.log1p(burst), caps_ratio, emoji_density])
+    return 1 / (1 + np.exp(-(features @ SPAM_WEIGHTS + SPAM_BIAS)))
+
+
+class CommentScorer:
+    """Spam and sentiment scores for synced comments, computed a merged batch at a time.
+
+    Scores are stored per comment ID with the updatedAt they were computed
+    for, so a merge only scores comments that are new or were edited. An
+    author's copies and bursts are counted against their already scored
+    comments too.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.store.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript(f'''
+                CREATE TABLE IF NOT EXISTS comment_scores (
+                    comment_id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    author TEXT,
+                    published_at REAL NOT NULL,
+                    updated_at TEXT,
+                    text_hash INTEGER NOT NULL,
+                    spam REAL NOT NULL,
+                    sentiment REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_scores_author ON comment_scores (channel_id, author, published_at);
+                CREATE INDEX IF NOT EXISTS idx_scores_spam
+                    ON comment_scores (channel_id, spam) WHERE spam >= {SPAM_THRESHOLD};
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def update(self, channel_id, comments):
+        """comment_store listener: score the merged comments not scored at their current updatedAt."""
+        if not comments:
+            return
+        conn = self._conn()
+        ids = [c['id'] for c in comments]
+        placeholders = ','.join('?' * len(ids))
+        scored = dict(conn.execute(
+            f'SELECT comment_id, updated_at FROM comment_scores WHERE comment_id IN ({placeholders})', ids
+        ).fetchall())
+        comments = list({c['id']: c for c in comments if scored.get(c['id'], '') != c['updatedAt']}.values())
+        if not comments:
+            return
+
+        texts = [plain_text(c['textDisplay']) for c in comments]
+        hashes = np.array([text_hash(text) for text in texts], dtype=np.int64)
+        authors = [c.get('authorChannelId') or c['authorDisplayName'] or '' for c in comments]
+        published = np.array([timestamp(c['publishedAt']) for c in comments])
+        ids = [c['id'] for c in comments]
+        placeholders = ','.join('?' * len(ids))
+
+        # The authors' already scored comments that can fall in a batch comment's burst or repeat window
+        unique_authors = list(dict.fromkeys(authors))
+        earlier = conn.execute(f'''
+            SELECT author, published_at, text_hash FROM comment_scores
+            WHERE channel_id = ? AND author IN ({','.join('?' * len(unique_authors))})
+              AND published_at BETWEEN ? AND ? AND comment_id NOT IN ({placeholders})
+        ''', (channel_id, *unique_authors, float(published.min()) - max(BURST_WINDOW, REPEAT_WINDOW),
+              float(published.max()) + REPEAT_WINDOW, *ids)).fetchall()
+        all_authors = authors + [row[0] for row in earlier]
+        times = np.concatenate([published, np.array([row[1] for row in earlier], dtype=np.float64)])
+
+        author_index = {author: i for i, author in enumerate(unique_authors)}
+        burst = window_counts(np.array([author_index[a] for a in all_authors]), times, len(comments), BURST_WINDOW) - 1
+
+        # Copies of the same text by the same author, before or after it
+        copy_index = {}
+        copy_codes = np.array([copy_index.setdefault(pair, len(copy_index))
+                               for pair in zip(all_authors, hashes.tolist() + [row[2] for row in earlier])])
+        repeats = window_counts(copy_codes, times, len(comments), REPEAT_WINDOW, REPEAT_WINDOW) - 1
+        repeats[[not WORD.search(text) for text in texts]] = 0
+
+        links, caps_ratio, emoji_density, sentiment = text_features(texts)
+        spam = spam_probability(links, repeats, burst, caps_ratio, emoji_density)
+
+        with conn:
+            conn.executemany('''
+                INSERT INTO comment_scores (comment_id, channel_id, author, published_at, updated_at,
+                                            text_hash, spam, sentiment)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(comment_id) DO UPDATE SET
+                    updated_at = excluded.updated_at,
+                    text_hash = excluded.text_hash,
+                    spam = excluded.spam,
+                    sentiment = excluded.sentiment
+            ''', zip(ids, [channel_id] * len(ids), authors, published.tolist(), [c['updatedAt'] for c in comments],
+                     hashes.tolist(), np.round(spam, 4).tolist(), np.round(sentiment, 4).tolist()))
+        flagged = int(np.count_nonzero(spam >= SPAM_THRESHOLD))
+        if flagged:
+            logger.info(f'Flagged {flagged} of {len(comments)} new comments as likely spam for channel {channel_id}')
+
+    def flagged(self, channel_id, limit=50, video_id=None):
+        """Comments scored as likely spam, most likely first, as dicts of SCORE_FIELDS keys."""
+        query = f'''
+            SELECT {_COLUMNS}, s.spam, s.sentiment
+            FROM comment_scores s JOIN comments c ON c.id = s.comment_id
+            WHERE s.channel_id = ? AND s.spam >= {SPAM_THRESHOLD}
+        '''
+        params = [channel_id]
+        if video_id:
+            query += ' AND c.video_id = ?'
+            params.append(video_id)
+        query += ' ORDER BY s.spam DESC LIMIT ?'
+        return [dict(row) for row in self._conn().execute(query, params + [limit]).fetchall()]
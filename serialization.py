@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+from operator import attrgetter, itemgetter
+from json.encoder import encode_basestring_ascii
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is used when it is not installed
+    brotli = None
+
+# Responses at least this large are compressed for clients that accept it
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 4096))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5  # Fast enough for per-request compression, ~gzip -9 ratio
+
+
+class FieldError(ValueError):
+    pass
+
+
+def parse_fields(value, available):
+    """Return the (name, key) pairs a `fields=a,b` parameter selects from `available` (name -> key)."""
+    if not value:
+        return list(available.items())
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise FieldError(f'Unknown fields: {", ".join(unknown) or value}; available: {", ".join(available)}')
+    return [(name, available[name]) for name in dict.fromkeys(names)]
+
+
+class Records:
+    """A list of records (slotted objects or dicts) serialized as objects holding only `fields`.
+
+    fields are (name, key) pairs: the JSON key, and the attribute or dict key
+    it is read from. No per-record dict is built.
+    """
+
+    __slots__ = ('items', 'fields')
+
+    def __init__(self, items, fields):
+        self.items = items
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_column(values):
+    """JSON for each value of one field; the common all-str and all-int columns stay in C."""
+    types = set(map(type, values))
+    if types == {str}:
+        return map(encode_basestring_ascii, values)
+    if types == {int}:
+        return map(int.__repr__, values)
+    return map(json.dumps, values)
+
+
+def encode_records(records, sort_keys=False):
+    """Encode Records column by column and join them with one format string per record."""
+    fields = sorted(records.fields) if sort_keys else records.fields
+    if not records.items or not fields:
+        return '[' + ','.join(['{}'] * len(records.items)) + ']'
+    getter = itemgetter if isinstance(records.items[0], dict) else attrgetter
+    columns = [_encode_column(list(map(getter(key), records.items))) for _, key in fields]
+    template = '{' + ','.join(f'{encode_basestring_ascii(name)}:%s' for name, _ in fields) + '}'
+    return '[' + ','.join(map(template.__mod__, zip(*columns))) + ']'
+
+
+def dumps(obj, fallback, sort_keys=False):
+    """Serialize obj, encoding Records values of a top-level dict with encode_records."""
+    if not isinstance(obj, dict) or not any(isinstance(value, Records) for value in obj.values()):
+        return fallback(obj)
+    keys = sorted(obj) if sort_keys else list(obj)
+    return '{' + ','.join(
+        f'{encode_basestring_ascii(key)}:'
+        + (encode_records(obj[key], sort_keys) if isinstance(obj[key], Records) else fallback(obj[key]))
+        for key in keys
+    ) + '}'
+
+
+def negotiate_encoding(accept_encodings):
+    """The content coding to use for a response, given the request's parsed Accept-Encoding."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
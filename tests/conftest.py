@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import itertools
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read when the app's modules are imported
+os.environ['ECHOTUBE_DATA_DIR'] = tempfile.mkdtemp(prefix='echotube-test-')
+
+_databases = itertools.count()
+
+
+@pytest.fixture
+def db_name():
+    """A database name no other test uses."""
+    return f'test_{next(_databases)}'
+
+
+class Call:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeYouTube:
+    """commentThreads().list over in-memory threads, newest first, with offsets as page tokens."""
+
+    def __init__(self):
+        self.threads = {}  # video id -> thread items, newest first
+        self.pages = 0
+
+    def add_threads(self, video_id, published_ats, prefix='thread'):
+        """Add one thread per publishedAt; the threads list stays newest first."""
+        threads = self.threads.setdefault(video_id, [])
+        for published_at in published_ats:
+            threads.append(thread_item(video_id, f'{video_id}-{prefix}{len(threads)}', published_at))
+        threads.sort(key=lambda item: item['snippet']['topLevelComment']['snippet']['publishedAt'], reverse=True)
+
+    def commentThreads(self):
+        return self
+
+    def list(self, videoId, maxResults, pageToken=None, **params):
+        self.pages += 1
+        threads = self.threads.get(videoId, [])
+        start = int(pageToken or 0)
+        response = {'items': threads[start:start + maxResults]}
+        if start + maxResults < len(threads):
+            response['nextPageToken'] = str(start + maxResults)
+        return Call(response)
+
+
+def thread_item(video_id, thread_id, published_at):
+    return {
+        'id': thread_id,
+        'snippet': {
+            'videoId': video_id,
+            'topLevelComment': {'snippet': {
+                'authorDisplayName': 'viewer', 'authorProfileImageUrl': '', 'textDisplay': thread_id,
+                'likeCount': 0, 'publishedAt': published_at, 'updatedAt': published_at,
+            }},
+        },
+    }
+
+
+def timestamps(start, count):
+    """count distinct publishedAt values from start seconds after 2024-01-01, oldest first."""
+    return [f'2024-01-01T{(start + i) // 3600:02d}:{(start + i) // 60 % 60:02d}:{(start + i) % 60:02d}Z'
+            for i in range(count)]
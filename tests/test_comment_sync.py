@@ -0,0 +1,66 @@
+from comment_sync import CommentStore, CommentSync, MAX_NEW_PAGES, PAGE_SIZE
+from conftest import FakeYouTube, timestamps
+
+CHANNEL_ID = 'UCtest'
+
+
+def stored_ids(store):
+    return {row[0] for row in store._conn().execute('SELECT id FROM comments')}
+
+
+def test_sync_video_resumes_a_walk_longer_than_max_new_pages(db_name):
+    store, youtube = CommentStore(db_name), FakeYouTube()
+    sync = CommentSync(store)
+    youtube.add_threads('video1', timestamps(0, 10))
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == 10
+
+    burst = MAX_NEW_PAGES * PAGE_SIZE + 150
+    youtube.add_threads('video1', timestamps(100, burst))
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == MAX_NEW_PAGES * PAGE_SIZE
+    # The watermark waits until the walk has reached it
+    assert store.get_watermark('video1')['newest_published_at'] == timestamps(9, 1)[0]
+
+    # Threads posted meanwhile shift the pages; the resumed walk skips the ones it already stored
+    youtube.add_threads('video1', timestamps(100 + burst, 5), prefix='late')
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == 150
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == 5
+    assert stored_ids(store) == {item['id'] for item in youtube.threads['video1']}
+
+    youtube.pages = 0
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == 0
+    assert youtube.pages == 1
+
+
+def test_sync_video_fetches_threads_from_the_watermarks_second(db_name):
+    store, youtube = CommentStore(db_name), FakeYouTube()
+    sync = CommentSync(store)
+    youtube.add_threads('video1', timestamps(0, 3))
+    sync.sync_video(youtube, CHANNEL_ID, 'video1')
+
+    # Posted in the same second as the newest stored thread, then one newer
+    youtube.add_threads('video1', timestamps(2, 1) + timestamps(3, 1), prefix='new')
+    assert sync.sync_video(youtube, CHANNEL_ID, 'video1') == 2
+    assert stored_ids(store) == {item['id'] for item in youtube.threads['video1']}
+
+
+def comment(comment_id, published_at, likes=0):
+    return {'id': comment_id, 'videoId': 'video1', 'authorDisplayName': 'viewer', 'authorProfileImageUrl': '',
+            'textDisplay': comment_id, 'likeCount': likes, 'publishedAt': published_at, 'updatedAt': published_at}
+
+
+def test_get_comments_without_cursor_returns_the_newest(db_name):
+    store = CommentStore(db_name)
+    times = timestamps(0, 30)
+    # New threads first, then backfilled older ones: the oldest have the highest sequence numbers
+    store.merge(CHANNEL_ID, [comment(f'c{i}', times[i]) for i in range(20, 30)])
+    store.merge(CHANNEL_ID, [comment(f'c{i}', times[i]) for i in range(20)])
+
+    comments, cursor, more = store.get_comments(CHANNEL_ID, limit=5)
+    assert [c.id for c in comments] == ['c29', 'c28', 'c27', 'c26', 'c25']
+    assert more
+
+    # Polling with the cursor returns only what changed after it
+    assert store.get_comments(CHANNEL_ID, since=cursor) == ([], cursor, False)
+    store.merge(CHANNEL_ID, [comment('c3', times[3], likes=1), comment('c30', timestamps(30, 1)[0])])
+    comments, cursor, more = store.get_comments(CHANNEL_ID, since=cursor)
+    assert [c.id for c in comments] == ['c3', 'c30'] and not more
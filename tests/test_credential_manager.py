@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from google.oauth2.credentials import Credentials
+
+import credential_manager
+from cache_backend import MemoryCache
+from credential_manager import CredentialManager
+
+CREDENTIALS = {
+    'token': 'old-token', 'refresh_token': 'refresh-token', 'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'client-id', 'client_secret': 'client-secret', 'scopes': [],
+    'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+}
+
+
+def test_a_refresh_after_a_timed_out_wait_leaves_the_other_workers_lease(monkeypatch):
+    def refresh(credentials, request):
+        credentials.token = 'new-token'
+        credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    monkeypatch.setattr(Credentials, 'refresh', refresh)
+    monkeypatch.setattr(credential_manager, 'REFRESH_WAIT_SECONDS', 0.05)
+    monkeypatch.setattr(credential_manager, 'REFRESH_POLL_SECONDS', 0.01)
+    cache = MemoryCache()
+    manager = CredentialManager(cache)
+    credentials = manager.get(CREDENTIALS)
+
+    # Another worker is refreshing and has not published a token yet
+    lease_key = f'credentials-refresh:{credentials.key}'
+    cache.add(lease_key, 'other-worker')
+    manager.refresh(credentials, None)
+    assert credentials.token == 'new-token'
+    assert cache.get(lease_key) == 'other-worker'
+
+    # With no other refresh running, this worker's own lease is released
+    cache.delete(lease_key)
+    manager.refresh(credentials, None)
+    assert cache.get(lease_key) is None
@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+from cache_backend import MemoryCache, SQLiteCache
+from jobs import JobQueue, DONE
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, db_name):
+    return MemoryCache() if request.param == 'memory' else SQLiteCache(db_name, max_entries=None, max_bytes=None)
+
+
+def test_delete_if_only_deletes_the_expected_value(cache):
+    cache.set('lease', 'mine')
+    assert not cache.delete_if('lease', 'theirs')
+    assert cache.get('lease') == 'mine'
+    assert cache.delete_if('lease', 'mine')
+    assert cache.get('lease') is None
+
+
+def test_a_finished_job_keeps_a_lease_another_worker_took_over(cache):
+    jobs = JobQueue(cache, max_workers=1)
+    finished = threading.Event()
+
+    def work():
+        # This worker's lease ran out mid-run and another worker took the key
+        cache.set('job-key:refresh', 'other-workers-job')
+
+    record = jobs.submit('refresh', work)
+    jobs._executor.submit(finished.set)
+    assert finished.wait(5)
+    assert jobs.get(record['id'])['status'] == DONE
+    assert cache.get('job-key:refresh') == 'other-workers-job'
+
+    # Its own lease is released
+    jobs.submit('other', lambda: None)
+    jobs._executor.shutdown(wait=True)
+    assert cache.get('job-key:other') is None
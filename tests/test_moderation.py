@@ -0,0 +1,62 @@
+from cache_backend import MemoryCache
+from moderation import ModerationBatcher
+from conftest import Call
+
+
+class FakeModeration:
+    """comments().setModerationStatus and HTTP batches, recording the calls sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    def comments(self):
+        return self
+
+    def setModerationStatus(self, id, moderationStatus, banAuthor):
+        call = (tuple(id.split(',')), moderationStatus, banAuthor)
+        result = Call(None)
+        result.execute = lambda: self.sent.append(call)
+        return result
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self):
+        for request, request_id in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+def test_only_the_last_action_per_comment_is_sent():
+    youtube, batcher = FakeModeration(), ModerationBatcher(MemoryCache())
+    results = batcher.moderate(youtube, 'UCtest', [
+        {'commentId': 'c1', 'action': 'hold'},
+        {'commentId': 'c1', 'action': 'publish'},
+        {'commentId': 'c1', 'action': 'hold'},
+        {'commentId': 'c2', 'action': 'reject'},
+        {'commentId': 'c2', 'action': 'publish'},
+    ])
+
+    assert sorted(youtube.sent) == [(('c1',), 'heldForReview', False), (('c2',), 'published', False)]
+    assert [result['success'] for result in results] == [True, False, True, False, True]
+    assert results[1]['superseded'] and results[3]['superseded']
+
+
+def test_a_repeated_action_inside_the_window_is_not_sent_again():
+    youtube, batcher = FakeModeration(), ModerationBatcher(MemoryCache())
+    batcher.moderate(youtube, 'UCtest', [{'commentId': 'c1', 'action': 'hold'}])
+    results = batcher.moderate(youtube, 'UCtest', [{'commentId': 'c1', 'action': 'hold'}])
+    assert results[0]['deduplicated'] and len(youtube.sent) == 1
+
+    # A different action in between is sent, and so is the hold after it
+    batcher.moderate(youtube, 'UCtest', [{'commentId': 'c1', 'action': 'publish'}])
+    batcher.moderate(youtube, 'UCtest', [{'commentId': 'c1', 'action': 'hold'}])
+    assert [status for _, status, _ in youtube.sent] == ['heldForReview', 'published', 'heldForReview']
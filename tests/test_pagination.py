@@ -0,0 +1,27 @@
+from pagination import PageBudget, iter_pages
+from quota import QuotaLedger, PRIORITY_LOW
+from conftest import Call
+
+
+def test_a_stream_stops_before_the_quota_reserve(db_name):
+    ledger = QuotaLedger(db_name, daily_limit=100, reserve=20)
+    pages = []
+
+    def list_method(**params):
+        # Every page fetched is charged, as the client listener does
+        ledger.record('UCtest', 'youtube.commentThreads.list')
+        pages.append(params.get('pageToken'))
+        return Call({'items': [], 'nextPageToken': str(len(pages))})
+
+    for _ in range(70):
+        ledger.record('UCtest', 'youtube.videos.list')
+    responses = list(iter_pages(list_method, PageBudget(max_pages=50, ledger=ledger, priority=PRIORITY_LOW)))
+    assert len(responses) == 10
+    assert ledger.remaining() == 20
+
+
+def test_a_stream_stops_at_max_pages_without_a_ledger():
+    def list_method(**params):
+        return Call({'items': [], 'nextPageToken': 'more'})
+
+    assert len(list(iter_pages(list_method, PageBudget(max_pages=3)))) == 3
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import reply_queue
+from cache_backend import MemoryCache
+from credential_manager import CredentialManager
+from reply_queue import ReplyQueue, SENT, FAILED, PENDING
+from conftest import Call
+
+CREDENTIALS = {
+    'token': 'access-token', 'refresh_token': 'refresh-token', 'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'client-id', 'client_secret': 'client-secret', 'scopes': [],
+    'expiry': (datetime.utcnow() + timedelta(hours=1)).isoformat()
+}
+
+
+class Ledger:
+    def can_spend(self, units, priority):
+        return True
+
+
+class FakeReplies:
+    """comments().insert that fails with the queued errors first."""
+
+    def __init__(self):
+        self.errors = []
+        self.posted = []
+
+    def comments(self):
+        return self
+
+    def insert(self, part, body):
+        if self.errors:
+            return Call(self.errors.pop(0))
+        reply = {'id': f'reply{len(self.posted)}', 'snippet': body['snippet']}
+        self.posted.append(reply)
+        return Call(reply)
+
+
+@pytest.fixture
+def queue(db_name, monkeypatch):
+    youtube = FakeReplies()
+    monkeypatch.setattr(reply_queue, 'get_client', lambda credentials, channel_id: youtube)
+    # Sends are driven by the test, not the background thread
+    monkeypatch.setattr(ReplyQueue, 'start', lambda self: None)
+    manager = CredentialManager(MemoryCache())
+    queue = ReplyQueue(Ledger(), manager, db_name=db_name)
+    queue.youtube = youtube
+    queue.credential_key = manager.get(CREDENTIALS).key
+    return queue
+
+
+def send_next(queue):
+    row = queue._claim()
+    assert row is not None
+    queue._send(row)
+    return queue.get(row['id'])
+
+
+def test_a_failed_reply_is_queued_again_when_its_key_is_reused(queue):
+    queue.youtube.errors.append(HttpError(httplib2.Response({'status': 400}), b'{"error": {"message": "invalid"}}'))
+    record = queue.enqueue('UCtest', 'parent1', 'thanks!', queue.credential_key, 'key1')
+    assert send_next(queue)['status'] == FAILED
+
+    again = queue.enqueue('UCtest', 'parent1', 'thanks!', queue.credential_key, 'key1')
+    assert again['id'] == record['id']
+    assert again['status'] == PENDING and again['attempts'] == 0 and again['error'] is None
+    assert send_next(queue)['status'] == SENT
+
+    # Once sent, the same key returns the sent reply instead of posting it again
+    assert queue.enqueue('UCtest', 'parent1', 'thanks!', queue.credential_key, 'key1')['status'] == SENT
+    assert queue._claim() is None
+    assert len(queue.youtube.posted) == 1
+
+
+def test_rows_hold_a_credential_reference_not_tokens(queue):
+    queue.enqueue('UCtest', 'parent1', 'thanks!', queue.credential_key, 'key1')
+    row = queue._conn().execute('SELECT * FROM replies').fetchone()
+    assert not any(secret in str(value) for value in tuple(row)
+                   for secret in ('access-token', 'refresh-token', 'client-secret'))
+
+    # A worker that does not hold the user's credentials leaves the reply to one that does
+    other = ReplyQueue(Ledger(), CredentialManager(MemoryCache()), db_name=queue.db_name)
+    assert other._claim() is None
+
+    send_next(queue)
+    assert queue._conn().execute('SELECT credential_key FROM replies').fetchone()[0] is None
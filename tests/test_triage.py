@@ -0,0 +1,71 @@
+import pytest
+
+from comment_sync import CommentStore
+from reply_queue import SENT, FAILED
+from triage import TriageQueue, OPEN, REPLIED, DISMISSED, OWN
+from video_catalog import VideoStore
+
+CHANNEL_ID = 'UCtest'
+
+
+@pytest.fixture
+def triage(db_name):
+    store = CommentStore(db_name)
+    triage = TriageQueue(store, VideoStore(f'{db_name}_videos'))
+    store.add_listener(triage.update)
+    return triage
+
+
+def merge(triage, *comments):
+    triage.store.merge(CHANNEL_ID, list(comments))
+
+
+def thread(thread_id, likes=0, author='UCviewer', creator_replied=False):
+    return {'id': thread_id, 'videoId': 'video1', 'authorDisplayName': 'viewer', 'authorProfileImageUrl': '',
+            'textDisplay': thread_id, 'likeCount': likes, 'publishedAt': '2024-01-01T00:00:00Z',
+            'updatedAt': '2024-01-01T00:00:00Z', 'authorChannelId': author, 'totalReplyCount': 0,
+            'creatorReplied': creator_replied}
+
+
+def states(triage):
+    return dict(triage._conn().execute('SELECT comment_id, state FROM comment_triage').fetchall())
+
+
+def test_thread_states_follow_syncs_and_replies(triage):
+    merge(triage, thread('t1', likes=1), thread('t2', likes=50), thread('t3', creator_replied=True),
+          thread('t4', author=CHANNEL_ID))
+    assert states(triage) == {'t1': OPEN, 't2': OPEN, 't3': REPLIED, 't4': OWN}
+    assert [t['id'] for t in triage.next(CHANNEL_ID)] == ['t2', 't1']
+
+    # A reply queued through the app closes the thread; failing for good reopens it
+    triage.mark_replied(CHANNEL_ID, 't1')
+    triage.on_reply_finished({'channel_id': CHANNEL_ID, 'parent_id': 't1'}, FAILED)
+    assert states(triage)['t1'] == OPEN
+    triage.on_reply_finished({'channel_id': CHANNEL_ID, 'parent_id': 't1'}, SENT)
+    assert states(triage)['t1'] == REPLIED
+
+    # A later sync that does not include the creator's reply does not reopen it
+    merge(triage, thread('t1', likes=2), thread('t3', likes=1))
+    assert states(triage)['t1'] == REPLIED and states(triage)['t3'] == REPLIED
+
+    assert triage.dismiss(CHANNEL_ID, ['t2', 't3']) == 1
+    assert triage.next(CHANNEL_ID) == []
+
+
+def test_recheck_dismisses_threads_youtube_no_longer_returns(triage):
+    merge(triage, thread('t1'), thread('t2'))
+    triage._conn().execute('UPDATE comment_triage SET checked_at = 0')
+    triage._conn().commit()
+
+    class Sync:
+        def refresh_threads(self, youtube, channel_id, thread_ids):
+            self.listed = thread_ids
+            merge(triage, thread('t1', creator_replied=True))
+            return {'t1'}
+
+    sync = Sync()
+    assert triage.recheck(None, CHANNEL_ID, sync) == 2
+    assert sorted(sync.listed) == ['t1', 't2']
+    assert states(triage) == {'t1': REPLIED, 't2': DISMISSED}
+    # Both were just fetched, so neither is re-listed again yet
+    assert triage.recheck(None, CHANNEL_ID, sync) == 0
@@ -0,0 +1,57 @@
+from video_catalog import VideoStore, VideoCatalog, CATALOG_NEW_PAGES
+from pagination import UPLOADS_PAGE_SIZE
+from conftest import Call, timestamps
+
+CHANNEL_ID = 'UCtest'
+
+
+class FakeUploads:
+    """playlistItems().list and videos().list over in-memory uploads, newest first."""
+
+    def __init__(self):
+        self.uploads = []  # (video id, publishedAt), newest first
+
+    def upload(self, count):
+        times = timestamps(len(self.uploads), count)
+        self.uploads[:0] = [(f'video{len(self.uploads) + i}', times[i]) for i in reversed(range(count))]
+
+    def playlistItems(self):
+        return self
+
+    def videos(self):
+        return FakeVideos(dict(self.uploads))
+
+    def list(self, part, playlistId, maxResults, pageToken=None):
+        start = int(pageToken or 0)
+        response = {'items': [{'contentDetails': {'videoId': video_id}}
+                              for video_id, _ in self.uploads[start:start + maxResults]]}
+        if start + maxResults < len(self.uploads):
+            response['nextPageToken'] = str(start + maxResults)
+        return Call(response)
+
+
+class FakeVideos:
+    def __init__(self, published):
+        self.published = published
+
+    def list(self, part, id):
+        return Call({'items': [{'id': video_id, 'snippet': {'title': video_id, 'publishedAt': self.published[video_id]}}
+                               for video_id in id.split(',')]})
+
+
+def test_sync_resumes_a_walk_longer_than_catalog_new_pages(db_name):
+    store, youtube = VideoStore(db_name), FakeUploads()
+    catalog = VideoCatalog(store)
+    youtube.upload(10)
+    catalog.sync(youtube, CHANNEL_ID, 'UUtest')
+
+    youtube.upload(CATALOG_NEW_PAGES * UPLOADS_PAGE_SIZE + 30)
+    catalog.sync(youtube, CHANNEL_ID, 'UUtest')
+    assert store.count(CHANNEL_ID) == 10 + CATALOG_NEW_PAGES * UPLOADS_PAGE_SIZE
+
+    # Uploads published meanwhile shift the pages under the resumed walk
+    youtube.upload(3)
+    catalog.sync(youtube, CHANNEL_ID, 'UUtest')
+    catalog.sync(youtube, CHANNEL_ID, 'UUtest')
+    assert store.count(CHANNEL_ID) == len(youtube.uploads)
+    assert store.get_state(CHANNEL_ID)['resume_page_token'] is None
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+
+import numpy as np
+
+from db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds between scheduled channel statistics samples while a channel is being viewed
+TIMESERIES_SAMPLE_SECONDS = int(os.getenv('TIMESERIES_SAMPLE_SECONDS', 5 * 60))
+# Raw snapshots are kept this long after being rolled up
+TIMESERIES_RAW_RETENTION = int(os.getenv('TIMESERIES_RAW_RETENTION', 6 * 60 * 60))
+
+RESOLUTIONS = {'minute': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+# How long each rollup is kept; day rollups are kept forever
+RETENTION = {'minute': 2 * 24 * 60 * 60, 'hour': 90 * 24 * 60 * 60, 'day': None}
+
+CHANNEL_METRICS = ('subscribers', 'views', 'videos')
+VIDEO_METRICS = ('views', 'likes', 'comments')
+
+
+def last_per_bucket(codes, taken_at, resolution):
+    """Return (row indexes, bucket starts) of the last sample per (series, bucket).
+
+    Rows must be sorted by series code, then time; counters are cumulative, so
+    the last sample in a bucket is the bucket's value.
+    """
+    buckets = (taken_at // resolution).astype(np.int64) * resolution
+    last = np.ones(len(taken_at), dtype=bool)
+    last[:-1] = (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])
+    rows = np.flatnonzero(last)
+    return rows, buckets[rows]
+
+
+def pick_resolution(span):
+    """Finest resolution whose retention still covers a range of `span` seconds."""
+    for name in ('minute', 'hour'):
+        if span <= RETENTION[name]:
+            return name
+    return 'day'
+
+
+def series_history(taken_at, values, metrics):
+    """Columnar points plus per-interval deltas, hourly rates and a range summary."""
+    taken_at = np.asarray(taken_at, dtype=np.float64)
+    values = np.asarray(values, dtype=np.int64).reshape(len(taken_at), len(metrics))
+    deltas = np.diff(values, axis=0)
+    elapsed = np.diff(taken_at)
+    rates = deltas * 3600.0 / np.maximum(elapsed, 1)[:, None]
+
+    summary = {}
+    if len(taken_at):
+        change = values[-1] - values[0]
+        days = max((taken_at[-1] - taken_at[0]) / 86400.0, 1 / 86400.0)
+        for i, metric in enumerate(metrics):
+            summary[metric] = {
+                'first': int(values[0, i]),
+                'last': int(values[-1, i]),
+                'change': int(change[i]),
+                'ratePerDay': round(float(change[i] / days), 2) if len(taken_at) > 1 else 0.0
+            }
+
+    return {
+        'points': dict({'t': taken_at.astype(np.int64).tolist()},
+                       **{metric: values[:, i].tolist() for i, metric in enumerate(metrics)}),
+        'deltas': {metric: deltas[:, i].tolist() for i, metric in enumerate(metrics)},
+        'ratesPerHour': {metric: np.round(rates[:, i], 3).tolist() for i, metric in enumerate(metrics)},
+        'summary': summary
+    }
+
+
+class StatsHistory:
+    """Downsamples channel and video statistics snapshots into minute/hour/day rollups.
+
+    Raw snapshots are written by ChannelStore and VideoStore whenever
+    statistics are fetched; rollup() folds new ones into every resolution in
+    one vectorized pass, then prunes raw rows and expired rollups.
+    """
+
+    def __init__(self, channel_store, video_store, db_name='timeseries'):
+        self.channel_store = channel_store
+        self.video_store = video_store
+        self.db_name = db_name
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS rollups (
+                    series TEXT NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    taken_at REAL NOT NULL,
+                    v0 INTEGER,
+                    v1 INTEGER,
+                    v2 INTEGER,
+                    PRIMARY KEY (series, resolution, bucket)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_rollups_channel ON rollups (channel_id, resolution, bucket);
+                CREATE TABLE IF NOT EXISTS rollup_state (
+                    channel_id TEXT PRIMARY KEY,
+                    channel_through REAL NOT NULL DEFAULT 0,
+                    videos_through REAL NOT NULL DEFAULT 0
+                );
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def _rows(self, channel_id, series, taken_at, values):
+        """Rollup rows for every resolution from samples sorted by series, then time."""
+        codes = np.unique(series, return_inverse=True)[1] if len(series) else np.empty(0, dtype=np.int64)
+        rows = []
+        for resolution in RESOLUTIONS.values():
+            index, buckets = last_per_bucket(codes, taken_at, resolution)
+            rows.extend(zip(
+                (series[i] for i in index), [resolution] * len(index), buckets.tolist(), [channel_id] * len(index),
+                taken_at[index].tolist(), *(values[index, j].tolist() for j in range(values.shape[1]))
+            ))
+        return rows
+
+    def rollup(self, channel_id):
+        """Fold snapshots newer than the last rollup into every resolution; return rows written."""
+        conn = self._conn()
+        state = conn.execute('SELECT * FROM rollup_state WHERE channel_id = ?', (channel_id,)).fetchone()
+        channel_through = state['channel_through'] if state else 0
+        videos_through = state['videos_through'] if state else 0
+
+        rows = []
+        snapshots = self.channel_store.get_stats(channel_id, since=channel_through)
+        if snapshots:
+            taken_at = np.array([s['taken_at'] for s in snapshots], dtype=np.float64)
+            values = np.array([[s['subscriber_count'], s['view_count'], s['video_count']] for s in snapshots],
+                              dtype=np.int64)
+            rows.extend(self._rows(channel_id, [f'channel:{channel_id}'] * len(snapshots), taken_at, values))
+            channel_through = float(taken_at[-1])
+
+        snapshots = self.video_store.get_stats(channel_id, since=videos_through)
+        if snapshots:
+            series = np.array([f'video:{s["video_id"]}' for s in snapshots])
+            taken_at = np.array([s['taken_at'] for s in snapshots], dtype=np.float64)
+            values = np.array([[s['view_count'], s['like_count'], s['comment_count']] for s in snapshots],
+                              dtype=np.int64)
+            order = np.lexsort((taken_at, series))
+            rows.extend(self._rows(channel_id, series[order].tolist(), taken_at[order], values[order]))
+            videos_through = float(taken_at.max())
+
+        now = time.time()
+        with conn:
+            conn.executemany('''
+                INSERT INTO rollups (series, resolution, bucket, channel_id, taken_at, v0, v1, v2)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(series, resolution, bucket) DO UPDATE SET
+                    taken_at = excluded.taken_at, v0 = excluded.v0, v1 = excluded.v1, v2 = excluded.v2
+                WHERE excluded.taken_at >= rollups.taken_at
+            ''', rows)
+            conn.execute('''
+                INSERT INTO rollup_state (channel_id, channel_through, videos_through) VALUES (?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    channel_through = excluded.channel_through,
+                    videos_through = excluded.videos_through
+            ''', (channel_id, channel_through, videos_through))
+            for name, retention in RETENTION.items():
+                if retention is not None:
+                    conn.execute('DELETE FROM rollups WHERE channel_id = ? AND resolution = ? AND bucket < ?',
+                                 (channel_id, RESOLUTIONS[name], now - retention))
+
+        # Raw snapshots are only dropped once they are safely rolled up
+        self.channel_store.prune_stats(channel_id, min(now - TIMESERIES_RAW_RETENTION, channel_through))
+        self.video_store.prune_stats(channel_id, min(now - TIMESERIES_RAW_RETENTION, videos_through))
+        return len(rows)
+
+    def history(self, channel_id, series, start, end, resolution=None):
+        """Return a series' points in [start, end] with deltas and rates, at a fixed or automatic resolution."""
+        self.rollup(channel_id)
+        resolution = resolution or pick_resolution(end - start)
+        metrics = CHANNEL_METRICS if series.startswith('channel:') else VIDEO_METRICS
+        rows = self._conn().execute('''
+            SELECT taken_at, v0, v1, v2 FROM rollups
+            WHERE series = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+            ORDER BY bucket
+        ''', (series, RESOLUTIONS[resolution], start - RESOLUTIONS[resolution], end)).fetchall()
+
+        taken_at = np.array([row['taken_at'] for row in rows], dtype=np.float64)
+        values = np.array([[row['v0'], row['v1'], row['v2']] for row in rows], dtype=np.int64)
+        return dict({
+            'series': series,
+            'resolution': resolution,
+            'metrics': list(metrics),
+            'start': int(start),
+            'end': int(end)
+        }, **series_history(taken_at, values, metrics))
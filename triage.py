@@ -0,0 +1,203 @@
+import os
+import math
+import time
+import logging
+from datetime import datetime
+
+from db import get_connection
+from comment_sync import Comment, COMMENT_FIELDS
+from reply_queue import SENT, FAILED
+
+logger = logging.getLogger(__name__)
+
+# A comment's priority halves for every this many seconds since it was posted...
+COMMENT_HALF_LIFE = 2 * 24 * 60 * 60
+# ...and for every this many since its video was published
+VIDEO_HALF_LIFE = 14 * 24 * 60 * 60
+# Weight of log(comments the author has left on the channel) against log(likes)
+AUTHOR_HISTORY_WEIGHT = 0.5
+TRIAGE_MAX_RESULTS = 200
+# Open threads re-listed per sync, least recently fetched first: a sync only fetches threads
+# newer than the watermark, so likes and replies the creator posts on YouTube come from here
+TRIAGE_RECHECK_THREADS = int(os.getenv('TRIAGE_RECHECK_THREADS', 100))
+TRIAGE_RECHECK_SECONDS = 60 * 60  # Threads fetched more recently than this are not re-listed
+
+# Decay per second of both ages, in log space
+DECAY_RATE = math.log(2) / COMMENT_HALF_LIFE + math.log(2) / VIDEO_HALF_LIFE
+
+OPEN = 'open'  # Waiting for the creator
+REPLIED = 'replied'
+DISMISSED = 'dismissed'  # Skipped in the queue, or held or rejected in moderation
+OWN = 'own'  # Posted by the creator
+
+# /api/triage fields: a stored comment plus its thread state
+TRIAGE_FIELDS = {
+    **COMMENT_FIELDS,
+    'authorChannelId': 'author_channel_id',
+    'totalReplyCount': 'total_reply_count',
+    'priority': 'priority'
+}
+_COLUMNS = ', '.join(f'c.{column}' for column in Comment.__slots__)
+
+
+def timestamp(published_at):
+    return datetime.fromisoformat(published_at.replace('Z', '+00:00')).timestamp()
+
+
+def priority_key(likes, author_comments, published_at, video_published_at):
+    """Sort key for a thread: log(likes) and log(author history), minus both ages' decay, up to a constant.
+
+    Decay is exponential, so in log space it subtracts DECAY_RATE * now from
+    every thread alike; leaving that out gives a key that never has to be
+    recomputed as time passes. current_priority() adds it back.
+    """
+    return (math.log1p(max(likes or 0, 0)) + AUTHOR_HISTORY_WEIGHT * math.log1p(author_comments)
+            + math.log(2) * (timestamp(published_at) / COMMENT_HALF_LIFE
+                             + timestamp(video_published_at) / VIDEO_HALF_LIFE))
+
+
+def current_priority(key, now=None):
+    """The priority of a thread with `key` right now: log(likes) + ... - decay; higher goes first."""
+    return key - DECAY_RATE * (now if now is not None else time.time())
+
+
+class TriageQueue:
+    """Reply state and priority of every comment thread, for "next comments to answer".
+
+    Lives next to the comment store and is updated from each merge. Open
+    threads are in a partial index ordered by a time-independent priority key,
+    so the next N to answer are an index range scan, however many are stored.
+    """
+
+    def __init__(self, store, video_store):
+        self.store = store
+        self.video_store = video_store
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.store.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS comment_triage (
+                    comment_id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    author_channel_id TEXT,
+                    total_reply_count INTEGER NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    priority REAL NOT NULL DEFAULT 0,
+                    checked_at REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_triage_open
+                    ON comment_triage (channel_id, priority) WHERE state = 'open';
+                CREATE INDEX IF NOT EXISTS idx_triage_open_video
+                    ON comment_triage (channel_id, video_id, priority) WHERE state = 'open';
+                CREATE INDEX IF NOT EXISTS idx_triage_open_checked
+                    ON comment_triage (channel_id, checked_at) WHERE state = 'open';
+                CREATE INDEX IF NOT EXISTS idx_triage_author ON comment_triage (channel_id, author_channel_id);
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def update(self, channel_id, comments):
+        """comment_store listener: upsert the state and priority of merged threads.
+
+        A thread leaves OPEN once the creator's reply shows up; a sync never
+        reopens one that was answered or dismissed here.
+        """
+        if not comments:
+            return
+        video_published = self.video_store.published_at(channel_id, list({c['videoId'] for c in comments}))
+        conn = self._conn()
+        with conn:
+            now = time.time()
+            conn.executemany('''
+                INSERT INTO comment_triage (comment_id, channel_id, video_id, author_channel_id,
+                                            total_reply_count, state, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(comment_id) DO UPDATE SET
+                    total_reply_count = excluded.total_reply_count,
+                    state = CASE WHEN comment_triage.state = 'open' THEN excluded.state ELSE comment_triage.state END,
+                    checked_at = excluded.checked_at
+            ''', [(
+                c['id'], channel_id, c['videoId'], c.get('authorChannelId'), c.get('totalReplyCount') or 0,
+                OWN if c.get('authorChannelId') == channel_id else REPLIED if c.get('creatorReplied') else OPEN, now
+            ) for c in comments])
+
+            # Counted after the upsert, so a first-time author's history includes this comment
+            authors = list({c['authorChannelId'] for c in comments if c.get('authorChannelId')})
+            history = dict(conn.execute(f'''
+                SELECT author_channel_id, COUNT(*) FROM comment_triage
+                WHERE channel_id = ? AND author_channel_id IN ({','.join('?' * len(authors))})
+                GROUP BY author_channel_id
+            ''', (channel_id, *authors)).fetchall()) if authors else {}
+
+            # A video not in the catalog yet counts as published with the comment
+            conn.executemany('UPDATE comment_triage SET priority = ? WHERE comment_id = ?', [(
+                priority_key(c['likeCount'], history.get(c.get('authorChannelId'), 0), c['publishedAt'],
+                             video_published.get(c['videoId']) or c['publishedAt']),
+                c['id']
+            ) for c in comments])
+
+    def recheck(self, youtube, channel_id, sync, limit=TRIAGE_RECHECK_THREADS):
+        """Re-list the open threads fetched longest ago through sync.refresh_threads(); return how many.
+
+        Merging them updates their likes and priority, and closes those the
+        creator has since answered on YouTube. Threads YouTube no longer
+        returns (deleted, or held for review) are dismissed.
+        """
+        thread_ids = [row['comment_id'] for row in self._conn().execute('''
+            SELECT comment_id FROM comment_triage
+            WHERE channel_id = ? AND state = 'open' AND checked_at < ?
+            ORDER BY checked_at LIMIT ?
+        ''', (channel_id, time.time() - TRIAGE_RECHECK_SECONDS, limit)).fetchall()]
+        if not thread_ids:
+            return 0
+        found = sync.refresh_threads(youtube, channel_id, thread_ids)
+        self.dismiss(channel_id, [thread_id for thread_id in thread_ids if thread_id not in found])
+        return len(thread_ids)
+
+    def next(self, channel_id, limit=20, video_id=None):
+        """The `limit` open threads to answer first, highest priority first, as dicts of TRIAGE_FIELDS keys."""
+        query = f'''
+            SELECT {_COLUMNS}, t.author_channel_id, t.total_reply_count, t.priority
+            FROM comment_triage t JOIN comments c ON c.id = t.comment_id
+            WHERE t.channel_id = ? AND t.state = 'open'
+        '''
+        params = [channel_id]
+        if video_id:
+            query += ' AND t.video_id = ?'
+            params.append(video_id)
+        query += ' ORDER BY t.priority DESC LIMIT ?'
+        rows = self._conn().execute(query, params + [limit]).fetchall()
+
+        now = time.time()
+        threads = [dict(row) for row in rows]
+        for thread in threads:
+            thread['priority'] = round(current_priority(thread['priority'], now), 3)
+        return threads
+
+    def _transition(self, channel_id, comment_ids, from_state, to_state):
+        if not comment_ids:
+            return 0
+        conn = self._conn()
+        with conn:
+            return conn.execute(f'''
+                UPDATE comment_triage SET state = ?
+                WHERE channel_id = ? AND state = ? AND comment_id IN ({','.join('?' * len(comment_ids))})
+            ''', (to_state, channel_id, from_state, *comment_ids)).rowcount
+
+    def mark_replied(self, channel_id, comment_id):
+        """The creator answered (or queued an answer to) a thread."""
+        return self._transition(channel_id, [comment_id], OPEN, REPLIED)
+
+    def dismiss(self, channel_id, comment_ids):
+        """Take open threads out of the queue without answering them; return how many were."""
+        return self._transition(channel_id, comment_ids, OPEN, DISMISSED)
+
+    def on_reply_finished(self, row, status):
+        """reply_queue listener: a reply that could not be sent puts its thread back in the queue."""
+        if status == FAILED:
+            self._transition(row['channel_id'], [row['parent_id']], REPLIED, OPEN)
+        elif status == SENT:
+            self.mark_replied(row['channel_id'], row['parent_id'])
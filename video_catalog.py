@@ -0,0 +1,299 @@
+import os
+import time
+import logging
+from datetime import datetime
+
+from db import get_connection
+from pagination import video_summary, UPLOADS_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+CATALOG_NEW_PAGES = 4  # Pages of new uploads to pull per sync before giving up on finding a known one
+CATALOG_BACKFILL_PAGES = int(os.getenv('CATALOG_BACKFILL_PAGES', 2))  # Pages of older uploads per sync
+CATALOG_RECENT_STATS = 50  # Newest videos whose statistics are refreshed on every sync
+CATALOG_ROTATING_STATS = 50  # Older videos refreshed per sync, least recently refreshed first
+
+# Fields of a catalog video, selectable with /api/videos?fields=
+VIDEO_FIELDS = {name: name for name in (
+    'id', 'title', 'description', 'thumbnail', 'publishedAt', 'viewCount', 'likeCount', 'commentCount'
+)}
+
+
+class VideoStore:
+    """Persisted per-channel video catalog plus the uploads playlist sync state."""
+
+    def __init__(self, db_name='videos'):
+        self.db_name = db_name
+        self._initialized = set()
+
+    def _conn(self):
+        conn = get_connection(self.db_name)
+        if id(conn) not in self._initialized:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS videos (
+                    id TEXT PRIMARY KEY,
+                    channel_id TEXT NOT NULL,
+                    title TEXT,
+                    description TEXT,
+                    thumbnail TEXT,
+                    published_at TEXT,
+                    view_count INTEGER,
+                    like_count INTEGER,
+                    comment_count INTEGER,
+                    stats_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_videos_channel_published ON videos (channel_id, published_at);
+                CREATE INDEX IF NOT EXISTS idx_videos_channel_stats ON videos (channel_id, stats_at);
+                CREATE TABLE IF NOT EXISTS video_stats (
+                    video_id TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    taken_at REAL NOT NULL,
+                    view_count INTEGER,
+                    like_count INTEGER,
+                    comment_count INTEGER,
+                    PRIMARY KEY (video_id, taken_at)
+                );
+                CREATE INDEX IF NOT EXISTS idx_video_stats_channel_taken ON video_stats (channel_id, taken_at);
+                CREATE TABLE IF NOT EXISTS catalog_state (
+                    channel_id TEXT PRIMARY KEY,
+                    backfill_page_token TEXT,
+                    complete INTEGER NOT NULL DEFAULT 0,
+                    -- A walk for new uploads that stopped at CATALOG_NEW_PAGES: where to resume it, and
+                    -- the publishedAt of the newest upload known when it began, which it walks down to
+                    resume_page_token TEXT,
+                    resume_known_at TEXT,
+                    synced_at TEXT
+                );
+            ''')
+            self._initialized.add(id(conn))
+        return conn
+
+    def get_state(self, channel_id):
+        row = self._conn().execute(
+            'SELECT * FROM catalog_state WHERE channel_id = ?', (channel_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def set_state(self, channel_id, backfill_page_token, complete, resume_page_token=None, resume_known_at=None):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO catalog_state (channel_id, backfill_page_token, complete, resume_page_token,
+                                           resume_known_at, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    backfill_page_token = excluded.backfill_page_token,
+                    complete = excluded.complete,
+                    resume_page_token = excluded.resume_page_token,
+                    resume_known_at = excluded.resume_known_at,
+                    synced_at = excluded.synced_at
+            ''', (channel_id, backfill_page_token, int(complete), resume_page_token, resume_known_at,
+                  datetime.utcnow().isoformat()))
+
+    def known_ids(self, channel_id, video_ids):
+        if not video_ids:
+            return set()
+        placeholders = ','.join('?' * len(video_ids))
+        rows = self._conn().execute(
+            f'SELECT id FROM videos WHERE channel_id = ? AND id IN ({placeholders})', (channel_id, *video_ids)
+        ).fetchall()
+        return {row['id'] for row in rows}
+
+    def published_at(self, channel_id, video_ids):
+        """publishedAt of each of video_ids that is in the catalog."""
+        if not video_ids:
+            return {}
+        placeholders = ','.join('?' * len(video_ids))
+        rows = self._conn().execute(
+            f'SELECT id, published_at FROM videos WHERE channel_id = ? AND id IN ({placeholders})',
+            (channel_id, *video_ids)
+        ).fetchall()
+        return {row['id']: row['published_at'] for row in rows}
+
+    def newest_published_at(self, channel_id):
+        """publishedAt of the channel's newest cataloged video, or None."""
+        return self._conn().execute(
+            'SELECT MAX(published_at) FROM videos WHERE channel_id = ?', (channel_id,)
+        ).fetchone()[0]
+
+    def stats_due(self, channel_id, recent, rotating):
+        """IDs whose statistics to refresh: the newest `recent` plus the `rotating` stalest older ones."""
+        conn = self._conn()
+        newest = [row['id'] for row in conn.execute(
+            'SELECT id FROM videos WHERE channel_id = ? ORDER BY published_at DESC LIMIT ?', (channel_id, recent)
+        ).fetchall()]
+        stalest = [row['id'] for row in conn.execute('''
+            SELECT id FROM videos WHERE channel_id = ?
+            ORDER BY stats_at LIMIT ?
+        ''', (channel_id, rotating + recent)).fetchall() if row['id'] not in newest]
+        return newest + stalest[:rotating]
+
+    def upsert(self, channel_id, videos):
+        """Bulk upsert videos and append a statistics snapshot for each."""
+        if not videos:
+            return
+        taken_at = time.time()
+        now = datetime.utcnow().isoformat()
+        conn = self._conn()
+        with conn:
+            conn.executemany('''
+                INSERT INTO videos (id, channel_id, title, description, thumbnail, published_at,
+                                    view_count, like_count, comment_count, stats_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title,
+                    description = excluded.description,
+                    thumbnail = excluded.thumbnail,
+                    view_count = excluded.view_count,
+                    like_count = excluded.like_count,
+                    comment_count = excluded.comment_count,
+                    stats_at = excluded.stats_at
+            ''', [(
+                video['id'], channel_id, video['title'], video['description'], video['thumbnail'],
+                video['publishedAt'], video['viewCount'], video['likeCount'], video['commentCount'], now
+            ) for video in videos])
+            conn.executemany('''
+                INSERT OR IGNORE INTO video_stats (video_id, channel_id, taken_at, view_count, like_count, comment_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(
+                video['id'], channel_id, taken_at, video['viewCount'], video['likeCount'], video['commentCount']
+            ) for video in videos])
+
+    def delete(self, channel_id, video_ids):
+        if not video_ids:
+            return
+        placeholders = ','.join('?' * len(video_ids))
+        conn = self._conn()
+        with conn:
+            conn.execute(f'DELETE FROM videos WHERE channel_id = ? AND id IN ({placeholders})',
+                         (channel_id, *video_ids))
+
+    def get_videos(self, channel_id, limit=50, offset=0):
+        """Return the channel's videos, newest first."""
+        rows = self._conn().execute('''
+            SELECT * FROM videos WHERE channel_id = ? ORDER BY published_at DESC LIMIT ? OFFSET ?
+        ''', (channel_id, limit, offset)).fetchall()
+        return [{
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'thumbnail': row['thumbnail'],
+            'publishedAt': row['published_at'],
+            'viewCount': row['view_count'],
+            'likeCount': row['like_count'],
+            'commentCount': row['comment_count']
+        } for row in rows]
+
+    def get_stats(self, channel_id, since=0):
+        """Per-video statistics snapshots taken after `since` (epoch seconds), oldest first."""
+        rows = self._conn().execute('''
+            SELECT video_id, taken_at, view_count, like_count, comment_count FROM video_stats
+            WHERE channel_id = ? AND taken_at > ? ORDER BY taken_at
+        ''', (channel_id, since)).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune_stats(self, channel_id, before):
+        """Drop snapshots taken before `before`, once they have been rolled up."""
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM video_stats WHERE channel_id = ? AND taken_at < ?', (channel_id, before))
+
+    def synced_at(self, channel_id):
+        state = self.get_state(channel_id)
+        return state['synced_at'] if state else None
+
+    def count(self, channel_id):
+        return self._conn().execute(
+            'SELECT COUNT(*) FROM videos WHERE channel_id = ?', (channel_id,)
+        ).fetchone()[0]
+
+
+class VideoCatalog:
+    """Keeps a channel's video catalog current from the uploads playlist.
+
+    search().list costs 100 units per call; this walks playlistItems (1 unit
+    per 50 uploads) only until it reaches a known upload, backfills older
+    history a few pages per sync, and refreshes statistics 50 videos per call.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _list_uploads(self, youtube, playlist_id, page_token=None):
+        params = {'part': 'contentDetails', 'playlistId': playlist_id, 'maxResults': UPLOADS_PAGE_SIZE}
+        if page_token:
+            params['pageToken'] = page_token
+        return youtube.playlistItems().list(**params).execute()
+
+    def _fetch_videos(self, youtube, video_ids):
+        """Return {id: summary} for video_ids, 50 per videos().list call."""
+        found = {}
+        for start in range(0, len(video_ids), UPLOADS_PAGE_SIZE):
+            chunk = video_ids[start:start + UPLOADS_PAGE_SIZE]
+            response = youtube.videos().list(part='snippet,statistics', id=','.join(chunk)).execute()
+            for item in response.get('items', []):
+                found[item['id']] = video_summary(item)
+        return found
+
+    def sync(self, youtube, channel_id, playlist_id):
+        """Pull new uploads, some older history and current statistics; return the number of calls made.
+
+        A walk for new uploads that runs out of CATALOG_NEW_PAGES is resumed
+        from its page token by the next sync, so uploads past its last page
+        are not skipped.
+        """
+        state = self.store.get_state(channel_id)
+        backfill_token = state['backfill_page_token'] if state else None
+        complete = bool(state['complete']) if state else False
+        page_token = state['resume_page_token'] if state else None
+        known_at = state['resume_known_at'] if page_token else self.store.newest_published_at(channel_id)
+        calls = 0
+
+        new_ids = []
+        for _ in range(CATALOG_NEW_PAGES):
+            response = self._list_uploads(youtube, playlist_id, page_token)
+            calls += 1
+            page_ids = [item['contentDetails']['videoId'] for item in response.get('items', [])]
+            known = self.store.published_at(channel_id, page_ids)
+            new_ids.extend(video_id for video_id in page_ids if video_id not in known)
+            page_token = response.get('nextPageToken')
+
+            if state is None:
+                # First sync: older uploads are backfilled over the following syncs
+                backfill_token = page_token
+                complete = page_token is None
+                page_token = None
+                break
+            # Uploads are newest first, so one known before this walk began means the rest are known too;
+            # uploads it stored itself can reappear when new ones shift the pages
+            if not page_token or known_at and any((published or '') <= known_at for published in known.values()):
+                page_token = None
+                break
+
+        for _ in range(CATALOG_BACKFILL_PAGES if state and not complete else 0):
+            if not backfill_token:
+                complete = True
+                break
+            response = self._list_uploads(youtube, playlist_id, backfill_token)
+            calls += 1
+            new_ids.extend(item['contentDetails']['videoId'] for item in response.get('items', []))
+            backfill_token = response.get('nextPageToken')
+            complete = backfill_token is None
+
+        due = self.store.stats_due(channel_id, CATALOG_RECENT_STATS, CATALOG_ROTATING_STATS)
+        video_ids = list(dict.fromkeys(new_ids + due))
+        found = self._fetch_videos(youtube, video_ids)
+        calls += -(-len(video_ids) // UPLOADS_PAGE_SIZE)
+
+        self.store.upsert(channel_id, list(found.values()))
+        # Deleted or made private since we last saw them
+        self.store.delete(channel_id, [video_id for video_id in due if video_id not in found])
+        self.store.set_state(channel_id, backfill_token, complete, page_token, known_at if page_token else None)
+
+        logger.info(f'Synced video catalog for channel {channel_id}: {len(new_ids)} new uploads, '
+                    f'{len(found)} videos refreshed in {calls} calls')
+        return calls
+
+
+video_store = VideoStore()
+video_catalog = VideoCatalog(video_store)
@@ -0,0 +1,274 @@
+import os
+import time
+import hashlib
+import urllib.parse
+import threading
+import logging
+from contextlib import contextmanager
+
+import httplib2
+import google_auth_httplib2
+from googleapiclient.discovery import build, Resource
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, BatchHttpRequest
+
+logger = logging.getLogger(__name__)
+
+# Point the client at a different host (e.g. a local stub) by setting
+# YOUTUBE_API_ENDPOINT=http://127.0.0.1:8085/
+API_ENDPOINT = os.getenv('YOUTUBE_API_ENDPOINT')
+DEFAULT_ROOT_URL = 'https://youtube.googleapis.com/'
+HTTP_TIMEOUT = int(os.getenv('YOUTUBE_HTTP_TIMEOUT', 30))
+# How long a list response is kept for revalidation with If-None-Match
+ETAG_CACHE_TTL = int(os.getenv('ETAG_CACHE_TTL', 24 * 60 * 60))
+# Idle keep-alive transports kept per worker; more are opened while requests are in flight
+TRANSPORT_POOL_SIZE = int(os.getenv('YOUTUBE_TRANSPORT_POOL_SIZE', 64))
+
+
+class ClientPool:
+    """Builds the discovery-based YouTube service once per worker process.
+
+    The service object is only used to construct requests; every request is
+    executed on a keep-alive transport checked out of an idle pool and
+    authorized with the caller's credentials, so binding a user costs a small
+    wrapper instead of a build(). Checking transports out rather than keeping
+    one per thread lets greenlet workers hold hundreds of calls in flight
+    while reusing connections across requests.
+    """
+
+    def __init__(self, api_endpoint=None, transport_pool_size=TRANSPORT_POOL_SIZE):
+        self.api_endpoint = api_endpoint
+        self.transport_pool_size = transport_pool_size
+        self._service = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._idle = []
+        self._listeners = []
+        self._etag_cache = None
+        self._etag_ttl = ETAG_CACHE_TTL
+        self.not_modified = 0  # list calls answered with a 304
+        self.modified = 0  # list calls that returned a new ETag and body
+
+    def use_etag_cache(self, cache, ttl=ETAG_CACHE_TTL):
+        """Keep list responses with their ETags in cache and revalidate them with If-None-Match."""
+        self._etag_cache = cache
+        self._etag_ttl = ttl
+
+    def etag_key(self, request):
+        """Cache key for a revalidatable request, or None."""
+        channel_id = request.owner.channel_id
+        # Responses differ per user (mine=True, private videos), so only cache attributed calls
+        if self._etag_cache is None or not channel_id or request.request.method != 'GET' \
+                or not (request.methodId or '').endswith('.list'):
+            return None
+        return f'etag:{channel_id}:{hashlib.sha1(request.request.uri.encode()).hexdigest()}'
+
+    def get_etag_entry(self, key):
+        return self._etag_cache.get(key) if key else None
+
+    def set_etag_entry(self, key, etag, body):
+        self.modified += 1
+        self._etag_cache.set(key, {'etag': etag, 'body': body}, ttl=self._etag_ttl)
+
+    def etag_stats(self):
+        return {'notModified': self.not_modified, 'modified': self.modified}
+
+    def add_listener(self, listener):
+        """Call listener(request, elapsed_seconds, error) after every executed request."""
+        self._listeners.append(listener)
+
+    def notify(self, request, elapsed, error):
+        for listener in self._listeners:
+            try:
+                listener(request, elapsed, error)
+            except Exception as e:
+                logger.warning(f'Request listener failed: {str(e)}')
+
+    def service(self):
+        """Return the shared service, building it on first use in this process."""
+        # Rebuild after a fork so workers never share sockets with the master
+        if self._service is None or self._pid != os.getpid():
+            with self._lock:
+                if self._service is None or self._pid != os.getpid():
+                    client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+                    self._service = build(
+                        'youtube', 'v3',
+                        http=httplib2.Http(timeout=HTTP_TIMEOUT),
+                        client_options=client_options,
+                        cache_discovery=False,
+                        static_discovery=True
+                    )
+                    self._pid = os.getpid()
+                    self._idle = []
+                    logger.info(f'Built YouTube service for worker {self._pid}')
+        return self._service
+
+    def checkout(self):
+        """Take an idle keep-alive transport, or open a new one (httplib2 is not thread-safe)."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return httplib2.Http(timeout=HTTP_TIMEOUT)
+
+    def checkin(self, http):
+        with self._lock:
+            # Most recently used first, so the sockets kept warm are the ones in use
+            if len(self._idle) < self.transport_pool_size:
+                self._idle.append(http)
+
+    @contextmanager
+    def authorized_http(self, credentials):
+        """Check out a transport authorized with credentials for the duration of one call."""
+        http = self.checkout()
+        try:
+            yield google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+        finally:
+            self.checkin(http)
+
+    def batch_uri(self):
+        """Batch endpoint, following the API endpoint override like normal requests do."""
+        return urllib.parse.urljoin(self.api_endpoint or DEFAULT_ROOT_URL, 'batch')
+
+    def client(self, credentials, channel_id=None):
+        """Return a YouTube client bound to the given credentials."""
+        return BoundResource(self.service(), self, credentials, channel_id)
+
+
+class BoundResource:
+    """Proxy around a shared Resource that binds requests to one user's credentials."""
+
+    def __init__(self, resource, pool, credentials, channel_id=None):
+        self._resource = resource
+        self._pool = pool
+        self.credentials = credentials
+        self.channel_id = channel_id  # Who upstream calls are attributed to
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if isinstance(result, HttpRequest):
+                return BoundRequest(result, self)
+            if isinstance(result, BatchHttpRequest):
+                return BoundBatch(result, self)
+            if isinstance(result, Resource):
+                return BoundResource(result, self._pool, self.credentials, self.channel_id)
+            return result
+        return method
+
+    def new_batch_http_request(self, callback=None):
+        batch = BatchHttpRequest(callback=callback, batch_uri=self._pool.batch_uri())
+        return BoundBatch(batch, self)
+
+    def http(self):
+        return self._pool.authorized_http(self.credentials)
+
+    def notify(self, request, elapsed, error):
+        self._pool.notify(request, elapsed, error)
+
+
+class BoundRequest:
+    """An HttpRequest that executes on the owning user's authorized transport."""
+
+    not_modified = False  # Answered from the ETag cache after a 304
+
+    def __init__(self, request, owner):
+        self.request = request
+        self.owner = owner
+
+    @property
+    def methodId(self):
+        return self.request.methodId
+
+    def execute(self, num_retries=0):
+        pool = self.owner._pool
+        key = pool.etag_key(self)
+        cached = pool.get_etag_entry(key)
+        if cached is not None:
+            self.request.headers['If-None-Match'] = cached['etag']
+        etag = self._capture_etag() if key is not None else None
+
+        start = time.perf_counter()
+        error = None
+        try:
+            with self.owner.http() as http:
+                body = self.request.execute(http=http, num_retries=num_retries)
+        except HttpError as e:
+            # Unchanged since we last fetched it; googleapiclient raises on any 3xx
+            if cached is not None and e.resp.status == 304:
+                pool.not_modified += 1
+                self.not_modified = True
+                return cached['body']
+            error = e
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.owner.notify(self, time.perf_counter() - start, error)
+
+        if key is not None:
+            etag_value = etag.get('etag') or (body.get('etag') if isinstance(body, dict) else None)
+            if etag_value:
+                pool.set_etag_entry(key, etag_value, body)
+        return body
+
+    def _capture_etag(self):
+        """Record the response ETag header, which the parsed body does not expose."""
+        captured = {}
+        postproc = self.request.postproc
+
+        def capture(resp, content):
+            captured['etag'] = resp.get('etag')
+            return postproc(resp, content)
+        self.request.postproc = capture
+        return captured
+
+
+class BoundBatch:
+    """A BatchHttpRequest that executes on the owning user's authorized transport."""
+
+    def __init__(self, batch, owner):
+        self.batch = batch
+        self.owner = owner
+        self.requests = []
+        self.errors = {}  # id(request) -> the exception its part of the batch returned
+
+    def add(self, request, callback=None, request_id=None):
+        if not isinstance(request, BoundRequest):
+            request = BoundRequest(request, self.owner)
+        self.requests.append(request)
+        self.batch.add(request.request, callback=self._record(request, callback), request_id=request_id)
+
+    def _record(self, request, callback):
+        def record(request_id, response, exception):
+            self.errors[id(request)] = exception
+            if callback is not None:
+                callback(request_id, response, exception)
+        return record
+
+    def execute(self):
+        start = time.perf_counter()
+        error = None
+        try:
+            with self.owner.http() as http:
+                self.batch.execute(http=http)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Each batched call still costs its own quota, unless it failed on its own
+            elapsed = time.perf_counter() - start
+            for request in self.requests:
+                self.owner.notify(request, elapsed, error or self.errors.get(id(request)))
+
+
+pool = ClientPool(api_endpoint=API_ENDPOINT)
+
+
+def get_client(credentials, channel_id=None):
+    """Return a pooled YouTube client for the given google.oauth2 credentials."""
+    return pool.client(credentials, channel_id)